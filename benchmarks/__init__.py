@@ -0,0 +1,5 @@
+"""
+benchmarks:
+This package contains the performance benchmarks of Wilddog. Every benchmark is a script that can be
+launched from the repository root, ex: python -m benchmarks.bench_rules
+"""
@@ -0,0 +1,72 @@
+from threading import Thread
+import argparse
+import time
+
+from modules.containers import Item
+from modules.queues import RqtQueue
+from modules.tools import Rqt
+
+
+"""
+bench_coalesce.py:
+This benchmark floods RqtQueue with repeated last-writer-wins Requests (update_time ticks and set_status of a few
+plugs) while a consumer executes them with a fixed cost, like the FSM. It reports executed Requests, coalesced
+ones and the age of the executed value, with and without coalescing keys
+
+python -m benchmarks.bench_coalesce --requests 20000 --execute-us 50
+"""
+
+
+COALESCE = {"update_time": "target", "set_status": "target_payload"}
+
+
+#----------------------------------------------------------------------------------------------
+def run(coalesce, n_requests, n_targets, execute_s):
+    """ ... """
+    queue = RqtQueue(capacity = n_requests, coalesce = coalesce)
+    sender, system = Item(), Item()
+    sender.wid, system.wid = "sensor", "wilddog"
+    targets = []
+    for iindex in range(n_targets):
+        targets.append(Item())
+        targets[-1].wid = f"plug_{iindex}"
+
+    def produce():
+        for iindex in range(n_requests):
+            if iindex % 2 == 0: queue.put(Rqt(sender = sender, target = system, command = "update_time", payload = {"value": time.perf_counter()}))
+            else: queue.put(Rqt(sender = sender, target = targets[iindex % n_targets], command = "set_status", payload = {"onoff": "ON" if iindex % 4 == 1 else "OFF", "time": time.perf_counter()}))
+
+    executed = 0
+    ages = []
+    time_start = time.perf_counter()
+    producer = Thread(target = produce)
+    producer.start()
+    while producer.is_alive() or len(queue) > 0:
+        rqt_temp = queue.get()
+        if rqt_temp == None:
+            time.sleep(0.0001)
+            continue
+        executed += 1
+        ages.append(time.perf_counter() - rqt_temp.payload.get("value", rqt_temp.payload.get("time")))
+        time_end = time.perf_counter() + execute_s # execution cost
+        while time.perf_counter() < time_end: pass
+    producer.join()
+    return {"executed": executed, "coalesced": queue.get_stats()["coalesced"], "time_s": time.perf_counter() - time_start, "age_ms": sum(ages) / max(1, len(ages)) * 1e3}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "RqtQueue with and without coalescing keys")
+    parser.add_argument("--requests", type = int, default = 20000)
+    parser.add_argument("--targets", type = int, default = 4)
+    parser.add_argument("--execute-us", type = float, default = 50, help = "execution cost of a Request in microseconds")
+    args = parser.parse_args()
+
+    print(f"\n----- COALESCE : {args.requests} requests, {args.targets} plugs, execution {args.execute_us:.0f} us -----")
+    print(f"{'':<14}{'executed':>10}{'coalesced':>11}{'drain s':>9}{'value age ms':>14}")
+    for iname, icoalesce in (("no coalescing", {}), ("coalescing", COALESCE)):
+        result = run(icoalesce, args.requests, args.targets, args.execute_us / 1e6)
+        print(f"{iname:<14}{result['executed']:>10}{result['coalesced']:>11}{result['time_s']:>9.2f}{result['age_ms']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
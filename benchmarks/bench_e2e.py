@@ -0,0 +1,182 @@
+from contextlib import redirect_stdout
+from queue import Queue, Empty
+from threading import Thread
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from modules import SystemWilddog
+
+from .fleet import write_fleet
+from .loopback import NodeLoopback
+
+
+"""
+bench_e2e.py:
+This benchmark runs WD end to end, offline: a synthetic fleet is written in the yaml schema, WD loads it from
+StateStart and a NodeLoopback replaces NodeMQTT. Button presses (zigbee2mqtt payloads) are fed to set_msg,
+Rules turn the paired plug on/off and the plug answers with its state report. It reports presses/sec,
+messages/sec, p50/p99 latency from button message to plug "set" message, queue depth and RSS
+
+python -m benchmarks.bench_e2e --elements 200 --rules 200 --groups 20 --duration 5
+python -m benchmarks.bench_e2e --matrix 100x100x10,1000x1000x100 --duration 5
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class Driver():
+    """
+    Driver presses buttons of pairs (button, plug) in closed loop: a pair is pressed again only when its
+    plug has been switched, at most concurrency pairs are in flight
+
+    pending: dict plug sid -> (button sid, press time)
+    latencies: press -> plug "set" latencies in seconds
+    """
+
+    def __init__(self, node, pairs, concurrency):
+        """ ... """
+        self.node = node
+        self.pairs = pairs[:max(1, concurrency)]
+        self.free = Queue()
+        self.pending = {}
+        self.onoff = {}
+        self.latencies = []
+        self.presses = 0
+        for ipair in self.pairs: self.free.put(ipair)
+        node.on_send = self._on_send
+
+    def run(self, duration):
+        """ press buttons for duration seconds """
+        time_end = time.perf_counter() + duration
+        while time.perf_counter() < time_end:
+            try: button, plug = self.free.get(timeout = 0.1)
+            except Empty: continue
+            event = "double" if self.onoff.get(plug) == "ON" else "single"
+            self.pending[plug] = (button, time.perf_counter())
+            self.presses += 1
+            self.node.feed(button, {"action": event, "battery": 100, "linkquality": 87, "voltage": 3000, "device_temperature": 24})
+
+    def _on_send(self, time_sent, sid, msg_type, msg):
+        """ a plug has been switched, its pair is free again """
+        if msg_type != "set" or sid not in self.pending: return
+        button, time_pressed = self.pending.pop(sid)
+        self.latencies.append(time_sent - time_pressed)
+        self.onoff[sid] = msg.get("state")
+        self.free.put((button, sid))
+
+
+#----------------------------------------------------------------------------------------------
+def get_rss():
+    """ current resident memory in MB (peak if /proc is not available) """
+    try:
+        with open("/proc/self/status") as status_file:
+            for iline in status_file:
+                if iline.startswith("VmRSS:"): return int(iline.split()[1]) / 1024
+    except OSError: pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, ratio):
+    """ ... """
+    if len(values) == 0: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def run(n_elements, n_rules, n_groups, duration, concurrency, runtime, metrics = True):
+    """ one benchmark run, results are sent back as a dict """
+    with tempfile.TemporaryDirectory(prefix = "wilddog_bench_") as path, open(os.devnull, "w") as devnull, redirect_stdout(devnull): # Rqt.show() and INFO messages are not displayed
+        pairs = write_fleet(path, n_elements, n_rules, n_groups)
+        wd = SystemWilddog()
+        wd.config.data_path = os.path.join(path, "data")
+        wd.boxes["nodes"].item_class_collection = wd.boxes["nodes"].item_class_collection + [NodeLoopback]
+        time_start = time.perf_counter()
+        Thread(target = wd.run, kwargs = {"runtime": runtime}, daemon = True).start()
+        while wd.status.get("state") != "run":
+            time.sleep(0.01)
+            if time.perf_counter() - time_start > 60: raise RuntimeError("WD did not reach state run")
+        time_setup = time.perf_counter() - time_start
+
+        wd.metrics.enabled = metrics
+        node = wd.get_item("node_loopback", box = "nodes")
+        node.sent = None
+        driver = Driver(node, pairs, concurrency)
+        depths = []
+        sampling = [True]
+        def sample():
+            while sampling[0]:
+                depths.append(len(wd.rqt_buffer))
+                time.sleep(0.01)
+        sampler = Thread(target = sample, daemon = True)
+        sampler.start()
+        counters_start = dict(node.counters)
+        time_start = time.perf_counter()
+        driver.run(duration)
+        time_run = time.perf_counter() - time_start
+        sampling[0] = False
+        sampler.join()
+
+    latencies = driver.latencies
+    return {
+        "elements": n_elements, "rules": n_rules, "groups": n_groups, "runtime": runtime, "metrics": metrics,
+        "setup_s": time_setup,
+        "presses": driver.presses,
+        "presses_s": len(latencies) / time_run,
+        "msgs_s": (node.counters["ingress"] + node.counters["egress"] - counters_start["ingress"] - counters_start["egress"]) / time_run,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "lost": len(driver.pending),
+        "queue_max": max(depths) if len(depths) > 0 else 0,
+        "queue_avg": sum(depths) / len(depths) if len(depths) > 0 else 0,
+        "dropped": wd.rqt_buffer.get_stats()["dropped"],
+        "rss_mb": get_rss()
+    }
+
+
+def show(results):
+    """ ... """
+    print(f"\n{'elements':>8} {'rules':>6} {'groups':>6} {'setup s':>8} {'press/s':>9} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'queue max':>9} {'dropped':>7} {'lost':>5} {'RSS MB':>7}")
+    for iresult in results:
+        print(f"{iresult['elements']:>8} {iresult['rules']:>6} {iresult['groups']:>6} {iresult['setup_s']:>8.2f} {iresult['presses_s']:>9.0f} {iresult['msgs_s']:>9.0f} "
+            f"{iresult['p50_ms']:>8.2f} {iresult['p99_ms']:>8.2f} {iresult['queue_max']:>9} {iresult['dropped']:>7} {iresult['lost']:>5} {iresult['rss_mb']:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "End to end benchmark of WD with a loopback node")
+    parser.add_argument("--elements", type = int, default = 200)
+    parser.add_argument("--rules", type = int, default = 200)
+    parser.add_argument("--groups", type = int, default = 20)
+    parser.add_argument("--duration", type = float, default = 5)
+    parser.add_argument("--concurrency", type = int, default = 16, help = "max button presses in flight")
+    parser.add_argument("--runtime", default = "threads", choices = ["threads", "asyncio"])
+    parser.add_argument("--matrix", default = None, help = "list of ELEMENTSxRULESxGROUPS, every run in its own process")
+    parser.add_argument("--no-metrics", action = "store_true", help = "disable WD metrics, to measure their overhead")
+    parser.add_argument("--json", action = "store_true", help = "print results as json")
+    args = parser.parse_args()
+
+    if args.matrix == None:
+        result = run(args.elements, args.rules, args.groups, args.duration, args.concurrency, args.runtime, not args.no_metrics)
+        if args.json: print(json.dumps(result))
+        else: show([result])
+        return
+
+    results = []
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for iconfig in args.matrix.split(","):
+        n_elements, n_rules, n_groups = [int(ivalue) for ivalue in iconfig.lower().split("x")]
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_e2e", "--elements", str(n_elements), "--rules", str(n_rules), "--groups", str(n_groups),
+            "--duration", str(args.duration), "--concurrency", str(args.concurrency), "--runtime", args.runtime, "--json"] + (["--no-metrics"] if args.no_metrics else []),
+            cwd = root, capture_output = True, text = True, check = True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        show(results[-1:])
+    print("\n>> MATRIX")
+    show(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from threading import Thread
+import argparse
+import asyncio
+import time
+
+from modules.egress import Egress
+
+from .fake_channel import FakeChannel
+
+
+"""
+bench_egress.py:
+This benchmark replays an alarm burst (a get_status dump, alerts and informational replies queued by the FSM
+thread) against a FakeChannel with the Discord rate limit: legacy NodeDiscord loop (one message every 100 ms tick,
+list shared with pop(0)) and Egress (merged messages, alerts first, paced by the rate limit)
+
+python -m benchmarks.bench_egress --alerts 5 --replies 30 --per 5
+"""
+
+
+#----------------------------------------------------------------------------------------------
+def get_burst(n_alerts, n_replies):
+    """ list of (priority, message), in queuing order """
+    status = "".join(f"feature_{iindex}: value_{iindex}\n" for iindex in range(40)) # get_status reply
+    burst = [("normal", status)]
+    for iindex in range(max(n_alerts, n_replies)):
+        if iindex < n_replies: burst.append(("normal", f"INFO : reply {iindex} :white_check_mark:"))
+        if iindex < n_alerts: burst.append(("high", f"ALERT: intrution detected {iindex} :no_entry:"))
+    return burst
+
+
+async def legacy(channel, burst, timeout):
+    """ NodeDiscord.myloop before Egress, a 429 is retried like discord.py does. Nothing is dropped """
+    buffer = []
+    Thread(target = lambda: [buffer.append(imsg) for ipriority, imsg in burst], daemon = True).start()
+    time_end = time.perf_counter() + timeout
+    while len(channel.sent) < len(burst) and time.perf_counter() < time_end:
+        if len(buffer) > 0:
+            try:
+                await channel.send(buffer[0])
+                buffer.pop(0)
+            except Exception as error: await asyncio.sleep(error.retry_after)
+        await asyncio.sleep(0.1)
+    return 0
+
+
+async def egress(channel, burst, timeout):
+    """ Egress with its default capacity, number of dropped messages is sent back """
+    pipeline = Egress()
+    task = asyncio.get_running_loop().create_task(pipeline.run(channel))
+    await asyncio.sleep(0)
+    Thread(target = lambda: [pipeline.put(imsg, ipriority) for ipriority, imsg in burst], daemon = True).start()
+    time_end = time.perf_counter() + timeout
+    while time.perf_counter() < time_end:
+        await asyncio.sleep(0.01)
+        delivered = "\n".join(icontent for itime, icontent in channel.sent)
+        if sum(imsg in delivered for ipriority, imsg in burst) + pipeline.get_stats()["dropped"] >= len(burst): break
+    task.cancel()
+    return pipeline.get_stats()["dropped"]
+
+
+def measure(function, burst, args):
+    """ (seconds to deliver everything, seconds to deliver every alert, Discord messages, 429 answers, dropped messages) """
+    channel = FakeChannel(rate = args.rate, per = args.per, latency = args.latency)
+    time_start = time.perf_counter()
+    dropped = asyncio.run(function(channel, burst, args.timeout))
+    alerts = [imsg for ipriority, imsg in burst if ipriority == "high"]
+    time_alerts = max([min([itime for itime, icontent in channel.sent if ialert in icontent] or [float("inf")]) for ialert in alerts] or [time_start]) - time_start
+    time_all = (channel.sent[-1][0] - time_start) if len(channel.sent) > 0 else float("inf")
+    return time_all, time_alerts, len(channel.sent), channel.refused, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Discord egress, legacy 100 ms tick vs Egress")
+    parser.add_argument("--alerts", type = int, default = 5)
+    parser.add_argument("--replies", type = int, default = 30)
+    parser.add_argument("--rate", type = int, default = 5, help = "messages accepted by the channel every --per seconds")
+    parser.add_argument("--per", type = float, default = 5.0)
+    parser.add_argument("--latency", type = float, default = 0.05, help = "seconds by send()")
+    parser.add_argument("--timeout", type = float, default = 120)
+    args = parser.parse_args()
+
+    burst = get_burst(args.alerts, args.replies)
+    print(f"\n----- EGRESS : {len(burst)} messages ({args.alerts} alerts), channel {args.rate} msg / {args.per:.0f} s -----")
+    print(f"{'':<22}{'delivered s':>12}{'alerts s':>10}{'messages':>10}{'429':>6}{'dropped':>9}")
+    for iname, ifunction in (("legacy (100 ms tick)", legacy), ("egress", egress)):
+        time_all, time_alerts, n_messages, n_refused, n_dropped = measure(ifunction, burst, args)
+        print(f"{iname:<22}{time_all:>12.2f}{time_alerts:>10.2f}{n_messages:>10}{n_refused:>6}{n_dropped:>9}")
+
+
+if __name__ == "__main__":
+    main()
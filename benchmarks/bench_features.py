@@ -0,0 +1,59 @@
+import argparse
+import timeit
+
+from modules.catalog import get_features_output
+from modules.items import ItemElement
+
+
+"""
+bench_features.py:
+This benchmark measures ItemElement.replace_features in both directions: legacy (features rebuilt in every
+instance, reverse names found by a scan of the values for every parameter) and the compiled maps of the device
+catalog (one dict lookup by parameter), for a real model and for models with many features
+
+python -m benchmarks.bench_features --features 2,10,50
+"""
+
+
+#----------------------------------------------------------------------------------------------
+def legacy_replace_features(element, msg = {}, replace_type = None):
+    """ ItemElement.replace_features before the device catalog """
+    msg_temp = {}
+    for iparameter, ivalue in msg.items():
+        if replace_type == "input" and iparameter in element.features:
+            msg_temp[element.features[iparameter]] = ivalue
+        elif replace_type == "output" and iparameter in [jvalue for jfeature, jvalue in element.features.items()]:
+            for jfeature, jvalue in element.features.items():
+                if iparameter == jvalue: msg_temp[jfeature] = ivalue
+        else: msg_temp[iparameter] = ivalue
+    return msg_temp
+
+
+def get_element(n_features):
+    """ Element of a model with n_features features, the first ones are those of a plug """
+    features = {"state": "onoff", "power": "power"} | {f"external_{iindex}": f"local_{iindex}" for iindex in range(max(0, n_features - 2))}
+    element_class = type(f"DeviceBench_{n_features}", (ItemElement,), {"__slots__": (), "features": features, "features_output": get_features_output(features)})
+    return element_class()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "replace_features, legacy scan vs compiled maps")
+    parser.add_argument("--features", default = "2,10,50", help = "comma separated number of features by model")
+    parser.add_argument("--number", type = int, default = 100000, help = "calls by measure")
+    args = parser.parse_args()
+
+    print("\n----- REPLACE_FEATURES : ns by message -----")
+    print(f"{'features':>9}{'direction':>11}{'legacy':>10}{'compiled':>10}{'speedup':>9}")
+    for in_features in [int(ivalue) for ivalue in args.features.split(",")]:
+        element = get_element(in_features)
+        msg_input = {iexternal: "ON" for iexternal in list(element.features)[-8:]} | {"linkquality": 90} # a report: up to 8 features and an unmapped one
+        msg_output = {ilocal: "ON" for ilocal in list(element.features_output)[-8:]} | {"brightness": 200} # a command
+        for idirection, imsg in (("input", msg_input), ("output", msg_output)):
+            assert legacy_replace_features(element, imsg, idirection) == element.replace_features(imsg, idirection)
+            time_legacy = timeit.timeit(lambda: legacy_replace_features(element, imsg, idirection), number = args.number) / args.number
+            time_compiled = timeit.timeit(lambda: element.replace_features(imsg, idirection), number = args.number) / args.number
+            print(f"{in_features:>9}{idirection:>11}{time_legacy * 1e9:>10.0f}{time_compiled * 1e9:>10.0f}{time_legacy / time_compiled:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import time
+
+from modules.tools import Rqt
+
+from .fleet import build_fleet
+
+
+"""
+bench_groups.py:
+This benchmark measures the cost of a set_status sent to a Group: one message per menber, or a single
+zigbee2mqtt group message when the Group has a node/sid. Latency is the time between execute_rqt and
+the last message sent through the Node
+
+python -m benchmarks.bench_groups --plugs 200 --groups 4
+"""
+
+
+#----------------------------------------------------------------------------------------------
+def measure(wd, group, node, repeat, coalesce, matched):
+    """ sendback (latency us, messages sent) for a set_status ON of group """
+    group.settings["sid"] = group.wid if coalesce else None
+    best = None
+    for i in range(repeat):
+        for ielement in group.elements: ielement.update_status({"onoff": "ON" if matched else "OFF"}) # feedback of devices
+        node.sent = []
+        rqt_temp = Rqt(sender = wd, target = group, command = "set_status", payload = {"onoff": "ON"})
+        time_start = time.perf_counter()
+        group.execute_rqt(rqt_temp)
+        time_end = node.sent[-1][0] if len(node.sent) > 0 else time.perf_counter()
+        latency = (time_end - time_start) * 1e6
+        if best == None or latency < best: best = latency
+    return best, len(node.sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Group set_status latency")
+    parser.add_argument("--plugs", type = int, default = 200)
+    parser.add_argument("--groups", type = int, default = 4)
+    parser.add_argument("--repeat", type = int, default = 20)
+    args = parser.parse_args()
+
+    wd = build_fleet(n_elements = args.plugs * 2, n_rules = 0, n_groups = args.groups, group_sid = True)
+    node = wd.get_item(wid = "node_capture", box = "nodes")
+    group = wd.get_item(wid = "group_0", box = "groups")
+
+    print(f"\n----- GROUP SET_STATUS : {len(group.elements)} menbers -----")
+    for iname, icoalesce, imatched in [("per menber", False, False), ("group message", True, False), ("already matched", True, True)]:
+        latency, sent = measure(wd, group, node, args.repeat, icoalesce, imatched)
+        print(f"{iname:<16}: {latency:10.2f} us, {sent} messages")
+
+
+#----------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import os
+import subprocess
+import sys
+
+
+"""
+bench_import.py:
+This benchmark measures the cost of "import modules" in a fresh interpreter: time (-X importtime), resident
+memory and the backends (paho, discord) that have been imported. It is also a budget test, the exit code is 1
+if import time is above --budget ms or if a backend is imported before a Node using it is configured
+
+python -m benchmarks.bench_import --budget 150
+"""
+
+
+BACKENDS = ("paho", "discord")
+
+SCRIPT = """
+import sys
+import time
+time_start = time.perf_counter()
+{imports}
+time_import = (time.perf_counter() - time_start) * 1e3
+backends = sorted({{iname.split(".")[0] for iname in sys.modules}} & set({backends}))
+with open("/proc/self/status") as status_file:
+    rss = [int(iline.split()[1]) / 1024 for iline in status_file if iline.startswith("VmRSS:")]
+print(",".join(backends) + "|" + str(rss[0] if rss else 0) + "|" + str(time_import))
+"""
+
+
+#----------------------------------------------------------------------------------------------
+def measure(imports):
+    """ one fresh interpreter: (import time in ms, slowest modules, backends imported, RSS in MB) """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT.format(imports = imports, backends = BACKENDS)],
+        cwd = root, capture_output = True, text = True, check = True)
+    modules = []
+    for iline in output.stderr.splitlines():
+        if not iline.startswith("import time:") or "self [us]" in iline: continue
+        self_time, cumulative, name = iline[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_time), int(cumulative)))
+    slowest = sorted(modules, key = lambda imodule: imodule[2], reverse = True)[:8]
+    backends, rss, time_import = output.stdout.strip().splitlines()[-1].split("|")
+    return float(time_import), slowest, [ibackend for ibackend in backends.split(",") if ibackend != ""], float(rss)
+
+
+def best(imports, repeat):
+    """ best run of repeat """
+    results = [measure(imports) for i in range(repeat)]
+    return min(results, key = lambda iresult: iresult[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Import time and memory of modules, with an import time budget")
+    parser.add_argument("--budget", type = float, default = 150, help = "max import time of modules in ms")
+    parser.add_argument("--repeat", type = int, default = 5)
+    args = parser.parse_args()
+
+    time_lazy, slowest, backends, rss_lazy = best("import modules", args.repeat)
+    time_eager, slowest_eager, backends_eager, rss_eager = best("import modules\nfrom modules.collections import COLLECTIONS\nfor icollection in COLLECTIONS.values(): list(icollection)", args.repeat)
+
+    print(f"\n----- IMPORT : best of {args.repeat} fresh interpreters -----")
+    print(f"import modules              : {time_lazy:8.1f} ms, RSS {rss_lazy:6.1f} MB, backends imported: {backends or 'none'}")
+    print(f"every Item class (eager)    : {time_eager:8.1f} ms, RSS {rss_eager:6.1f} MB, backends imported: {backends_eager or 'none'}")
+    print("\nslowest imports of modules (cumulative):")
+    for iname, iself, icumulative in slowest: print(f"{icumulative / 1e3:8.1f} ms  {iname}")
+
+    failed = []
+    if time_lazy > args.budget: failed.append(f"import time {time_lazy:.1f} ms is above the budget of {args.budget:.0f} ms")
+    if len(backends) > 0: failed.append(f"backends {backends} are imported without being configured")
+    for ifailed in failed: print(f"\n>> FAILED : {ifailed}")
+    if len(failed) == 0: print(f"\n>> OK : import time within the budget of {args.budget:.0f} ms")
+    sys.exit(1 if len(failed) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import random
+import time
+
+from .fleet import build_fleet
+
+
+"""
+bench_ingress.py:
+This benchmark replays the telemetry of plugs reporting their power every few seconds (small noise, a few real
+load changes and state switches) through ElementMqttDevice.handle_in, without and with ingress policies
+(keep_unmapped is off with the policies, linkquality changes on every report). It reports forwarded and
+suppressed messages (forwarded ones are submitted to the Rules) and the handle_in cost
+
+python -m benchmarks.bench_ingress --plugs 100 --reports 200
+"""
+
+
+POLICY = {"keep_unmapped": False, "ingress_change_only": True, "ingress_deadband": {"power": 5}, "ingress_min_interval": 30}
+
+
+#----------------------------------------------------------------------------------------------
+def get_reports(n_plugs, n_reports, seed = 0):
+    """ list of (plug index, zigbee2mqtt payload), reports of every plug are interleaved """
+    generator = random.Random(seed)
+    loads = [generator.choice([0, 60, 1200]) for iindex in range(n_plugs)]
+    reports = []
+    for ireport in range(n_reports):
+        for iindex in range(n_plugs):
+            if generator.random() < 0.02: loads[iindex] = generator.choice([0, 60, 1200]) # load switched on/off
+            power = max(0, loads[iindex] + generator.uniform(-2, 2)) if loads[iindex] > 0 else 0
+            reports.append((iindex, {"state": "ON" if loads[iindex] > 0 else "OFF", "power": round(power, 1), "linkquality": generator.randint(40, 120)}))
+    return reports
+
+
+def run(wd, plugs, reports, policy):
+    """ feed reports to plugs, sendback (forwarded, suppressed, seconds) """
+    for iplug in plugs: iplug.update_settings(policy)
+    time_start = time.perf_counter()
+    for iindex, imsg in reports: plugs[iindex].handle_in(imsg)
+    time_spent = time.perf_counter() - time_start
+    histograms = wd.metrics.histograms.get("rules", {})
+    forwarded = sum(histograms[iplug.wid].count for iplug in plugs if iplug.wid in histograms)
+    suppressed = sum(wd.metrics.counters.get("msg_suppressed", {}).get(iplug.wid, 0) for iplug in plugs)
+    return forwarded, suppressed, time_spent
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "plug telemetry through handle_in, with and without ingress policies")
+    parser.add_argument("--plugs", type = int, default = 100)
+    parser.add_argument("--reports", type = int, default = 200, help = "reports by plug")
+    args = parser.parse_args()
+
+    reports = get_reports(args.plugs, args.reports)
+    wd = build_fleet(n_elements = 4 * args.plugs, n_rules = 2 * args.plugs, n_groups = 1) # WD is a singleton, each run has its own plugs
+    print(f"\n----- INGRESS : {len(reports)} reports of {args.plugs} plugs, policy {POLICY} -----")
+    print(f"{'':<12}{'forwarded':>11}{'suppressed':>12}{'us / msg':>10}")
+    for irun, (iname, ipolicy) in enumerate((("no policy", {}), ("policy", POLICY))):
+        plugs = [wd.get_item(f"plug_{irun * args.plugs + iindex}") for iindex in range(args.plugs)]
+        forwarded, suppressed, time_spent = run(wd, plugs, reports, ipolicy)
+        print(f"{iname:<12}{forwarded:>11}{suppressed:>12}{time_spent / len(reports) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from copy import copy
+import argparse
+import gc
+import json
+import tracemalloc
+
+from modules.tools import Rqt
+
+from .fleet import build_fleet
+
+
+"""
+bench_memory.py:
+This benchmark measures the memory footprint of a synthetic fleet: bytes per Element (Item, settings, features
+and status filled by a typical zigbee2mqtt message) and bytes per Request copied by Rules. Slotted Items with
+a compact Status are compared to plain dict status and to a Request with __dict__, and unmapped parameters
+(linkquality, voltage...) are stored or not (keep_unmapped)
+
+python -m benchmarks.bench_memory --elements 1000
+"""
+
+
+ZIGBEE_MSG = {"state": "ON", "power": 12.5, "linkquality": 87, "voltage": 231, "current": 0.05, "energy": 1.27,
+    "update": {"state": "idle", "installed_version": 16909577, "latest_version": 16909577}}
+
+
+#----------------------------------------------------------------------------------------------
+class LegacyRqt():
+    """ Rqt before __slots__, attributes stored in __dict__ """
+
+    def __init__(self, sender = None, target = None, command = None, payload = {}, msg = {}, delta = {}):
+        """ ... """
+        self.sender = sender
+        self.target = target
+        self.command = command
+        self.payload = payload
+        self.msg = msg
+        self.delta = delta
+
+
+#----------------------------------------------------------------------------------------------
+def measure_fleet(n_elements, keep_unmapped, dict_status):
+    """ bytes per Element of a fleet, every Element has received ZIGBEE_MSG """
+    gc.collect()
+    tracemalloc.start()
+    memory_start = tracemalloc.get_traced_memory()[0]
+    wd = build_fleet(n_elements = n_elements, n_rules = 0, n_groups = 0)
+    elements = wd.boxes["elements"].items
+    for ielement in elements:
+        ielement.update_settings({"keep_unmapped": keep_unmapped})
+        if dict_status: ielement.status = dict(ielement.status)
+        ielement.handle_in(msg = json.loads(json.dumps(ZIGBEE_MSG))) # every message is decoded by Node
+        while wd.rqt_buffer.get() != None: pass
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0] - memory_start
+    tracemalloc.stop()
+    return memory / len(elements), len(elements[-1].status)
+
+
+def measure_rqt(rqt_class, n_rqt):
+    """ bytes per Request derived from an incoming one (Rule fan-out), copy() for LegacyRqt and derive() for Rqt """
+    rqt_in = rqt_class(command = "set_status", payload = {"onoff": "ON"}, msg = {"event": "single"})
+    gc.collect()
+    tracemalloc.start()
+    memory_start = tracemalloc.get_traced_memory()[0]
+    if rqt_class == LegacyRqt: rqt_list = [copy(rqt_in) for i in range(n_rqt)]
+    else: rqt_list = [rqt_in.derive(command = "set_status") for i in range(n_rqt)]
+    memory = tracemalloc.get_traced_memory()[0] - memory_start - (len(rqt_list) * 8) # list of pointers is not counted
+    tracemalloc.stop()
+    return memory / n_rqt
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Memory footprint of Elements and Requests")
+    parser.add_argument("--elements", type = int, default = 1000)
+    parser.add_argument("--requests", type = int, default = 10000)
+    args = parser.parse_args()
+
+    print(f"\n>> {args.elements} elements")
+    for keep_unmapped, dict_status, name in [(True, True, "dict status"), (True, False, "compact status"), (False, False, "compact status, unmapped dropped")]:
+        per_element, n_parameters = measure_fleet(args.elements, keep_unmapped, dict_status)
+        print(f"{name:<36}: {per_element:>8.0f} bytes/element ({n_parameters} status parameters)")
+
+    print(f"\n>> {args.requests} requests")
+    print(f"{'Rqt with __dict__':<36}: {measure_rqt(LegacyRqt, args.requests):>8.0f} bytes/request")
+    print(f"{'Rqt with __slots__':<36}: {measure_rqt(Rqt, args.requests):>8.0f} bytes/request")
+
+
+if __name__ == "__main__":
+    main()
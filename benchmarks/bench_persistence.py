@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+import yaml
+
+from modules.collections import element_classes, rule_classes
+from modules.config import Config
+from modules.containers import Box
+from modules.persistence import Persistence
+
+from .fleet import write_fleet
+
+
+"""
+bench_persistence.py:
+This benchmark measures how long the FSM is blocked by a burst of update_settings commands (one setting changed
+then the Box saved, burst times): legacy save (yaml.dump in the FSM thread, file truncated in place) and
+Persistence.save() (Box marked, written by the worker after the debounce window, only if changed)
+
+python -m benchmarks.bench_persistence --elements 1000 --rules 1000 --burst 20
+"""
+
+
+#----------------------------------------------------------------------------------------------
+def legacy_save(box):
+    """ Box.save_items before Persistence """
+    list_temp = [{"class": iitem.__class__.__name__, "wid": iitem.wid, "settings": iitem.settings} for iitem in box.items]
+    with open(box.config.get_path(box.item_file), "w") as yaml_file: yaml.dump(list_temp, yaml_file, sort_keys = False)
+
+
+def burst(boxes, save, count):
+    """ count setting changes, every Box is saved after each change. Time spent in the caller (FSM) in ms """
+    time_blocked = 0
+    for iindex in range(count):
+        boxes[0].items[iindex % len(boxes[0].items)].update_settings({"timeout_value": iindex})
+        time_start = time.perf_counter()
+        for ibox in boxes: save(ibox)
+        time_blocked += time.perf_counter() - time_start
+    return time_blocked * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "FSM time spent saving Boxes, legacy vs background Persistence")
+    parser.add_argument("--elements", type = int, default = 1000)
+    parser.add_argument("--rules", type = int, default = 1000)
+    parser.add_argument("--burst", type = int, default = 20, help = "number of update_settings commands")
+    parser.add_argument("--debounce", type = float, default = 0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix = "wilddog_bench_") as path:
+        write_fleet(path, args.elements, args.rules, 0)
+        config = Config(os.path.join(path, "data"))
+        boxes = [Box("elements.yaml", element_classes, config = config), Box("rules.yaml", rule_classes, config = config)]
+        for ibox in boxes: ibox.load_items()
+
+        time_legacy = burst(boxes, legacy_save, args.burst)
+
+        persistence = Persistence(debounce = args.debounce)
+        persistence.start()
+        time_start = time.perf_counter()
+        time_background = burst(boxes, persistence.save, args.burst)
+        while persistence.get_stats()["pending"] > 0 or persistence.get_stats()["written"] + persistence.get_stats()["skipped"] < len(boxes): time.sleep(0.001)
+        time_written = (time.perf_counter() - time_start) * 1e3
+        stats = persistence.get_stats()
+
+    print(f"\n----- PERSISTENCE : {args.burst} update_settings, {sum(len(ibox.items) for ibox in boxes)} items in {len(boxes)} Boxes -----")
+    print(f"{'legacy (FSM writes every Box)':<35}: FSM blocked {time_legacy:9.1f} ms, {args.burst * len(boxes)} files written")
+    print(f"{f'background (debounce {args.debounce:.1f} s)':<35}: FSM blocked {time_background:9.1f} ms, {stats['written']} files written, {stats['skipped']} not changed, {stats['coalesced']} coalesced, on disk after {time_written:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import time
+
+from modules.containers import Item
+from modules.tools import Rqt
+
+from .fleet import build_fleet
+
+
+"""
+bench_rules.py:
+This benchmark measures the per-request cost of Rule evaluation. The legacy path (every Rule, conditions
+read from settings and Items searched on every request) is compared to the compiled conditions and to
+the dispatch index used by SystemWilddog.set_rqt
+
+python -m benchmarks.bench_rules --elements 200 --rules 500
+"""
+
+
+#----------------------------------------------------------------------------------------------
+def legacy_get_item(wd, wid):
+    """ linear search of an Item across all boxes, as done before the item registry """
+    if wid == "wilddog": return wd
+    for iname, ibox in wd.boxes.items():
+        for iitem in ibox.items:
+            if iitem.wid == wid: return iitem
+    return Item()
+
+
+def legacy_check(rule, rqt_in):
+    """ ItemRule.check before conditions were compiled """
+    rqt_out = Rqt()
+    condition_ok = True
+    if rule.settings["enable"] and (rule.sender == rqt_in.sender or rule.sender.wid in rqt_in.sender.settings["group"]):
+        for icondition in rule.settings["condition"]:
+            if icondition["item"] == "this_item": condition_temp = legacy_evaluate_condition(icondition, rqt_in.msg)
+            else:
+                element_temp = legacy_get_item(rule.wd, icondition["item"])
+                condition_temp = element_temp.wid != None and legacy_evaluate_condition(icondition, element_temp.status)
+            condition_ok = condition_ok and condition_temp
+        if condition_ok:
+            target, command, payload = rqt_in.target, rqt_in.command, rqt_in.msg # copy() of a mutable Rqt then attributes replaced
+            if rule.settings["target"] != None: target = rule.target
+            if rule.settings["command"] != None: command = rule.settings["command"]
+            if rule.settings["payload"] != {}: payload = rule.settings["payload"]
+            rqt_out = Rqt(sender = rqt_in.sender, target = target, command = command, payload = payload, msg = rqt_in.msg, delta = rqt_in.delta)
+    return rqt_out
+
+
+def legacy_evaluate_condition(condition, msg):
+    """ ItemRule._evaluate_condition before conditions were compiled """
+    condition_ok = False
+    feature = condition["feature"]
+    if feature in msg:
+        value = condition["value"]
+        operator = condition["operator"]
+        try:
+            if msg[feature] == value and operator == "=": condition_ok = True
+            elif msg[feature] != value and operator == "!=": condition_ok = True
+            elif msg[feature] > value and operator == ">": condition_ok = True
+            elif msg[feature] < value and operator == "<": condition_ok = True
+        except:
+            condition_ok = False
+    return condition_ok
+
+
+#----------------------------------------------------------------------------------------------
+def run_legacy(wd, rqt_list):
+    """ every Rule, legacy evaluation """
+    rules = wd.boxes["rules"].items
+    for irqt in rqt_list:
+        for irule in rules: legacy_check(irule, irqt)
+
+
+def run_compiled(wd, rqt_list):
+    """ every Rule, compiled conditions """
+    rules = wd.boxes["rules"].items
+    for irqt in rqt_list:
+        for irule in rules: irule.check(irqt)
+
+
+def run_indexed(wd, rqt_list):
+    """ candidate Rules from dispatch index, compiled conditions (SystemWilddog.set_rqt path) """
+    for irqt in rqt_list:
+        for irule in wd.get_rules(irqt): irule.check(irqt)
+
+
+def measure(function, wd, rqt_list, repeat):
+    """ best time per request in microseconds """
+    best = None
+    for i in range(repeat):
+        time_start = time.perf_counter()
+        function(wd, rqt_list)
+        time_temp = (time.perf_counter() - time_start) / len(rqt_list) * 1e6
+        if best == None or time_temp < best: best = time_temp
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Rule evaluation cost per request")
+    parser.add_argument("--elements", type = int, default = 200)
+    parser.add_argument("--rules", type = int, default = 500)
+    parser.add_argument("--groups", type = int, default = 10)
+    parser.add_argument("--repeat", type = int, default = 5)
+    args = parser.parse_args()
+
+    wd = build_fleet(n_elements = args.elements, n_rules = args.rules, n_groups = args.groups)
+    buttons = [iitem for iitem in wd.boxes["elements"].items if iitem.wid.startswith("button_")]
+    rqt_list = [Rqt(sender = ibutton, target = wd, msg = {"event": ievent}) for ibutton in buttons for ievent in ["single", "double", "hold"]]
+
+    print(f"\n----- RULE EVALUATION : {args.elements} elements, {args.rules} rules, {len(rqt_list)} requests -----")
+    results = {
+        "legacy (all rules)": measure(run_legacy, wd, rqt_list, args.repeat),
+        "compiled (all rules)": measure(run_compiled, wd, rqt_list, args.repeat),
+        "compiled + index": measure(run_indexed, wd, rqt_list, args.repeat)
+    }
+    for iname, ivalue in results.items(): print(f"{iname:<24}: {ivalue:10.2f} us/request")
+
+
+#----------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import os
+import tempfile
+import time
+import yaml
+
+from modules.collections import timer_classes, element_classes, rule_classes, node_classes, group_classes
+from modules.config import Config
+from modules.containers import Box
+
+from .fleet import write_fleet
+from .loopback import NodeLoopback
+
+
+"""
+bench_startup.py:
+This benchmark measures the time to load all Boxes of a synthetic fleet (configuration files to Items):
+legacy loading (yaml.safe_load and classes x entries loop), compilation (libyaml loader, validation,
+snapshot written) and loading from the snapshot
+
+python -m benchmarks.bench_startup --elements 1000 --rules 1000 --groups 100
+"""
+
+
+BOX_CLASSES = {
+    "timers.yaml": timer_classes,
+    "elements.yaml": element_classes,
+    "rules.yaml": rule_classes,
+    "nodes.yaml": node_classes + [NodeLoopback],
+    "groups.yaml": group_classes
+}
+
+
+#----------------------------------------------------------------------------------------------
+def legacy_load(data_path):
+    """ Box.load_items before Config: pure python loader and nested loop """
+    items = []
+    for ifile, iclasses in BOX_CLASSES.items():
+        yaml_file = open(os.path.join(data_path, ifile), "r")
+        yaml_list = yaml.safe_load(yaml_file)
+        yaml_file.close()
+        for iclass in iclasses:
+            for i_yaml in yaml_list:
+                if i_yaml["class"] == iclass.__name__ and i_yaml["settings"]["enable"]:
+                    item_temp = iclass()
+                    item_temp.wid = i_yaml["wid"]
+                    item_temp.update_settings(i_yaml["settings"])
+                    items.append(item_temp)
+    return items
+
+
+def config_load(data_path):
+    """ Boxes loaded through Config, snapshot used if valid """
+    config = Config(data_path)
+    boxes = [Box(ifile, iclasses, config = config) for ifile, iclasses in BOX_CLASSES.items()]
+    for ibox in boxes: ibox.load_items()
+    return config
+
+
+def measure(function, repeat):
+    """ best time in ms """
+    best = None
+    for i in range(repeat):
+        time_start = time.perf_counter()
+        result = function()
+        time_temp = (time.perf_counter() - time_start) * 1e3
+        if best == None or time_temp < best: best = time_temp
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Startup time, configuration files to Items")
+    parser.add_argument("--elements", type = int, default = 1000)
+    parser.add_argument("--rules", type = int, default = 1000)
+    parser.add_argument("--groups", type = int, default = 100)
+    parser.add_argument("--repeat", type = int, default = 5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix = "wilddog_bench_") as path:
+        write_fleet(path, args.elements, args.rules, args.groups)
+        data_path = os.path.join(path, "data")
+        snapshot_path = os.path.join(data_path, Config.SNAPSHOT_FILE)
+
+        def compile_load():
+            if os.path.exists(snapshot_path): os.remove(snapshot_path)
+            return config_load(data_path)
+
+        time_legacy, items = measure(lambda: legacy_load(data_path), args.repeat)
+        time_compile, config = measure(compile_load, args.repeat)
+        time_snapshot, config_snapshot = measure(lambda: config_load(data_path), args.repeat)
+
+    print(f"\n----- STARTUP : {len(items)} items, {args.repeat} runs -----")
+    print(f"legacy (safe_load + nested loop)  : {time_legacy:10.1f} ms")
+    print(f"compile (C loader + validation)   : {time_compile:10.1f} ms, {len(config.errors)} errors")
+    print(f"snapshot                          : {time_snapshot:10.1f} ms, from snapshot: {config_snapshot.from_snapshot}")
+
+
+if __name__ == "__main__":
+    main()
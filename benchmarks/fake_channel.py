@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+
+"""
+fake_channel.py:
+This file contains FakeChannel, an in-process stand-in for a Discord text channel: send() has a latency, enforces
+the 2000 characters limit and a rate limit bucket, answering like Discord with an HTTP 429 and retry_after
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class FakeRateLimited(Exception):
+    """ same attributes as discord.HTTPException/RateLimited for a 429 answer """
+
+    def __init__(self, retry_after):
+        """ ... """
+        super().__init__(f"429 Too Many Requests, retry after {retry_after:.2f} s")
+        self.status = 429
+        self.retry_after = retry_after
+
+
+#----------------------------------------------------------------------------------------------
+class FakeChannel():
+    """
+    FakeChannel accepts rate messages every per seconds (Discord channels: 5 messages / 5 s), a message sent
+    above the rate is refused with FakeRateLimited until the bucket is reset
+
+    sent: list of (time, content) of accepted messages
+    refused: number of messages refused by the rate limit
+    latency: seconds taken by every send()
+    limit: max characters by message, ValueError above it (HTTP 400 on Discord)
+    """
+
+    def __init__(self, rate = 5, per = 5.0, latency = 0.05, limit = 2000):
+        """ ... """
+        self.rate = rate
+        self.per = per
+        self.latency = latency
+        self.limit = limit
+        self.sent = []
+        self.refused = 0
+        self._bucket_reset = None
+        self._bucket_remaining = rate
+
+    async def send(self, content):
+        """ ... """
+        await asyncio.sleep(self.latency)
+        if len(content) > self.limit: raise ValueError(f"message of {len(content)} characters, limit is {self.limit}")
+        time_now = time.perf_counter()
+        if self._bucket_reset == None or time_now >= self._bucket_reset:
+            self._bucket_reset = time_now + self.per
+            self._bucket_remaining = self.rate
+        if self._bucket_remaining == 0:
+            self.refused += 1
+            raise FakeRateLimited(self._bucket_reset - time_now)
+        self._bucket_remaining -= 1
+        self.sent.append((time_now, content))
@@ -0,0 +1,143 @@
+from modules import SystemWilddog
+import os
+import time
+import yaml
+
+from modules.groups import GroupStandard
+from modules.items import ItemNode
+from modules.mqtt_devices import DeviceButton_a01, DevicePlug_a01
+from modules.rules import RuleStandard
+
+
+"""
+fleet.py:
+This file contains the tools to create a synthetic fleet of Items (buttons, plugs, groups and rules)
+directly in the Boxes of WD, without configuration files nor external services, or as configuration files
+(same yaml schema as data/) used by WD from its StateStart
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class NodeCapture(ItemNode):
+    """
+    NodeCapture is a Node without external service, every outgoing message is captured
+
+    sent: list of (time, sid, msg_type, msg) sent through the Node
+    """
+
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self.sent = []
+
+    def start(self):
+        """ ... """
+        self.update_status({"started": True})
+
+    def send_msg(self, sid, msg_type, msg):
+        """ ... """
+        self.sent.append((time.perf_counter(), sid, msg_type, msg))
+
+
+#----------------------------------------------------------------------------------------------
+def build_fleet(n_elements = 100, n_rules = 100, n_groups = 10, group_sid = False):
+    """
+    create WD and settle a synthetic fleet. Half of elements are buttons (button_i) and the other half are
+    plugs (plug_i). Every Rule links a button to a plug with three conditions: event of button, state of WD
+    and onoff of plug. Plugs are distributed in n_groups Groups (group_i). All elements use the NodeCapture
+    node_capture, Groups are also declared on it if group_sid is True
+    """
+    wd = SystemWilddog()
+    wd.wid = "wilddog"
+    n_buttons = max(1, n_elements // 2)
+    n_plugs = max(1, n_elements - n_buttons)
+
+    node = _add_item(wd, "nodes", NodeCapture, "node_capture", {"elements": []})
+    for i in range(n_buttons):
+        _add_item(wd, "elements", DeviceButton_a01, f"button_{i}", {})
+        node.settings["elements"].append({"wid": f"button_{i}", "sid": f"BT_{i:04d}"})
+    for i in range(n_plugs):
+        _add_item(wd, "elements", DevicePlug_a01, f"plug_{i}", {"onoff_enable": True, "timeout_value": 3600})
+        node.settings["elements"].append({"wid": f"plug_{i}", "sid": f"PG_{i:04d}"})
+    for i in range(n_groups):
+        group_settings = {"elements": [f"plug_{j}" for j in range(i, n_plugs, n_groups)]}
+        if group_sid: group_settings = group_settings | {"node": "node_capture", "sid": f"group_{i}"}
+        _add_item(wd, "groups", GroupStandard, f"group_{i}", group_settings)
+    for i in range(n_rules):
+        event, onoff = ("single", "ON") if i % 2 == 0 else ("double", "OFF")
+        _add_item(wd, "rules", RuleStandard, f"rule_{i}", {
+            "sender": f"button_{i % n_buttons}",
+            "target": f"plug_{i % n_plugs}",
+            "condition": [
+                {"item": "this_item", "feature": "event", "operator": "=", "value": event},
+                {"item": "wilddog", "feature": "state", "operator": "!=", "value": "sleep"},
+                {"item": f"plug_{i % n_plugs}", "feature": "onoff", "operator": "!=", "value": onoff}
+            ],
+            "command": "set_status",
+            "payload": {"onoff": onoff}
+        })
+
+    wd.setup(wd)
+    for ibox in ["elements", "nodes", "groups", "rules"]: wd.boxes[ibox].setup_items(wd)
+    wd.update_status({"state": "run"})
+    return wd
+
+
+def _add_item(wd, box, item_class, wid, settings):
+    """ create an Item and add it to a Box """
+    item_temp = item_class()
+    item_temp.wid = wid
+    item_temp.update_settings(settings)
+    wd.boxes[box].add_item(item_temp)
+    return item_temp
+
+
+#----------------------------------------------------------------------------------------------
+def write_fleet(path, n_elements = 100, n_rules = 100, n_groups = 10, node_class = "NodeLoopback"):
+    """
+    write the configuration files of a synthetic fleet in path/data. Buttons (button_i, sid BT_i) and plugs
+    (plug_i, sid PG_i) are paired: a "single" of button_i turns plug_i on and a "double" turns it off (two Rules
+    per pair). Other Rules wait for a "triple" that is never sent, they are evaluated but never validated.
+    Plugs are distributed in n_groups Groups (group_i), also in group_onoff. systems.yaml and timers.yaml are
+    copied from data/. Sent back the list of pairs (button sid, plug sid)
+    """
+    n_buttons = max(1, n_elements // 2)
+    n_plugs = max(1, n_elements - n_buttons)
+    n_pairs = min(n_buttons, n_plugs, max(1, n_rules // 2))
+    data_path = os.path.join(path, "data")
+    os.makedirs(data_path, exist_ok = True)
+
+    elements = []
+    for i in range(n_buttons):
+        elements.append({"class": "DeviceButton_a01", "wid": f"button_{i}", "settings": {"enable": True, "group": [], "battery_enable": True, "node": "node_loopback", "sid": f"BT_{i:05d}"}})
+    for i in range(n_plugs):
+        elements.append({"class": "DevicePlug_a01", "wid": f"plug_{i}", "settings": {"enable": True, "group": ["group_onoff"], "onoff_enable": True,
+            "timeout_enable": True, "timeout_value": 3600, "node": "node_loopback", "sid": f"PG_{i:05d}"}})
+    nodes = [{"class": node_class, "wid": "node_loopback", "settings": {"enable": True, "group": [], "base_topic": "zigbee2mqtt",
+        "elements": [{"wid": ielement["wid"], "sid": ielement["settings"]["sid"]} for ielement in elements]}}]
+    groups = [{"class": "GroupStandard", "wid": f"group_{i}", "settings": {"enable": True, "group": [], "elements": [f"plug_{j}" for j in range(i, n_plugs, n_groups)]}}
+        for i in range(n_groups)]
+
+    rules = [{"class": "RuleStandard", "wid": iwid, "settings": {"enable": True, "group": [], "sender": iwid, "target": itarget, "condition": [], "command": None, "payload": {}}}
+        for iwid, itarget in [("timer_device", None), ("timer_system", "wilddog")]]
+    for i in range(n_rules):
+        pair = (i // 2) % n_pairs if i < 2 * n_pairs else i % n_buttons
+        event, onoff = ("single", "ON") if i % 2 == 0 else ("double", "OFF")
+        if i >= 2 * n_pairs: event = "triple"
+        rules.append({"class": "RuleStandard", "wid": f"rule_{i}", "settings": {"enable": True, "group": [],
+            "sender": f"button_{pair}",
+            "target": f"plug_{pair % n_plugs}",
+            "condition": [
+                {"item": "this_item", "feature": "event", "operator": "=", "value": event},
+                {"item": "wilddog", "feature": "state", "operator": "!=", "value": "sleep"},
+                {"item": f"plug_{pair % n_plugs}", "feature": "onoff", "operator": "!=", "value": onoff}
+            ],
+            "command": "set_status",
+            "payload": {"onoff": onoff}}})
+
+    for iname, ilist in [("elements", elements), ("nodes", nodes), ("groups", groups), ("rules", rules)]:
+        with open(os.path.join(data_path, f"{iname}.yaml"), "w") as yaml_file: yaml.dump(ilist, yaml_file, sort_keys = False)
+    for iname in ["systems", "timers"]:
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", f"{iname}.yaml")) as yaml_file: content = yaml_file.read()
+        with open(os.path.join(data_path, f"{iname}.yaml"), "w") as yaml_file: yaml_file.write(content)
+    return [(f"BT_{i:05d}", f"PG_{i:05d}") for i in range(n_pairs)]
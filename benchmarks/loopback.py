@@ -0,0 +1,77 @@
+from threading import Lock
+import json
+import time
+
+from modules.items import ItemNode
+from modules.node_mqtt import NodeMQTT
+
+
+"""
+loopback.py:
+This file contains NodeLoopback, an in-process stand-in for NodeMQTT. Messages are fed to set_msg as they
+would come from the broker and every outgoing message is captured (and answered like a zigbee2mqtt device)
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class LoopbackMessage():
+    """ minimal paho MQTTMessage, only topic and payload are used by NodeMQTT """
+
+    def __init__(self, topic, payload):
+        """ ... """
+        self.topic = topic
+        self.payload = payload
+
+
+#----------------------------------------------------------------------------------------------
+class NodeLoopback(NodeMQTT):
+    """
+    NodeLoopback is a NodeMQTT without broker. feed() encodes a message and sends it to set_msg() as the paho
+    thread would do, send_msg() encodes the message like NodeMQTT and captures it. If echo is enabled, a "set"
+    message is answered with the device state report (state, power, linkquality...) like a real plug
+
+    sent: list of (time, sid, msg_type, msg) sent through the Node, None to not keep them
+    on_send: callback(time, sid, msg_type, msg) called for every outgoing message (after its echo), None if not used
+    counters: number of messages fed (ingress) and sent (egress)
+    settings:
+        - echo : answer "set" messages with a state report
+    """
+
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self.sent = []
+        self.on_send = None
+        self.counters = {"ingress": 0, "egress": 0}
+        self._lock = Lock()
+
+        self.settings = self.settings | {
+            "echo": True
+        }
+
+    def setup(self, wd):
+        """ no broker, paho client is not created """
+        ItemNode.setup(self, wd)
+
+    def start(self):
+        """ ... """
+        self.update_status({"started": True})
+
+    def feed(self, sid, msg):
+        """ send a message to set_msg() as if it was published by device sid """
+        with self._lock: self.counters["ingress"] += 1
+        self.set_msg(None, None, LoopbackMessage(f"{self.settings['base_topic']}/{sid}", json.dumps(msg).encode()))
+
+    def send_msg(self, sid, msg_type, msg):
+        """ ... """
+        time_sent = time.perf_counter()
+        payload = json.dumps(msg) # same encoding cost as NodeMQTT
+        self.wd.metrics.observe("send_msg", self.wid, time.perf_counter() - time_sent)
+        with self._lock:
+            self.counters["egress"] += 1
+            if self.sent != None: self.sent.append((time_sent, sid, msg_type, msg))
+        if msg_type == "set" and self.settings["echo"]:
+            report = json.loads(payload)
+            if "state" in report: report = report | {"power": 12.5 if report["state"] == "ON" else 0, "linkquality": 120, "voltage": 231}
+            self.feed(sid, report)
+        if self.on_send != None: self.on_send(time_sent, sid, msg_type, msg) # after the echo, the device status is already updated
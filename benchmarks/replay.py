@@ -0,0 +1,139 @@
+from collections import Counter
+from contextlib import redirect_stdout
+from threading import Thread
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import yaml
+
+from modules import SystemWilddog
+from modules.config import YAML_LOADER, get_data_path
+from modules.items import ItemNode
+from modules.journal import JournalReader
+
+
+"""
+replay.py:
+This tool feeds the incoming messages of a journal back through a fresh SystemWilddog, at up to --speed times real
+time (0 for as fast as possible). Configuration files are copied in a temporary directory and every Node is replaced
+by NodeReplay, nothing is sent to the broker nor to Discord. The journal of the replay is compared to the original
+one: records by kind and derived requests by Rule. Requests of Timers depend on the wall clock, they differ when the
+replay is accelerated
+
+python -m benchmarks.replay data/journal --data data --speed 10
+python -m benchmarks.replay data/journal --speed 0 --record /tmp/replay_journal
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class NodeReplay(ItemNode):
+    """
+    NodeReplay replaces every Node class during a replay: it is started without connexion and outgoing messages
+    are only counted
+
+    sent: number of messages sent through the Node
+    """
+
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self.sent = 0
+
+    def start(self):
+        """ ... """
+        self.update_status({"started": True})
+
+    def send_msg(self, *arg, **kwarg):
+        """ ... """
+        self.sent += 1
+
+
+def read_journal(path):
+    """ sendback (ingress records, counter by kind, counter of derived requests by Rule) """
+    with JournalReader(path) as reader:
+        kinds = Counter(ikind for itime, ikind, ibody in reader.get_raw()) # bodies are not decoded
+        ingress = reader.read(["ingress"])
+        rules = Counter(ibody["rule"] for itime, ikind, ibody in reader.read(["rqt"]))
+    return ingress, kinds, rules
+
+
+def copy_config(data_path, path, journal_path):
+    """ copy configuration files of data_path to path, the journal of WD is written in journal_path. Node class names are sent back """
+    for iname in os.listdir(data_path):
+        if iname.endswith(".yaml"): shutil.copy(os.path.join(data_path, iname), os.path.join(path, iname))
+    with open(os.path.join(path, "systems.yaml")) as yaml_file: systems = yaml.load(yaml_file, Loader = YAML_LOADER)
+    for isystem in systems: isystem["settings"] = isystem.get("settings", {}) | {"journal_enable": True, "journal_path": journal_path}
+    with open(os.path.join(path, "systems.yaml"), "w") as yaml_file: yaml.dump(systems, yaml_file, sort_keys = False)
+    with open(os.path.join(path, "nodes.yaml")) as yaml_file: nodes = yaml.load(yaml_file, Loader = YAML_LOADER) or []
+    return {inode["class"] for inode in nodes}
+
+
+def replay(wd, ingress, speed):
+    """ feed ingress records to their Elements, sendback (fed records, unknown Elements) """
+    fed, unknown = 0, 0
+    time_first = ingress[0][0] if len(ingress) > 0 else 0
+    time_start = time.perf_counter()
+    for itime, ikind, ibody in ingress:
+        if speed > 0:
+            delay = (itime - time_first) / speed - (time.perf_counter() - time_start)
+            if delay > 0: time.sleep(delay)
+        element = wd.get_item(ibody["element"], box = "elements")
+        if element.wid == None:
+            unknown += 1
+            continue
+        wd.journal.write("ingress", ibody) # as the Node would do
+        element.handle_in(msg = ibody["msg"])
+        fed += 1
+    return fed, unknown
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "replay a WD journal through a fresh WD")
+    parser.add_argument("journal", help = "journal directory or segment file")
+    parser.add_argument("--data", default = None, help = "configuration directory used when the journal was recorded (WILDDOG_DATA or data/ by default)")
+    parser.add_argument("--speed", type = float, default = 1, help = "times real time, 0 for as fast as possible")
+    parser.add_argument("--record", default = None, help = "directory of the replay journal (temporary by default)")
+    parser.add_argument("--runtime", default = "threads", choices = ["threads", "asyncio"])
+    args = parser.parse_args()
+
+    ingress, kinds, rules = read_journal(args.journal)
+    print(f"\n----- REPLAY : {len(ingress)} incoming messages, {sum(kinds.values())} records, speed {args.speed if args.speed > 0 else 'max'} -----")
+    with tempfile.TemporaryDirectory(prefix = "wilddog_replay_") as path:
+        journal_path = os.path.abspath(args.record or os.path.join(path, "journal"))
+        if os.path.isdir(journal_path) and len(os.listdir(journal_path)) > 0: raise SystemExit(f"{journal_path} is not empty")
+        node_names = copy_config(args.data or get_data_path(), path, journal_path)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull): # Rqt.show() and INFO messages are not displayed
+            wd = SystemWilddog()
+            wd.config.data_path = path
+            node_classes = wd.boxes["nodes"].item_class_collection + []
+            for iname in node_classes.get_names() + list(node_names): node_classes.register(NodeReplay, iname)
+            wd.boxes["nodes"].item_class_collection = node_classes
+            Thread(target = wd.run, kwargs = {"runtime": args.runtime}, daemon = True).start()
+            time_start = time.perf_counter()
+            while wd.status.get("state") != "run":
+                time.sleep(0.01)
+                if time.perf_counter() - time_start > 60: raise RuntimeError("WD did not reach state run")
+
+            time_start = time.perf_counter()
+            fed, unknown = replay(wd, ingress, args.speed)
+            while len(wd.rqt_buffer) > 0: time.sleep(0.01)
+            time_replay = time.perf_counter() - time_start
+            time.sleep(0.2) # last requests are executed
+            wd.journal.close()
+        replay_ingress, replay_kinds, replay_rules = read_journal(journal_path)
+
+    time_span = ingress[-1][0] - ingress[0][0] if len(ingress) > 1 else 0
+    sent = sum(inode.sent for inode in wd.boxes["nodes"].items)
+    print(f"fed {fed} messages ({unknown} of unknown Elements) in {time_replay:.2f} s, recorded over {time_span:.2f} s ({time_span / max(time_replay, 1e-9):.1f}x), {fed / max(time_replay, 1e-9):.0f} msg/s, {sent} messages sent by Nodes")
+    print(f"\n{'records':<24}{'journal':>9}{'replay':>9}")
+    for ikind in sorted(set(kinds) | set(replay_kinds)): print(f"{ikind:<24}{kinds[ikind]:>9}{replay_kinds[ikind]:>9}")
+    differences = [(irule, rules[irule], replay_rules[irule]) for irule in sorted(set(rules) | set(replay_rules)) if rules[irule] != replay_rules[irule]]
+    print(f"\n{len(differences)} Rules with a different number of requests")
+    for irule, isource, ireplay in differences[:20]: print(f"{irule:<24}{isource:>9}{ireplay:>9}")
+    if args.record != None: print(f"\njournal of the replay: {journal_path}")
+
+
+if __name__ == "__main__":
+    main()
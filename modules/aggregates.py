@@ -0,0 +1,112 @@
+from threading import Lock
+
+
+"""
+aggregates.py:
+This file contains the GroupAggregate class, a value computed over a feature of every menber of a Group
+(all doors closed, average temperature...) and updated each time a menber changes
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class GroupAggregate():
+    """
+    GroupAggregate watches a feature on every menber and keeps its partial results, so a change of a single
+    menber does not require to read all menbers again (except min/max when the extreme value is removed).
+    all/any use the truth value of feature (None is False), count is the number of menbers with a value
+    (not None), avg/min/max/sum use numeric values only
+
+    name: aggregate name, it is also the WD status parameter updated
+    function: all, any, avg, min, max, count, sum
+    feature: menber status parameter to aggregate
+    callback: callback(name, result) called when result changes, under the lock so results are delivered in order
+    result: current result
+    values: dict menber wid -> current value of feature
+    settings (dict in WD settings aggregates):
+        - group : group name
+        - feature : status parameter of menbers
+        - function : aggregate function
+    """
+
+    FUNCTIONS = ("all", "any", "avg", "min", "max", "count", "sum")
+
+    def __init__(self, name, feature, function, callback):
+        """ ... """
+        self.name = name
+        self.feature = feature
+        self.function = function if function in self.FUNCTIONS else "all"
+        self.callback = callback
+        self.result = None
+        self.values = {}
+        self._n_true = 0 # truthy values, None is False
+        self._n_values = 0 # values not None
+        self._n_numbers = 0 # numeric values
+        self._total = 0.0 # sum of numeric values
+        self._extreme = None # min or max of numeric values
+        self._extreme_stale = False # the extreme value has been removed, it must be searched again
+        self._lock = Lock()
+
+    def attach(self, elements):
+        """ watch feature on every Element, those already having the feature are aggregated now """
+        with self._lock: # a menber changing meanwhile is updated once attach is done
+            for ielement in elements:
+                ielement.watch(self.feature, self._on_change)
+                if self.feature in ielement.status: self._add(ielement.wid, ielement.status[self.feature])
+            self.result = self._compute()
+            self.callback(self.name, self.result)
+
+    def update(self, wid, value):
+        """ change the value of a menber and call back if the result changes (any thread) """
+        with self._lock: # two menbers changing at the same time, the last result computed is the last one sent
+            if wid in self.values: self._remove(wid)
+            self._add(wid, value)
+            result = self._compute()
+            if result == self.result: return
+            self.result = result
+            self.callback(self.name, result)
+
+    def _on_change(self, item, feature, old_value, new_value):
+        """ ... """
+        self.update(item.wid, new_value)
+
+    def _add(self, wid, value):
+        """ ... """
+        self.values[wid] = value
+        if value: self._n_true += 1
+        if value != None: self._n_values += 1
+        number = self._to_number(value)
+        if number != None:
+            self._n_numbers += 1
+            self._total += number
+            if self._extreme == None or (number < self._extreme if self.function == "min" else number > self._extreme): self._extreme = number
+
+    def _remove(self, wid):
+        """ ... """
+        value = self.values.pop(wid)
+        if value: self._n_true -= 1
+        if value != None: self._n_values -= 1
+        number = self._to_number(value)
+        if number != None:
+            self._n_numbers -= 1
+            self._total -= number
+            if number == self._extreme: self._extreme_stale = True
+
+    def _compute(self):
+        """ result from partial results """
+        if self.function == "all": return self._n_true == len(self.values)
+        if self.function == "any": return self._n_true > 0
+        if self.function == "count": return self._n_values
+        if self.function == "sum": return self._total
+        if self.function == "avg": return self._total / self._n_numbers if self._n_numbers > 0 else 0
+        if self._extreme_stale: # min/max
+            numbers = [inumber for inumber in map(self._to_number, self.values.values()) if inumber != None]
+            if len(numbers) == 0: self._extreme = None
+            else: self._extreme = min(numbers) if self.function == "min" else max(numbers)
+            self._extreme_stale = False
+        return self._extreme
+
+    def _to_number(self, value):
+        """ ... """
+        if value == None or type(value).__name__ == "bool": return None
+        try: return float(value)
+        except (TypeError, ValueError): return None
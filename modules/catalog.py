@@ -0,0 +1,75 @@
+import os
+import yaml
+
+from .config import YAML_LOADER, get_data_path
+
+
+"""
+catalog.py:
+This file contains the device catalog: models of mqtt devices are declared in devices.yaml (this package, then the
+configuration directory of WD, see Config.load_catalog()) with their feature maps. Maps are compiled once per model, every Element of a model shares
+them, and mqtt_devices.py builds the Element class of a model when it is first used
+"""
+
+
+CATALOG_FILE = "devices.yaml"
+PACKAGE_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), CATALOG_FILE)
+
+
+def get_features_output(features):
+    """ reverse map of features: local name -> tuple of external names (a local name can have several external names) """
+    features_output = {}
+    for iexternal, ilocal in features.items(): features_output[ilocal] = features_output.get(ilocal, ()) + (iexternal,)
+    return features_output
+
+
+#----------------------------------------------------------------------------------------------
+class Catalog():
+    """
+    Catalog reads the device models once. A model of the configuration directory replaces the model of the same
+    name of this package
+
+    paths: catalog files, in reading order, a missing file is ignored. None for this package and WILDDOG_DATA (or data/)
+    models: dict model name -> {"description", "features" (external -> local), "features_output" (local -> external names)}, None until loaded
+    """
+
+    def __init__(self, paths = None):
+        """ ... """
+        self.paths = paths
+        self.models = None
+
+    def get_names(self):
+        """ names of all models, in file order """
+        if self.models == None: self.load()
+        return list(self.models)
+
+    def get_models(self):
+        """ dict of compiled models, a new dict every time the catalog is loaded """
+        if self.models == None: self.load()
+        return self.models
+
+    def get(self, model_name):
+        """ compiled model, None if model_name is unknown """
+        if self.models == None: self.load()
+        return self.models.get(model_name)
+
+    def load(self, paths = None):
+        """ read and compile every catalog file, paths replaces the catalog files if given """
+        if paths != None: self.paths = paths
+        paths = self.paths or [PACKAGE_CATALOG, os.path.join(get_data_path(), CATALOG_FILE)]
+        models = {}
+        for ipath in paths:
+            if not os.path.isfile(ipath): continue
+            with open(ipath) as yaml_file: content = yaml.load(yaml_file, Loader = YAML_LOADER) or {}
+            for imodel_name, imodel in content.items():
+                imodel = imodel or {}
+                features = imodel.get("features") or {}
+                if type(features).__name__ != "dict" or not all(type(iname).__name__ == "str" for iitem in features.items() for iname in iitem):
+                    print(f"\n>> INFO : device model {imodel_name} of {ipath} is ignored, features must map names to names")
+                    continue
+                models[imodel_name] = {"description": imodel.get("description", imodel_name), "features": features, "features_output": get_features_output(features)}
+        self.models = models
+        return models
+
+
+CATALOG = Catalog()
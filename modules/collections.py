@@ -1,60 +1,141 @@
-from . import timers
-from . import elements
-from . import mqtt_devices
-from . import nodes
-from . import groups
-from . import rules
+from importlib import import_module
+from importlib.util import resolve_name
 
 
 """
 collections.py :
-This file contains lists of all existing Item class constructors. Boxes uses these lists to built Items.
-If a new class is created must be also be included in one of these lists
+This file contains the registry of all Item class constructors. Boxes use these collections to build Items.
+A class is known by its name and the module defining it, the module is only imported when a configuration
+file uses the class (ex. discord is not imported if there is no NodeDiscord). A new class can be declared:
+    - in ITEM_MODULES, for classes of this package
+    - in the device catalog (devices.yaml, see catalog.py) for models of mqtt devices, no class has to be written
+    - with the decorator @register("nodes"), the module has to be imported before WD is started
+    - with an entry point of group wilddog.<box> (ex. wilddog.nodes = NodeFoo = "package.module:NodeFoo") in an installed package
 """
 
 
-#----------------------------------------------------------------------------------------------
-timer_classes = [
-    timers.TimerElement,
-    timers.TimerSystem
-]
+ITEM_MODULES = {
+    "timers": {
+        "TimerElement": ".timers",
+        "TimerSystem": ".timers"
+    },
+    "elements": {
+        "ElementDiscord": ".elements"
+    },
+    "nodes": {
+        "NodeMQTT": ".node_mqtt",
+        "NodeDiscord": ".node_discord"
+    },
+    "rules": {
+        "RuleStandard": ".rules"
+    },
+    "groups": {
+        "GroupStandard": ".groups"
+    }
+}
+
+ITEM_CATALOGS = {
+    "elements": ".mqtt_devices" # models of the device catalog, module building their classes
+}
 
 
 #----------------------------------------------------------------------------------------------
-element_classes = [
-    elements.ElementDiscord,
-    mqtt_devices.DeviceButton_a01,
-    mqtt_devices.DevicePlug_a01,
-    mqtt_devices.DeviceRelay_a01,
-    mqtt_devices.DeviceRelay_a12,
-    mqtt_devices.DeviceRelay_a22,
-    mqtt_devices.DeviceRelay_b12,
-    mqtt_devices.DeviceRelay_b22,
-    mqtt_devices.DeviceRelay_c01,
-    mqtt_devices.DeviceRelay_d01,
-    mqtt_devices.DeviceKeypad_a06,
-    mqtt_devices.DeviceMovement_a01,
-    mqtt_devices.DeviceOverture_a01,
-    mqtt_devices.DeviceAlarm_a01,
-    mqtt_devices.DeviceAlarm_b01,
-    mqtt_devices.DeviceLeakwater_a01
-]
+class ClassCollection():
+    """
+    ClassCollection is the list of Item classes a Box can build. Classes are declared by name and resolved
+    on demand, so the module of a class (and its dependencies) is imported only if the class is used.
+    Iterating over the collection imports every class, get_names() and get() should be preferred
 
+    name: Box name, catalog models (ITEM_CATALOGS) and entry points of group wilddog.<name> are part of the collection
+    classes: dict class name -> class, module path (relative to this package or absolute) or entry point
+    _discovered: True once entry points have been read
+    _catalog_models: models of the device catalog declared in the collection, they are declared again if the catalog is loaded again
+    """
 
-#----------------------------------------------------------------------------------------------
-node_classes = [
-    nodes.NodeMQTT,
-    nodes.NodeDiscord
-]
+    def __init__(self, name = None, classes = None):
+        """ ... """
+        self.name = name
+        self.classes = dict(classes or {})
+        self._discovered = name == None
+        self._catalog_models = None
 
+    def register(self, item_class, class_name = None):
+        """ add a class already imported, a class with the same name is replaced """
+        self.classes[class_name or item_class.__name__] = item_class
+        return item_class
 
-#----------------------------------------------------------------------------------------------
-rule_classes = [
-    rules.RuleStandard
-]
+    def get_names(self):
+        """ names of all classes, in declaration order (catalog models then entry points last), nothing is imported """
+        self._discover()
+        return list(self.classes)
+
+    def get(self, class_name):
+        """ sendback the class, its module is imported the first time. None if class_name is unknown, ImportError if its module can not be imported """
+        self._discover()
+        item_class = self.classes.get(class_name)
+        if item_class == None or isinstance(item_class, type): return item_class
+        if type(item_class).__name__ == "str":
+            item_class = getattr(import_module(item_class, __package__), class_name)
+        else: item_class = item_class.load() # entry point
+        self.classes[class_name] = item_class
+        return item_class
+
+    def __contains__(self, class_name):
+        """ ... """
+        self._discover()
+        return class_name in self.classes
+
+    def __iter__(self):
+        """ every class, all modules are imported """
+        return iter([self.get(iname) for iname in self.get_names()])
+
+    def __add__(self, item_classes):
+        """ new collection with extra classes (list of classes or ClassCollection) """
+        self._discover()
+        collection = ClassCollection(classes = self.classes)
+        if type(item_classes).__name__ == "ClassCollection": collection.classes.update(item_classes.classes)
+        else:
+            for iclass in item_classes: collection.register(iclass)
+        return collection
+
+    def _discover(self):
+        """ add catalog models and entry points of group wilddog.<name>, entry points are read once """
+        if self.name in ITEM_CATALOGS: self._discover_catalog()
+        if self._discovered: return
+        self._discovered = True
+        from importlib.metadata import entry_points # imported here, it is slow to import and only needed once
+        try: found = entry_points(group = f"wilddog.{self.name}")
+        except TypeError: found = entry_points().get(f"wilddog.{self.name}", []) # python < 3.10
+        for ientry_point in found: self.classes.setdefault(ientry_point.name, ientry_point)
+
+
+    def _discover_catalog(self):
+        """ declare catalog models, classes built from a previous catalog (other data path) are removed """
+        from .catalog import CATALOG
+        models = CATALOG.get_models()
+        if models is self._catalog_models: return
+        module_path = ITEM_CATALOGS[self.name]
+        module_name = resolve_name(module_path, __package__)
+        for imodel_name in self._catalog_models or {}:
+            item_class = self.classes.get(imodel_name)
+            if item_class == module_path or getattr(item_class, "__module__", None) == module_name: self.classes.pop(imodel_name) # a class registered with this name is kept
+        for imodel_name in models: self.classes.setdefault(imodel_name, module_path)
+        self._catalog_models = models
+
+
+COLLECTIONS = {iname: ClassCollection(iname, imodules) for iname, imodules in ITEM_MODULES.items()}
+
+
+def register(box, class_name = None):
+    """ class decorator adding an Item class to the collection of a Box (timers, elements, nodes, rules, groups) """
+    def decorator(item_class):
+        return COLLECTIONS[box].register(item_class, class_name)
+    return decorator
 
 
 #----------------------------------------------------------------------------------------------
-group_classes = [
-    groups.GroupStandard
-]
\ No newline at end of file
+timer_classes = COLLECTIONS["timers"]
+element_classes = COLLECTIONS["elements"]
+node_classes = COLLECTIONS["nodes"]
+rule_classes = COLLECTIONS["rules"]
+group_classes = COLLECTIONS["groups"]
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import yaml
+
+
+"""
+config.py:
+This file contains the Config class, it compiles the configuration files (data/*.yaml) used by Boxes:
+files are parsed once, validated, references between Items are checked and the result is kept in a
+snapshot so the next start does not need to parse yaml again
+"""
+
+
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader) # libyaml C loader if available
+YAML_DUMPER = getattr(yaml, "CDumper", yaml.Dumper) # libyaml C dumper if available, same output as yaml.dump
+
+
+def get_data_path():
+    """ configuration directory: WILDDOG_DATA environment variable, otherwise data/ of the project (not of the working directory) """
+    if os.environ.get("WILDDOG_DATA"): return os.path.abspath(os.environ["WILDDOG_DATA"])
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+#----------------------------------------------------------------------------------------------
+class Config():
+    """
+    Config compiles the configuration files of all Boxes. A file is compiled into the list of enabled entries
+    (class, wid, settings) in file order. The snapshot is valid while every file has the same mtime and size,
+    or the same content (sha1) if it has only been touched, and Boxes know the same classes. The snapshot is json:
+    loading it can not run code, and it is not written if json can not keep the settings exactly (dates, int keys...)
+
+    data_path: directory of the configuration files
+    boxes: dict file -> Box using it, Boxes register themselves
+    entries: dict file -> list of enabled entries, None until load() is done
+    errors: list of errors found by the last compilation (unknown class, duplicated wid, unknown reference...)
+    from_snapshot: True if entries come from the snapshot
+    """
+
+    SNAPSHOT_FILE = ".wilddog_config.json"
+    SNAPSHOT_VERSION = 3
+
+    def __init__(self, data_path = None):
+        """ ... """
+        self.data_path = data_path
+        self.boxes = {}
+        self.entries = None
+        self.errors = []
+        self.from_snapshot = False
+
+    def register(self, box):
+        """ ... """
+        self.boxes[box.item_file] = box
+
+    def get_path(self, file_name):
+        """ full path of a configuration file """
+        if self.data_path == None: self.data_path = get_data_path()
+        return os.path.join(self.data_path, file_name)
+
+    def get_entries(self, file_name):
+        """ sendback the enabled entries of a configuration file, all files are loaded the first time """
+        if self.entries == None: self.load()
+        return self.entries.get(file_name, [])
+
+    def load(self, use_snapshot = True):
+        """ load entries from the snapshot if it is still valid, otherwise compile all files and write the snapshot """
+        self.load_catalog()
+        signatures = {ifile: self._get_signature(ifile) for ifile in self.boxes}
+        snapshot = self._read_snapshot() if use_snapshot else None
+        if snapshot != None and snapshot["classes"] == self._get_classes() and self._check_signatures(snapshot["signatures"], signatures):
+            self.entries = snapshot["entries"]
+            self.errors = snapshot["errors"]
+            self.from_snapshot = True
+        else:
+            self.compile()
+            self.from_snapshot = False
+            self._write_snapshot({ifile: self._get_signature(ifile, hashed = True) for ifile in self.boxes})
+        for ierror in self.errors: print(f"\n>> INFO : config {ierror}")
+        return self.entries
+
+    def load_catalog(self):
+        """ the device catalog is read from this package and data_path, again only if data_path changed """
+        from .catalog import CATALOG, CATALOG_FILE, PACKAGE_CATALOG # imported here, catalog.py imports this module
+        paths = [PACKAGE_CATALOG, self.get_path(CATALOG_FILE)]
+        if CATALOG.models == None or CATALOG.paths != paths: CATALOG.load(paths)
+
+    def compile(self):
+        """ parse and validate all configuration files, references between Items are checked """
+        self.entries = {}
+        self.errors = []
+        for ifile, ibox in self.boxes.items():
+            class_names = set(ibox.item_class_collection.get_names())
+            self.entries[ifile] = self._compile_file(ifile, class_names)
+        self._check_references()
+        return self.entries
+
+    def invalidate(self):
+        """ entries are compiled again on next load (ex. a file has been saved) """
+        self.entries = None
+
+    def _compile_file(self, file_name, class_names):
+        """ enabled entries of a file, in file order """
+        try:
+            with open(self.get_path(file_name), "rb") as yaml_file: yaml_list = yaml.load(yaml_file, Loader = YAML_LOADER)
+        except FileNotFoundError:
+            self.errors.append(f"{file_name}: file not found")
+            return []
+        entries = []
+        wids = set()
+        for iposition, i_yaml in enumerate(yaml_list or []):
+            if type(i_yaml).__name__ != "dict" or "class" not in i_yaml or "wid" not in i_yaml or type(i_yaml.get("settings")).__name__ != "dict":
+                self.errors.append(f"{file_name}: entry {iposition} needs class, wid and settings")
+                continue
+            if not i_yaml["settings"].get("enable", True): continue
+            if i_yaml["class"] not in class_names: self.errors.append(f"{file_name}: unknown class {i_yaml['class']} for {i_yaml['wid']}")
+            if i_yaml["wid"] in wids: self.errors.append(f"{file_name}: {i_yaml['wid']} is declared twice, the last one is used")
+            wids.add(i_yaml["wid"])
+            entries.append({"class": i_yaml["class"], "wid": i_yaml["wid"], "settings": i_yaml["settings"]})
+        return entries
+
+    def _check_references(self):
+        """ every wid used in settings (node, sender, target, condition item, menbers) must be an enabled Item or a group name """
+        names = {"wilddog", "this_item", None}
+        for ientries in self.entries.values():
+            for ientry in ientries:
+                names.add(ientry["wid"])
+                names.update(ientry["settings"].get("group") or [])
+        for ifile, ientries in self.entries.items():
+            for ientry in ientries:
+                settings = ientry["settings"]
+                references = [settings.get("node"), settings.get("sender"), settings.get("target")]
+                references += [icondition.get("item") for icondition in settings.get("condition") or [] if type(icondition).__name__ == "dict"]
+                for ielement in settings.get("elements") or []: references.append(ielement["wid"] if type(ielement).__name__ == "dict" else ielement)
+                for ireference in references:
+                    if ireference not in names: self.errors.append(f"{ifile}: {ientry['wid']} refers to unknown Item {ireference}")
+
+    def _get_signature(self, file_name, hashed = False):
+        """ (mtime, size, sha1) of a file, sha1 is only computed if hashed is True, None if file does not exist """
+        path = self.get_path(file_name)
+        try: stat = os.stat(path)
+        except OSError: return None
+        digest = None
+        if hashed:
+            with open(path, "rb") as config_file: digest = hashlib.sha1(config_file.read()).hexdigest()
+        return (stat.st_mtime_ns, stat.st_size, digest)
+
+    def _get_classes(self):
+        """ class names known by every Box, entries are validated against them """
+        return {ifile: sorted(ibox.item_class_collection.get_names()) for ifile, ibox in self.boxes.items()}
+
+    def _check_signatures(self, saved, current):
+        """ snapshot is valid if every file has the same mtime and size, or the same content """
+        if set(saved) != set(current): return False
+        for ifile, isignature in current.items():
+            if saved[ifile] == None or isignature == None:
+                if saved[ifile] != isignature: return False
+            elif saved[ifile][:2] != isignature[:2] and saved[ifile][2] != self._get_signature(ifile, hashed = True)[2]: return False
+        return True
+
+    def _read_snapshot(self):
+        """ ... """
+        try:
+            with open(self.get_path(self.SNAPSHOT_FILE), "rb") as snapshot_file: snapshot = json.load(snapshot_file)
+            if type(snapshot).__name__ != "dict" or snapshot.get("version") != self.SNAPSHOT_VERSION: return None
+            snapshot["signatures"] = {ifile: None if isignature == None else tuple(isignature) for ifile, isignature in snapshot["signatures"].items()} # json lists
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return snapshot
+
+    def _write_snapshot(self, signatures):
+        """ the snapshot is written in a temporary file then renamed, it is not an error if data_path is read-only """
+        path = self.get_path(self.SNAPSHOT_FILE)
+        signatures = {ifile: None if isignature == None else list(isignature) for ifile, isignature in signatures.items()}
+        snapshot = {"version": self.SNAPSHOT_VERSION, "signatures": signatures, "classes": self._get_classes(), "entries": self.entries, "errors": self.errors}
+        try: data = json.dumps(snapshot, separators = (",", ":"))
+        except (TypeError, ValueError): data = None
+        if data == None or json.loads(data) != snapshot: # a value json does not know, or changed by json (int keys become strings...)
+            print("\n>> INFO : config snapshot is not written, settings contain values json can not keep (dates, not string keys...)")
+            return
+        try:
+            with open(f"{path}.tmp", "w") as snapshot_file: snapshot_file.write(data)
+            os.replace(f"{path}.tmp", path)
+        except OSError as error:
+            print(f"\n>> INFO : config snapshot could not be written ({error})")
@@ -1,14 +1,114 @@
+from collections.abc import Mapping, MutableMapping
 from datetime import datetime
 from copy import copy
+from threading import Lock
+from time import perf_counter
+from types import MappingProxyType
+import hashlib
+import os
+import pickle
 import yaml
 
+from .collections import ClassCollection
+from .config import Config, YAML_DUMPER
+
 
 """
 containers.py :
-This file contains classes Item and Box
+This file contains classes Status, Item, NullItem and Box
 """
 
 
+#----------------------------------------------------------------------------------------------
+_MISSING = object()
+
+
+class Status(MutableMapping):
+    """
+    Status is the dict-like storage of Item.status. Parameter names are stored once in a layout shared by
+    all Items of the same class (name -> position) and every Status only keeps a list of values, so a fleet
+    of identical Elements does not repeat the same keys in every Item. Parameters are listed in layout order
+
+    _layout: dict parameter -> position in _values, shared and only extended (never reduced)
+    _values: list of values, _MISSING if the parameter is not defined for this Item
+    LAYOUT_LOCK: layouts and value lists only grow under this lock (Node, Scheduler and FSM threads add parameters),
+      a parameter already defined is read and written without it
+    """
+
+    __slots__ = ("_layout", "_values")
+
+    LAYOUTS = {} # layouts by Item class
+    LAYOUT_LOCK = Lock()
+
+    def __init__(self, layout = None, values = {}):
+        """ ... """
+        self._layout = layout if layout != None else {}
+        self._values = []
+        for iparameter, ivalue in values.items(): self[iparameter] = ivalue
+
+    def __getitem__(self, parameter):
+        """ ... """
+        index = self._layout.get(parameter)
+        if index == None or index >= len(self._values) or self._values[index] is _MISSING: raise KeyError(parameter)
+        return self._values[index]
+
+    def __setitem__(self, parameter, value):
+        """ ... """
+        index = self._layout.get(parameter)
+        if index == None or index >= len(self._values):
+            with self.LAYOUT_LOCK: # two new parameters must not get the same position
+                if index == None: index = self._layout.setdefault(parameter, len(self._layout))
+                if index >= len(self._values): self._values.extend([_MISSING] * (index + 1 - len(self._values))) # in place, a value written meanwhile by another thread is kept
+        self._values[index] = value
+
+    def __delitem__(self, parameter):
+        """ ... """
+        self[parameter] # KeyError if it is not defined
+        self._values[self._layout[parameter]] = _MISSING
+
+    def __contains__(self, parameter):
+        """ ... """
+        index = self._layout.get(parameter)
+        return index != None and index < len(self._values) and self._values[index] is not _MISSING
+
+    def __iter__(self):
+        """ ... """
+        values = self._values
+        for iparameter, iindex in list(self._layout.items()):
+            if iindex < len(values) and values[iindex] is not _MISSING: yield iparameter
+
+    def __len__(self):
+        """ ... """
+        return sum(1 for ivalue in self._values if ivalue is not _MISSING)
+
+    def get(self, parameter, default = None):
+        """ ... """
+        index = self._layout.get(parameter)
+        if index == None or index >= len(self._values): return default
+        value = self._values[index]
+        return default if value is _MISSING else value
+
+    def copy(self):
+        """ sendback a Status with the same layout and its own values """
+        status_temp = Status(self._layout)
+        status_temp._values = list(self._values)
+        return status_temp
+
+    __copy__ = copy
+
+    def __or__(self, other):
+        """ ... """
+        return dict(self) | dict(other)
+
+    def __eq__(self, other):
+        """ ... """
+        return isinstance(other, Mapping) and dict(self) == dict(other)
+
+    def __repr__(self):
+        """ ... """
+        return repr(dict(self))
+
+
 #----------------------------------------------------------------------------------------------
 class Item():
     """
@@ -22,15 +122,19 @@ class Item():
     settings: configuration parameters
         - enable : activate item
         - group: group subscription list
+    _watchers: dict status parameter -> list of callbacks called when the parameter changes, None if nobody watches
     """
 
+    __slots__ = ("wid", "wtype", "wd", "_watchers", "status", "settings")
+
     def __init__(self):
         """ it allows to declare empty attributes. Any configuration must go here """
         self.wid = None
         self.wtype = None
         self.wd = None
+        self._watchers = None
         
-        self.status = {"error_buffer": []}
+        self.status = Status(Status.LAYOUTS.setdefault(type(self), {}), {"error_buffer": []})
         self.settings = {"enable": True, "group": []} 
 
     def setup(self, wd):
@@ -80,9 +184,66 @@ class Item():
             if iparameter in self.settings: self.settings[iparameter] = ivalue 
     
     def update_status(self, new_status):
-        """ it allows to update/create status parameters"""
+        """
+        it allows to update/create status parameters, watchers are called for every parameter whose value changes.
+        A dict parameter -> (old value, new value) is sent back with the parameters who changed (delta)
+        """
+        watchers = self._watchers
+        delta = {}
         for iparameter, ivalue in new_status.items():
+            old_value = self.status.get(iparameter)
+            if iparameter not in self.status or old_value != ivalue: delta[iparameter] = (old_value, ivalue)
             self.status[iparameter] = ivalue
+        if watchers != None:
+            for iparameter, (old_value, ivalue) in delta.items():
+                for icallback in watchers.get(iparameter, ()): icallback(self, iparameter, old_value, ivalue)
+        return delta
+
+    def watch(self, feature, callback):
+        """ callback(item, feature, old_value, new_value) will be called every time status[feature] changes """
+        if self._watchers == None: self._watchers = {}
+        self._watchers.setdefault(feature, []).append(callback)
+
+    def unwatch(self, feature, callback):
+        """ ... """
+        if self._watchers != None and callback in self._watchers.get(feature, []): self._watchers[feature].remove(callback)
+
+
+#----------------------------------------------------------------------------------------------
+class NullItem(Item):
+    """
+    NullItem is the Item sent back when an Item is not found (wid is None). There is a single immutable
+    instance, NULL_ITEM, shared by everybody, so it must not be modified
+    """
+
+    __slots__ = ("_frozen",)
+
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self.status = MappingProxyType({"error_buffer": ()})
+        self.settings = MappingProxyType({"enable": True, "group": ()})
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        """ ... """
+        if getattr(self, "_frozen", False): raise AttributeError(f"NullItem is immutable, {name} can not be set")
+        super().__setattr__(name, value)
+
+    def update_settings(self, new_settings):
+        """ ... """
+        pass
+
+    def update_status(self, new_status):
+        """ ... """
+        return {}
+
+    def watch(self, feature, callback):
+        """ ... """
+        pass
+
+
+NULL_ITEM = NullItem()
 
 
 #----------------------------------------------------------------------------------------------
@@ -92,52 +253,102 @@ class Box():
     from the configuration files yaml. Every kind of Item has it own Box
 
     item_file: file containing all the items to create
-    item_collection: class list constructors
+    item_class_collection: ClassCollection of the classes this Box can build (a list of classes is converted)
     items: created Items 
+    index: dict wid -> Item, Items of this Box
+    registry: dict wid -> list of Items, shared by all Boxes of WD (first Box loaded first in list)
+    config: Config compiling the configuration files, shared by all Boxes of WD
+    _digest: fingerprint of the settings of all Items when they were loaded/saved, to save only changed Boxes
     """
 
-    def __init__(self, item_file, item_class_collection):
+    def __init__(self, item_file, item_class_collection, registry = None, config = None):
         """ ... """
         self.item_file = item_file
         self.item_class_collection = item_class_collection
+        if type(item_class_collection).__name__ != "ClassCollection": self.item_class_collection = ClassCollection(classes = {iclass.__name__: iclass for iclass in item_class_collection})
         self.items = []
+        self.index = {}
+        self.registry = registry if registry != None else {}
+        self.config = config if config != None else Config()
+        self.config.register(self)
+        self._digest = None
 
     def load_items(self):
-        """ it allows to read configuration file xxxx.yaml to create Items and load Item.settings"""
-        yaml_file = open(f"data/{self.item_file}","r")
-        yaml_list = yaml.safe_load(yaml_file)
-        yaml_file.close()
-        for iclass in self.item_class_collection:
-            for i_yaml in yaml_list:
-                if i_yaml["class"] == iclass.__name__ and i_yaml["settings"]["enable"] :
-                    item_temp = iclass()
-                    item_temp.wid = i_yaml["wid"]
-                    item_temp.update_settings(i_yaml["settings"])
-                    self.items.append(item_temp)
+        """
+        it allows to create Items from the compiled configuration file xxxx.yaml and load Item.settings (Items are created in class collection order).
+        Only classes used in the file are imported, entries of a class that can not be imported are skipped
+        """
+        entries_by_class = {}
+        for ientry in self.config.get_entries(self.item_file): entries_by_class.setdefault(ientry["class"], []).append(ientry) # single pass, file order is kept
+        for iname in self.item_class_collection.get_names():
+            if iname not in entries_by_class: continue
+            try: iclass = self.item_class_collection.get(iname)
+            except ImportError as error:
+                print(f"\n>> INFO : class {iname} can not be imported, its Items are not created ({error})")
+                continue
+            for ientry in entries_by_class[iname]:
+                item_temp = iclass()
+                item_temp.wid = ientry["wid"]
+                item_temp.update_settings(ientry["settings"])
+                self.add_item(item_temp)
+        self._digest = self._get_digest(self.get_document()) # settings as loaded, save_items() only writes changes
     
-    def save_items(self):
-        """ it allows to save the configuration from Item.settings to configuration file"""
-        item_temp = {}
-        list_temp = []
-        yaml_file = open(f"data/{self.item_file}","w")
-        for iitem in self.items:            
-            item_temp["class"] = iitem.__class__.__name__
-            item_temp["wid"] = iitem.wid
-            item_temp["settings"] = iitem.settings
-            list_temp.append(copy(item_temp))
-        yaml.dump(list_temp, yaml_file, sort_keys = False)
-        yaml_file.close()
+    def save_items(self, force = False):
+        """
+        it allows to save the configuration from Item.settings to configuration file, only if settings changed since
+        they were loaded/saved (or force). The file is written in a temporary file, synced then renamed: a crash never
+        leaves a truncated file. True is sent back if the file has been written
+        """
+        list_temp = self.get_document()
+        digest = self._get_digest(list_temp)
+        if not force and digest != None and digest == self._digest: return False
+        path = self.config.get_path(self.item_file)
+        with open(f"{path}.tmp", "w") as yaml_file:
+            yaml.dump(list_temp, yaml_file, Dumper = YAML_DUMPER, sort_keys = False)
+            yaml_file.flush()
+            os.fsync(yaml_file.fileno())
+        os.replace(f"{path}.tmp", path)
+        if hasattr(os, "O_DIRECTORY"): # rename is durable once the directory is synced (posix)
+            directory = os.open(os.path.dirname(path), os.O_RDONLY | os.O_DIRECTORY)
+            try: os.fsync(directory)
+            finally: os.close(directory)
+        self._digest = digest
+        self.config.invalidate()
         print(f"\n>> INFO: Item settings on {self.item_file} saved")
+        return True
+
+    def get_document(self):
+        """ sendback the content of the configuration file, a list of {class, wid, settings}. Settings are copied, Items can change while file is written """
+        return [{"class": iitem.__class__.__name__, "wid": iitem.wid, "settings": copy(iitem.settings)} for iitem in list(self.items)]
+
+    def _get_digest(self, document):
+        """ fingerprint of a document to detect changes, None if it can not be computed (then Box is always saved) """
+        try: return hashlib.sha1(pickle.dumps(document, protocol = pickle.HIGHEST_PROTOCOL)).digest()
+        except (pickle.PicklingError, TypeError, AttributeError): return None
 
-    # def add_item(self, wid, settings, class_type):
-    #     pass
+    def add_item(self, item):
+        """ add an Item to Box and to the registry, an Item with the same wid in this Box is replaced """
+        if item.wid in self.index: self.remove_item(item.wid)
+        self.items.append(item)
+        self.index[item.wid] = item
+        self.registry.setdefault(item.wid, []).append(item)
 
-    # def remove_item(self, wid):
-    #     pass
+    def remove_item(self, wid):
+        """ remove an Item from Box and from the registry """
+        item = self.index.pop(wid, None)
+        if item == None: return
+        self.items.remove(item)
+        self.registry[wid].remove(item)
+        if len(self.registry[wid]) == 0: self.registry.pop(wid)
 
     def setup_items(self, wd):
-        """ setup all items listed"""
-        for iitem in self.items: iitem.setup(wd)
+        """ setup all items listed, a dict wid -> setup duration in seconds is sent back """
+        timings = {}
+        for iitem in self.items:
+            time_start = perf_counter()
+            iitem.setup(wd)
+            timings[iitem.wid] = perf_counter() - time_start
+        return timings
 
     def start_items(self):
         """ start all items listed"""
@@ -148,8 +359,5 @@ class Box():
         for iitem in self.items: iitem.stop()
     
     def get_item(self, wid):
-        """ sendback a pointer to a specific Item"""
-        if wid != None:
-            for iitem in self.items: 
-                if iitem.wid == wid: return iitem
-        return Item()    
\ No newline at end of file
+        """ sendback a pointer to a specific Item, NULL_ITEM if it is not found """
+        return self.index.get(wid, NULL_ITEM)
\ No newline at end of file
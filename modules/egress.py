@@ -0,0 +1,128 @@
+from collections import deque
+from threading import Lock
+import asyncio
+
+
+"""
+egress.py:
+This file contains the Egress class, the outgoing pipeline of chat Nodes (Discord): messages are merged,
+sent by priority and paced by the rate limit of the service instead of a fixed tick
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class Egress():
+    """
+    Egress queues outgoing messages from any thread, a single coroutine (run) sends them as soon as the channel
+    accepts them. Pending messages are merged into as few messages as the size limit allows, high priority first.
+    Pacing comes from the channel: channel.send() waits for the rate limit (discord.py follows the X-RateLimit
+    headers), an error with status 429 is retried after its retry_after. The queue is bounded in characters: when
+    it is full the oldest normal messages are dropped (high ones only by a high one) and a notice is sent instead
+
+    limit: max characters by message sent (2000 for Discord)
+    capacity: max pending characters (10 Discord messages by default, about 10 s at the Discord channel rate)
+    _queues: dict priority -> deque of pending messages (str)
+    _size: pending characters
+    _dropped: messages dropped since the last notice
+    _loop: event loop running run(), None until it is started
+    _event: asyncio event set when a message is queued
+    stats: queued, merged (queued messages sent), sent (messages sent to the channel), dropped, retries, errors
+    """
+
+    PRIORITIES = ("high", "normal") # send order
+
+    def __init__(self, limit = 2000, capacity = 20000):
+        """ ... """
+        self.limit = limit
+        self.capacity = capacity
+        self._queues = {ipriority: deque() for ipriority in self.PRIORITIES}
+        self._lock = Lock()
+        self._size = 0
+        self._dropped = 0
+        self._loop = None
+        self._event = None
+        self.stats = {"queued": 0, "merged": 0, "sent": 0, "dropped": 0, "retries": 0, "errors": 0}
+
+    def put(self, msg, priority = "normal"):
+        """ queue a message (any thread), the number of messages dropped because the queue is full is sent back (older ones or msg itself) """
+        if priority not in self._queues: priority = "normal"
+        msg = str(msg)
+        dropped = 0
+        with self._lock:
+            while self._size + len(msg) > self.capacity: # backpressure
+                if len(self._queues["normal"]) > 0: victims = self._queues["normal"] # oldest informational message
+                elif priority == "high" and len(self._queues["high"]) > 0: victims = self._queues["high"] # queue full of alerts, oldest alert
+                else: victims = None
+                dropped += 1
+                self._dropped += 1
+                self.stats["dropped"] += 1
+                if victims == None: return dropped # msg is the one dropped
+                self._size -= len(victims.popleft())
+            self._queues[priority].append(msg)
+            self._size += len(msg)
+            self.stats["queued"] += 1
+        self._wake()
+        return dropped
+
+    def get_batch(self):
+        """ pop pending messages merged into one text of at most limit characters, None if nothing is pending. A message longer than limit is split """
+        with self._lock:
+            parts = []
+            length = 0
+            if self._dropped > 0:
+                parts.append(f"... {self._dropped} messages dropped")
+                length = len(parts[0])
+                self._dropped = 0
+            for ipriority in self.PRIORITIES:
+                queue = self._queues[ipriority]
+                while len(queue) > 0:
+                    msg = queue[0]
+                    if length + len(msg) + len(parts) > self.limit: # parts are joined by "\n"
+                        if len(parts) > 0: return "\n".join(parts)
+                        cut = msg.rfind("\n", 0, self.limit) + 1 or self.limit # split a long message on a line if possible
+                        queue[0] = msg[cut:]
+                        self._size -= cut
+                        return msg[:cut]
+                    parts.append(queue.popleft())
+                    length += len(msg)
+                    self._size -= len(msg)
+                    self.stats["merged"] += 1
+            return "\n".join(parts) if len(parts) > 0 else None
+
+    def get_stats(self):
+        """ ... """
+        with self._lock: return dict(self.stats) | {ipriority: len(iqueue) for ipriority, iqueue in self._queues.items()}
+
+    async def run(self, channel):
+        """ send pending messages to channel (any object with a coroutine send(str)), it never returns """
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop() # published last, _wake() uses _event as soon as _loop is set
+        while True:
+            self._event.clear()
+            text = self.get_batch()
+            if text == None: await self._event.wait()
+            else: await self._send(channel, text)
+
+    async def _send(self, channel, text):
+        """ send text, retried while the channel answers with a rate limit (429) """
+        while True:
+            try:
+                await channel.send(text)
+                self.stats["sent"] += 1
+                return
+            except Exception as error:
+                retry_after = getattr(error, "retry_after", None)
+                if getattr(error, "status", None) == 429 and retry_after != None:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(retry_after)
+                    continue
+                self.stats["errors"] += 1
+                print(f"\n>> INFO : message could not be sent ({error})")
+                return
+
+    def _wake(self):
+        """ wake up run() from any thread """
+        loop, event = self._loop, self._event
+        if loop == None or event == None: return
+        try: loop.call_soon_threadsafe(event.set)
+        except RuntimeError: pass # loop is closed
@@ -1,4 +1,6 @@
-from copy import copy
+from datetime import datetime
+from threading import Lock
+import time
 
 from .items import ItemElement
 from .tools import Rqt
@@ -13,9 +15,39 @@ This file cotains all the implementation classes of Elements
 #----------------------------------------------------------------------------------------------
 class ElementMqttDevice(ItemElement):
     """
-    ElementMqttDevice implements a type of Element use it to communicate on mqtt with external devices
+    ElementMqttDevice implements a type of Element use it to communicate on mqtt with external devices.
+    Ingress policies can suppress incoming messages (status is not updated and no request is created, only
+    last_time_connexion is refreshed), to reduce the load of devices reporting every few seconds (power, temperature).
+    They should not be used with devices sending events (buttons), a repeated event is not a change
+
+    _last_forward: time.monotonic() of the last message not suppressed
+    _pending: last message suppressed by ingress_min_interval while it changes a feature, handled again when the interval expires
+    _pending_handle: SchedulerHandle of the pending message, None if there is no pending message
+    settings:
+        - keep_unmapped: parameters of incoming messages without local name (not in features) are also stored in status
+        - ingress_change_only: messages that do not change any feature are suppressed
+        - ingress_deadband: dict feature (local name) -> threshold, a numeric change smaller than threshold is not a change
+        - ingress_min_interval: seconds, a message is suppressed if the last one was forwarded less than ingress_min_interval
+          seconds ago, unless it changes a feature without deadband (ex. onoff, occupancy). A suppressed change is not lost,
+          the last one is forwarded when the interval expires. 0 to disable
     """
 
+    __slots__ = ("_last_forward", "_pending", "_pending_handle", "_ingress_lock")
+
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self._last_forward = None
+        self._pending = None
+        self._pending_handle = None
+        self._ingress_lock = Lock()
+        self.settings = self.settings | {
+            "keep_unmapped": True,
+            "ingress_change_only": False,
+            "ingress_deadband": {},
+            "ingress_min_interval": 0
+        }
+
     def handle_in(self, msg = {}, option = {}):
         """ this method handle incomming messages """
         msg_temp = None
@@ -31,8 +63,45 @@ class ElementMqttDevice(ItemElement):
             msg_temp.pop("target")
         else : target_temp = "wilddog"
 
-        self.update_features(msg_temp) # update element status with incoming message information
-        self.wd.set_rqt(Rqt(sender = self, target = self.wd.get_item(target_temp), command = command_temp, msg = msg_temp)) # submit request
+        if self.settings["keep_unmapped"]: status_temp = msg_temp
+        else: status_temp = {iparameter: ivalue for iparameter, ivalue in msg_temp.items() if iparameter in self.features_output} # linkquality, voltage... are not stored
+        if command_temp == None and (self.settings["ingress_change_only"] or self.settings["ingress_min_interval"] > 0) and self._is_suppressed(status_temp, msg): # commands are never suppressed
+            self.update_status({"last_time_connexion": datetime.now()}) # device is alive, nothing else to do
+            self.wd.metrics.count("msg_suppressed", self.wid)
+            return
+        delta = self.update_features(status_temp) # update element status with incoming message information
+        self.wd.set_rqt(Rqt(sender = self, target = self.wd.get_item(target_temp), command = command_temp, msg = msg_temp, delta = delta)) # submit request
+
+    def _is_suppressed(self, status, msg):
+        """ ingress policies, True if status (local names) has to be suppressed. msg (external names) is kept if it is a change suppressed by ingress_min_interval """
+        deadband = self.settings["ingress_deadband"]
+        changes = []
+        for iparameter, ivalue in status.items():
+            old_value = self.status.get(iparameter)
+            threshold = deadband.get(iparameter)
+            try: changed = ivalue != old_value if threshold == None or old_value == None else abs(ivalue - old_value) >= threshold
+            except TypeError: changed = ivalue != old_value # not numeric
+            if changed: changes.append(iparameter)
+        with self._ingress_lock:
+            time_now = time.monotonic()
+            if self.settings["ingress_change_only"] and len(changes) == 0: return True
+            remaining = 0 if self._last_forward == None else self.settings["ingress_min_interval"] - (time_now - self._last_forward)
+            if remaining > 0 and all(iparameter in deadband for iparameter in changes):
+                if len(changes) > 0 or self._pending != None: # the last message wins, it is handled again when the interval expires
+                    self._pending = msg
+                    if self._pending_handle == None: self._pending_handle = self.wd.scheduler.call_later(remaining, self._handle_pending)
+                return True
+            self._last_forward = time_now
+            if self._pending_handle != None: self._pending_handle.cancel() # this message is more recent than the pending one
+            self._pending, self._pending_handle = None, None
+            return False
+
+    def _handle_pending(self):
+        """ called by Scheduler when ingress_min_interval expires, the pending message goes through the ingress policies again """
+        with self._ingress_lock:
+            msg = self._pending
+            self._pending, self._pending_handle = None, None
+        if msg != None: self.handle_in(msg = msg)
 
     def handle_out(self, msg = {}, option = {}):
         """ This method adapt the outcoming message to the specific Node """
@@ -44,7 +113,7 @@ class ElementMqttDevice(ItemElement):
         """ First, Element try to execute command using a common command (on super() class), if not, it will use specific commands """
         if super().execute_rqt(rqt_in): return 
         if rqt_in.command == "set_status": # set_status is a command trying to change the status of Element, so maybe a order has to be send to the external element
-            msg = copy(rqt_in.payload)
+            msg = dict(rqt_in.payload)
             if self.settings["onoff_enable"] and "onoff" in msg: # if the request is trying to change the status onoff but this status is already updated, do not execute this command
                 if msg["onoff"] == self.status["onoff"]: msg.pop("onoff")
             self.handle_out(msg = msg) # send message
@@ -56,9 +125,10 @@ class ElementDiscord(ItemElement):
     ElementDiscord implements a type of Element use it to communicate with a discord bot
     """
 
+    __slots__ = ()
+
     def handle_in(self, msg = {}, option = {}):
         """ ... """
-        rqt_temp = Rqt()
         msg_temp = None
         target_temp = None
         command_temp = None
@@ -72,9 +142,9 @@ class ElementDiscord(ItemElement):
             msg_temp.pop("target")
         else : target_temp = "wilddog"
 
-        rqt_temp = Rqt(sender = self, target = self.wd.get_item(wid = target_temp), command = command_temp, msg = msg_temp)
+        delta = self.update_features(msg_temp)
+        rqt_temp = Rqt(sender = self, target = self.wd.get_item(wid = target_temp), command = command_temp, msg = msg_temp, delta = delta)
 
-        self.update_features(msg_temp)
         self.wd.set_rqt(rqt_temp)
         if rqt_temp.command == "hello!": self.handle_out(msg = "Hello perrito!")
 
@@ -90,23 +160,23 @@ class ElementDiscord(ItemElement):
             for ivalue in msg: msg_temp = msg_temp + f"{ivalue}\n"
         else: msg_temp = msg_temp + msg
 
-        if msg_temp != "" and self.node.wid != None: self.node.send_msg(msg_temp)
+        if msg_temp != "" and self.node.wid != None: self.node.send_msg(msg_temp, priority = option.get("priority", "normal"))
 
     def execute_rqt(self, rqt_in):
         """ ... """
         if super().execute_rqt(rqt_in): return
         if rqt_in.command == "send_alert": # This command allows Elemento to communicate about important alerts: intrusion, fire/water detection
-            msg = copy(rqt_in.payload)
+            msg = dict(rqt_in.payload)
             if "fsm_transition" in msg: 
                 msg_temp = "-"
                 if msg["fsm_transition"] == "lock": msg_temp = f"INFO : lock state transition :lock:"
                 elif msg["fsm_transition"] == "run": msg_temp = f"INFO : run state transition :white_check_mark:"
                 elif msg["fsm_transition"] == "detection": msg_temp = f"ALERT: intrution detected :no_entry:"
-                self.handle_out(msg = msg_temp)
+                self.handle_out(msg = msg_temp, option = {"priority": "high"}) # alerts are sent before replies
             if "water_detection" in msg:
                 if msg["water_detection"]: msg_temp = f"ALERT: waterleak detected :warning:"
-                self.handle_out(msg = msg_temp)
+                self.handle_out(msg = msg_temp, option = {"priority": "high"})
             if "fire_detection" in msg:
                 if msg["fire_detection"]: msg_temp = f"ALERT: fire detected :fire:"
-                self.handle_out(msg = msg_temp)
+                self.handle_out(msg = msg_temp, option = {"priority": "high"})
  
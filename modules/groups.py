@@ -9,4 +9,4 @@ This file cotains all the implementation classes of Groups
 #----------------------------------------------------------------------------------------------
 class GroupStandard(ItemGroup):
     """ GroupStandard implements a type of Group concerning all kind of Items """
-    pass
\ No newline at end of file
+    __slots__ = ()
\ No newline at end of file
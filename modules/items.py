@@ -1,10 +1,12 @@
 from datetime import datetime
-from copy import copy
-from threading import Thread
-import time
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+import asyncio
+import operator
 
+from .catalog import get_features_output
 from .containers import Item
-from .tools import Rqt
+from .tools import NULL_RQT, read_only
 
 
 """
@@ -17,31 +19,55 @@ This file contains father classes for every kind of Item (Group, Elements, Node,
 class ItemSystem(Item):
     """
     ItemSystem defines run() method and the execution of FSM
+
+    loop: asyncio event loop owned by WD in asyncio runtime, None in threads runtime
     """
     
     def __init__(self):
         """ ... """
         super().__init__()
         self.wtype = "system"
-
-    def run(self):
-        """ This is the main routine of WD, responsible to execute the FSM"""
+        self.loop = None
+
+    def run(self, runtime = "threads"):
+        """ 
+        This is the main routine of WD, responsible to execute the FSM. 
+        runtime "threads": FSM runs here, every Node and Timer has its own thread
+        runtime "asyncio": a single event loop hosts FSM, Nodes and Timers
+        """
         print(f"\n----- WILDDOG v0.100 -----\n")
+        if runtime == "asyncio":
+            asyncio.run(self._run_async())
+            return
+        self.scheduler.start()
         while(1):
             self.fsm.do()   # performe actions for the current state
             self.fsm.calculate()    # calculate next state
-            self.fsm.make_transition()  # make transition to next state if needed   
+            self.fsm.make_transition()  # make transition to next state if needed
+            self.fsm.wait() # sleep until a new request or the timeout of the current state
+
+    async def _run_async(self):
+        """ FSM routine for the asyncio runtime, Items started by the FSM create their tasks in this loop """
+        self.loop = asyncio.get_running_loop()
+        self.rqt_buffer.bind_loop(self.loop)
+        self.scheduler.start(loop = self.loop)
+        while(1):
+            self.fsm.do()
+            self.fsm.calculate()
+            self.fsm.make_transition()
+            await self.fsm.wait_async()
 
 #----------------------------------------------------------------------------------------------
 class ItemTimer(Item):
     """
-    ItemTimer defines the base configuration for timer including the thread object setup
+    ItemTimer defines the base configuration for timer, check() is executed periodically by the WD Scheduler
 
     time_day: sunrise time
     time_night: sunset time
-    _timer_thread: object to load thread 
+    _timer_handle: Scheduler handle of the periodic check()
     settings:
         - period : prediod of main routine check()
+        - jitter : max random delay (seconds) added to every check(), to spread Timers with the same period
     """
     def __init__(self):
         """ ... """
@@ -49,36 +75,34 @@ class ItemTimer(Item):
         self.wtype = "timer"
         self.time_day = None
         self.time_night = None
-        self._timer_thread = None
+        self._timer_handle = None
 
         self.settings = self.settings | {
-            "period": None
+            "period": None,
+            "jitter": 0
         } 
 
     def setup(self, wd):
-        """ initialize variables and point _timer_thread to _launch_thread"""
+        """ initialize variables """
         super().setup(wd)
         self.time_day = "08:30:00"
         self.time_night = "17:00:00"
-        self._timer_thread = Thread(target=self._launch_thread,daemon=True)
 
     def start(self):
-        """ start check() """
-        self._timer_thread.start()
+        """ start check(), first execution is immediate """
+        self._timer_handle = self.wd.scheduler.call_every(self.settings["period"], self._launch_check, jitter = self.settings["jitter"], delay = 0)
     
     def stop(self):
         """ stop check() """
-        self._timer_thread.stop()
+        if self._timer_handle != None: self._timer_handle.cancel()
 
     def check(self, *arg, **kwarg):
         """ it contains the main periodic routine """
         pass  
 
-    def _launch_thread(self):
-        """ this method just define the periodic execution of check()"""
-        while True:
-            if self.settings["enable"]: self.check()
-            time.sleep(self.settings["period"]) 
+    def _launch_check(self):
+        """ this method is called by the Scheduler every period """
+        if self.settings["enable"]: self.check()
 
 
 #----------------------------------------------------------------------------------------------
@@ -87,7 +111,9 @@ class ItemElement(Item):
     ItemElement defines the base method to handle incoming and outcoming messages for Elements. Also the base
     status parameters
 
-    features: describes the relationship between external name parameters and local name parameters (to Wilddog)
+    features: describes the relationship between external name parameters and local name parameters (to Wilddog),
+        class attribute shared by every Element of a class (see catalog.py), it must not be modified
+    features_output: reverse map of features, local name -> tuple of external names, computed when the class is created
     node: points to the Node that Element use to communicate externally
     settings:
         - onoff_enable: Element can be turned on/off
@@ -102,11 +128,15 @@ class ItemElement(Item):
         - last_time_interaction : last time when someone sent a message to Element
     """
 
+    __slots__ = ("node",)
+
+    features = {}
+    features_output = {}
+
     def __init__(self):
         """ ... """
         super().__init__()
         self.wtype = "element"
-        self.features = {}
         self.node = None
 
         self.settings = self.settings | {
@@ -144,26 +174,40 @@ class ItemElement(Item):
         self.node = self.wd.get_item(wid = self.settings["node"], box = "nodes")
         if self.node.wid == None: self.status["error_buffer"].append("node_failed")
 
+    def __init_subclass__(cls, **kwargs):
+        """ a subclass declaring its own features gets its reverse map """
+        super().__init_subclass__(**kwargs)
+        if "features" in cls.__dict__ and "features_output" not in cls.__dict__: cls.features_output = get_features_output(cls.features)
+
+    def update_settings(self, new_settings):
+        """ the Node pointer follows the node setting once Element is settled (a Node can adopt an Element), status is kept """
+        super().update_settings(new_settings)
+        if "node" in new_settings and self.wd != None: self.node = self.wd.get_item(wid = self.settings["node"], box = "nodes")
+
     def update_features(self, msg):
-        """ this method is used to update status of Element using the last message comming from Node """
+        """ this method is used to update status of Element using the last message comming from Node, status changes are sent back """
         time_now = datetime.now()
-        msg_temp = copy(msg)
+        msg_temp = dict(msg)
         if self.settings["onoff_enable"] and "onoff" in msg_temp:
             if self.status["onoff"] != "ON" and msg_temp["onoff"] == "ON": msg_temp["last_time_on"] = time_now
             if self.status["onoff"] != "OFF" and msg_temp["onoff"] == "OFF": msg_temp["last_time_off"] = time_now
-        self.update_status(msg_temp | {"last_time_connexion":time_now})
+        return self.update_status(msg_temp | {"last_time_connexion":time_now})
     
     def replace_features(self, msg = {}, replace_type = None):
         """ replace external name parameter to local name parameter or viceversa """
         msg_temp = {}
-        for iparameter, ivalue in msg.items():
-            if replace_type == "input" and iparameter in self.features:
-                msg_temp[self.features[iparameter]] = ivalue
-            elif replace_type == "output" and iparameter in [jvalue for jfeature, jvalue in self.features.items()]:
-                for jfeature, jvalue in self.features.items():
-                    if iparameter == jvalue: msg_temp[jfeature] = ivalue
-            else: msg_temp[iparameter] = ivalue
-        return msg_temp            
+        if replace_type == "input":
+            features = self.features
+            for iparameter, ivalue in msg.items(): msg_temp[features.get(iparameter, iparameter)] = ivalue
+        elif replace_type == "output":
+            features_output = self.features_output
+            for iparameter, ivalue in msg.items():
+                external_names = features_output.get(iparameter)
+                if external_names == None: msg_temp[iparameter] = ivalue
+                else:
+                    for jfeature in external_names: msg_temp[jfeature] = ivalue
+        else: msg_temp = dict(msg)
+        return msg_temp
 
 
 #----------------------------------------------------------------------------------------------
@@ -173,27 +217,52 @@ class ItemRule(Item):
 
     sender: Pointer to Item who creates the request to validate
     target: Pointer to Item responsible to execute the request to validate
+    _conditions: compiled conditions, list of predicates predicate(rqt_in) -> bool
+    _subscriptions: list of (Item, feature, callback) watched by edge conditions on other Items
     settings:
         - sender: name of sender
         - target: name of target
-        - condition: contains the conditions to validate the request
+        - condition: contains the conditions to validate the request, every condition is {item, feature, operator, value}
+            - operators =, !=, >, < : compare feature with value
+            - operator in : feature is in value (list), between : feature is between value[0] and value[1] (included)
+            - operators changed, rising, falling : edge conditions. With this_item they use the changes of sender status
+              sent in request (Rqt.delta), otherwise the last change of the Item status if it is not older than edge_window.
+              rising/falling: feature becomes value (or leaves it), if value is null feature increases (or decreases)
         - command: task to execute by the target
         - payload: additional information used to execute the command
+        - edge_window: seconds during which the last change of an Item other than sender is seen by edge conditions
     """
 
+    __slots__ = ("sender", "target", "_conditions", "_subscriptions", "_payload")
+
+    OPERATORS = {
+        "=": operator.eq,
+        "!=": operator.ne,
+        ">": operator.gt,
+        "<": operator.lt,
+        "in": lambda x, y: type(y).__name__ in ("list", "tuple", "set", "frozenset") and x in y, # a string value is not a list of substrings
+        "between": lambda x, y: y[0] <= x <= y[1]
+    }
+
+    EDGE_OPERATORS = ("changed", "rising", "falling")
+
     def __init__(self):
         """ ... """
         super().__init__()
         self.wtype = "rule"
         self.sender = None
         self.target = None
+        self._conditions = []
+        self._subscriptions = []
+        self._payload = read_only({})
 
         self.settings = self.settings | {
             "sender": None,
             "target": None,
             "condition": [],
             "command": None,
-            "payload": {}
+            "payload": {},
+            "edge_window": 5
         }
 
     def setup(self, wd):
@@ -207,53 +276,93 @@ class ItemRule(Item):
         if self.sender.wid == None: 
             self.status["error_buffer"].append("items_failed")
             self.settings["enable"] = False
+        self._compile_conditions()
+        self._payload = read_only(self.settings["payload"]) # shared by every Rqt derived by this Rule, Items can not modify the configuration
+        self.wd.reset_rule_index() # sender may have changed, dispatch index has to be rebuilt
+
+    def update_settings(self, new_settings):
+        """ conditions have to be compiled again if they change once Rule is settled """
+        super().update_settings(new_settings)
+        if "condition" in new_settings and self.wd != None: self._compile_conditions()
+        if "payload" in new_settings: self._payload = read_only(self.settings["payload"])
 
     def check(self, rqt_in):
         """ this method is responsible to evaluate a incomming requests and modify the request if necessary"""
-        rqt_out = Rqt()
-        condition_ok = True
         if self.settings["enable"] and (self.sender == rqt_in.sender or self.sender.wid in rqt_in.sender.settings["group"]): # is sender in request the same of the rule or share they the same group? this will trigger the condition evaluation
             # CONDITIONS
-            for icondition in self.settings["condition"]:
-                condition_temp = False
-                if icondition["item"] == "this_item": # "this_item" means the condition must be evaluated using the local status of Sender, otherwise the Item idicated
-                    msg_temp = rqt_in.msg
-                    condition_temp = self._evaluate_condition(icondition, msg_temp) # submit the evaluation of condition once the item and its status are stablished
-                else:     
-                    element_temp = self.wd.get_item(wid = icondition["item"]) 
-                    if element_temp.wid != None:
-                        msg_temp = element_temp.status
-                        condition_temp = self._evaluate_condition(icondition, msg_temp)
-                    else:
-                        condition_temp = False
-                condition_ok = condition_ok and condition_temp # all conditions in the Rule must to be True to validate the Rule
-            #REPLACE RQT
-            if condition_ok: # if all conditions are okay, the final request must be settled, using first the parameters in the Rulem if not defined, use so those in the original request 
-                rqt_out = copy(rqt_in)
-                if self.settings["target"] != None: rqt_out.target = self.target 
-                if self.settings["target"] == "this_item": rqt_out.target = rqt_out.sender
-                if self.settings["command"] != None: rqt_out.command = self.settings["command"]
-                if self.settings["payload"] != {}: rqt_out.payload = self.settings["payload"]
-                else: rqt_out.payload = rqt_in.msg
-        return rqt_out
-
-    def _evaluate_condition(self, condition, msg):
-        """ this method evaluate a single condition, checking a single feature in the incoming message"""
-        condition_ok = False
+            for icondition in self._conditions: # all conditions in the Rule must to be True to validate the Rule, stop at the first False
+                if not icondition(rqt_in): return NULL_RQT
+            #DERIVE RQT : all conditions are okay, the final request must be settled, using first the parameters in the Rulem if not defined, use so those in the original request (msg and sender are shared, not copied)
+            target = rqt_in.target
+            if self.settings["target"] != None: target = self.target 
+            if self.settings["target"] == "this_item": target = rqt_in.sender
+            command = self.settings["command"] if self.settings["command"] != None else rqt_in.command
+            payload = self._payload if self.settings["payload"] != {} else rqt_in.msg
+            return rqt_in.derive(target = target, command = command, payload = payload)
+        return NULL_RQT
+
+    def _compile_conditions(self):
+        """ compile all conditions, subscriptions of previous conditions are cancelled """
+        for iitem, ifeature, icallback in self._subscriptions: self.wd.unsubscribe(iitem.wid, ifeature, icallback)
+        self._subscriptions = []
+        self._conditions = [self._compile_condition(icondition) for icondition in self.settings["condition"]]
+
+    def _compile_condition(self, condition):
+        """ this method compiles a single condition into a predicate, checking a single feature in the incoming message (this_item) or in the status of the Item indicated """
         feature = condition["feature"]
-        if feature in msg:
-            value = condition["value"]
-            operator = condition["operator"]
-            try:
-                if msg[feature] == value and operator == "=": condition_ok = True
-                elif msg[feature] != value and operator == "!=": condition_ok = True
-                elif msg[feature] > value and operator == ">": condition_ok = True
-                elif msg[feature] < value and operator == "<": condition_ok = True 
-            except:
-                condition_ok = False       
-        else:
-            condition_ok = False
-        return condition_ok 
+        value = condition["value"]
+        compare = self.OPERATORS.get(condition["operator"])
+        item_temp = None
+        if condition["item"] != "this_item": # "this_item" means the condition must be evaluated using the message of request, otherwise the status of Item idicated
+            item_temp = self.wd.get_item(wid = condition["item"])
+            if item_temp.wid == None: return lambda rqt_in: False
+        if condition["operator"] in self.EDGE_OPERATORS: return self._compile_edge(condition, item_temp)
+        if compare == None: return lambda rqt_in: False
+
+        def predicate(rqt_in):
+            msg = rqt_in.msg if item_temp == None else item_temp.status
+            if feature not in msg: return False
+            try: return compare(msg[feature], value)
+            except (TypeError, IndexError): return False
+        return predicate
+
+    def _compile_edge(self, condition, item):
+        """ compile an edge condition, the last change of an Item other than sender is recorded by subscription with its time """
+        feature = condition["feature"]
+        value = condition.get("value")
+        edge = self._get_edge(condition["operator"], value)
+
+        if item == None:
+            def predicate(rqt_in):
+                if feature not in rqt_in.delta: return False
+                old_value, new_value = rqt_in.delta[feature]
+                return edge(old_value, new_value)
+            return predicate
+
+        changes = {} # old, new, time of the last change. Written by the thread of the Item, read by every evaluation (not consumed)
+        lock = Lock()
+        def on_change(item_in, feature_in, old_value, new_value):
+            with lock: changes.update({"old": old_value, "new": new_value, "time": monotonic()})
+        self.wd.subscribe(item.wid, feature, on_change)
+        self._subscriptions.append((item, feature, on_change))
+
+        def predicate(rqt_in):
+            with lock:
+                if "new" not in changes: return False
+                if monotonic() - changes["time"] > self.settings["edge_window"]: return False
+                old_value, new_value = changes["old"], changes["new"]
+            return old_value != new_value and edge(old_value, new_value)
+        return predicate
+
+    def _get_edge(self, operator_name, value):
+        """ sendback edge(old_value, new_value) -> bool """
+        if operator_name == "changed": return lambda old_value, new_value: True
+        rising = operator_name == "rising"
+        if value != None: return lambda old_value, new_value: (new_value == value and old_value != value) if rising else (old_value == value and new_value != value)
+        def edge(old_value, new_value):
+            try: return old_value < new_value if rising else old_value > new_value
+            except TypeError: return False
+        return edge
 
 
 #----------------------------------------------------------------------------------------------
@@ -262,9 +371,13 @@ class ItemNode(Item):
     ItemNode defines the base methods to create a Node, including the configuration of thread
 
     elements: pointers to the Items menbers
+    sid_elements: dict sid -> list of Element members using this sid (several Elements can share a device)
     _node_thread: object to load thread 
+    _node_task: asyncio task running the Node in asyncio runtime
+    _time_start: perf_counter() when Node was started, None once it is connected
     settings:
         - elements: Element names list
+        - connect_timeout: seconds after start, an error is reported if Node is not started yet (it keeps trying)
     status:
         - started: indicate if Node has been correctly started
     """
@@ -274,16 +387,21 @@ class ItemNode(Item):
         super().__init__()
         self.wtype = "node"
         self.elements = []
+        self.sid_elements = {}
         self._node_thread = None
+        self._node_task = None
+        self._time_start = None
 
         self.settings = self.settings | {
-            "elements": []
+            "elements": [],
+            "connect_timeout": 10
         }
 
     def setup(self, wd):
         """ ... """
         super().setup(wd)
         self.elements = []
+        self.sid_elements = {}
         self._node_thread = Thread(target=self._launch_thread,daemon=True)
 
         self.update_status({
@@ -295,18 +413,32 @@ class ItemNode(Item):
             element_temp = self.wd.get_item(wid = ielement["wid"], box = "elements")
             if element_temp.wid != None: 
                 self.elements.append(element_temp)
-                element_temp.update_settings({"node":self.wid,"sid":ielement["sid"]})
-                element_temp.setup(wd)
+                self.sid_elements.setdefault(ielement["sid"], []).append(element_temp)
+                element_temp.update_settings({"node":self.wid,"sid":ielement["sid"]}) # Element points to this Node, it is not settled again
             else:
                 self.status["error_buffer"].append(f"element_failed_{ielement}")
 
     def start(self):
-        """ start Node thread """
-        self._node_thread.start()
+        """ start Node thread, or Node task in asyncio runtime. Connexion is done there, Nodes do not wait for each other """
+        self._time_start = perf_counter()
+        if self.settings["connect_timeout"] != None: self.wd.scheduler.call_later(self.settings["connect_timeout"], self._check_started)
+        if self.wd.loop != None: self._node_task = self.wd.loop.create_task(self._launch_task())
+        else: self._node_thread.start()
 
     def stop(self):
         """ stop Node thread """
-        self._node_thread.stop()
+        if self._node_task != None: self._node_task.cancel()
+        else: self._node_thread.stop()
+
+    def update_status(self, new_status):
+        """ FSM is waiting for Nodes to be started, it has to be woken up when it happens """
+        delta = super().update_status(new_status)
+        if "started" in new_status and self.wd != None:
+            if new_status["started"] == True and self._time_start != None: # connexion time, from start to first connexion
+                self.wd.metrics.observe("connect", self.wid, perf_counter() - self._time_start)
+                self._time_start = None
+            self.wd.wake_rqt()
+        return delta
 
     def set_msg(self, *arg, **kwarg):
         """ This method is used to handle all new incoming message"""
@@ -320,6 +452,16 @@ class ItemNode(Item):
         """ This method is used to start the Node"""
         pass
 
+    async def _launch_task(self):
+        """ This method is used to start the Node in asyncio runtime, Nodes without native support run _launch_thread in a worker thread """
+        await asyncio.to_thread(self._launch_thread)
+
+    def _check_started(self):
+        """ called by the Scheduler connect_timeout seconds after start """
+        if self.status["started"] != True:
+            print(f"\n>> INFO : node {self.wid} is not connected after {self.settings['connect_timeout']} s")
+            self.status["error_buffer"].append("connexion_timeout")
+
 
 #----------------------------------------------------------------------------------------------
 class ItemGroup(Item):
@@ -327,38 +469,75 @@ class ItemGroup(Item):
     ItemGroup defines the methods to configurate Groups
 
     elements: pointers to the Items menbers
+    node: points to the Node used to send group messages, only if the Group exists on the external service
     settings:
         - elements: Element names list
+        - node: node name, if the Group is also a zigbee2mqtt group
+        - sid: group name/id that Node will use in external services (zigbee2mqtt group friendly name)
     """
 
+    __slots__ = ("elements", "node")
+
     def __init__(self):
         """ ... """
         super().__init__()
         self.wtype = "group"
         self.elements = []
+        self.node = None
 
         self.settings = self.settings | {
-            "elements": []
+            "elements": [],
+            "node": None,
+            "sid": None
         } 
 
     def setup(self, wd):
         """ ... """
         super().setup(wd)
         self.elements = []
+        self.node = self.wd.get_item(wid = self.settings["node"], box = "nodes")
+        if self.settings["node"] != None and self.node.wid == None: self.status["error_buffer"].append("node_failed")
         for ielement in self.settings["elements"]: # load pointers to every Element menber
             element_temp = self.wd.get_item(wid = ielement)
             if element_temp.wid != None and element_temp.settings["enable"]:   
                 self.elements.append(element_temp)
-                if not self.wid in element_temp.settings["group"]: 
+                if not self.wid in element_temp.settings["group"]: # membership is a setting, Element is not settled again
                     element_temp.update_settings({"group": element_temp.settings["group"]+[self.wid]})
-                    element_temp.setup(wd)
             else:
                 self.status["error_buffer"].append(f"element_failed_{ielement}")
+        self.wd.reset_rule_index()
     
     def execute_rqt(self, rqt_in):
         """ ... """
         if "grouptarget" in rqt_in.payload : # if parameter "grouptarget" is present in the payload, it means the command goes to the Group itself and not its menbers
             super().execute_rqt(rqt_in) 
+        elif rqt_in.command == "set_status" and self.settings["sid"] != None and self.node.wid != None:
+            self._set_group_status(rqt_in)
         else:
             for ielement in self.elements: ielement.execute_rqt(rqt_in)
+
+    def _set_group_status(self, rqt_in):
+        """ 
+        set_status for a Group existing on the external service: menbers already in the requested status are skipped, 
+        if all the others share the Group Node and the same outgoing message a single group message is sent
+        """
+        time_now = datetime.now()
+        pending = []
+        for ielement in self.elements:
+            if all(ifeature in ielement.status and ielement.status[ifeature] == ivalue for ifeature, ivalue in rqt_in.payload.items()):
+                ielement.update_status({"last_time_interaction": time_now}) # nothing to send, but it is still an interaction
+            else: pending.append(ielement)
+
+        msg_out = None
+        for ielement in pending:
+            if getattr(ielement, "node", None) != self.node: break
+            msg_temp = ielement.replace_features(msg = rqt_in.payload, replace_type = "output")
+            if msg_out == None: msg_out = msg_temp
+            elif msg_out != msg_temp: break
+        else: # every pending menber can be reached by the group message
+            if len(pending) > 1 and msg_out != {}:
+                for ielement in pending: ielement.update_status({"last_time_interaction": time_now})
+                self.node.send_msg(sid = self.settings["sid"], msg_type = "set", msg = msg_out)
+                return
+        for ielement in pending: ielement.execute_rqt(rqt_in)
             
\ No newline at end of file
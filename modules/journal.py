@@ -0,0 +1,198 @@
+from collections.abc import Mapping
+from threading import Lock
+import json
+import mmap
+import os
+import struct
+import time
+
+
+"""
+journal.py:
+This file contains the request journal: an append-only record of every incoming message, derived request and FSM
+transition. Records are written in segment files with a fixed layout and read back through mmap, a record body is
+only decoded if it is selected
+"""
+
+
+SEGMENT_HEADER = struct.Struct("<4sHHQ") # magic, version, reserved, sequence
+RECORD_HEADER = struct.Struct("<dIB") # time (epoch seconds), body length, kind
+MAGIC = b"WDJ1"
+VERSION = 1
+KINDS = {"ingress": 1, "rqt": 2, "transition": 3}
+KIND_NAMES = {icode: iname for iname, icode in KINDS.items()}
+
+
+def to_json(value):
+    """ json encoding of values json does not know: read-only dicts are dicts, other values are strings (datetime...) """
+    if isinstance(value, Mapping): return dict(value)
+    return str(value)
+
+
+ENCODER = json.JSONEncoder(separators = (",", ":"), default = to_json) # built once, json.dumps() builds an encoder for every call with options
+
+
+def get_segments(path):
+    """ segment files of a journal directory, oldest first """
+    if not os.path.isdir(path): return []
+    names = sorted(iname for iname in os.listdir(path) if iname.startswith("journal_") and iname.endswith(".wdj"))
+    return [os.path.join(path, iname) for iname in names]
+
+
+#----------------------------------------------------------------------------------------------
+class Journal():
+    """
+    Journal appends records to the current segment of its directory. A segment is a header (SEGMENT_HEADER) followed by
+    records: RECORD_HEADER and a compact json body. A new segment is started when the current one would exceed
+    segment_size, the oldest segments are deleted to keep max_segments. Every record is written with one unbuffered
+    write, a crash can only truncate the last record (readers ignore it)
+
+    path: journal directory, None while the journal is closed
+    segment_size: max bytes by segment
+    max_segments: segments kept on disk
+    _file: current segment (raw file), None while the journal is closed
+    _size: bytes written in the current segment
+    _sequence: number of the current segment, segments are named journal_<sequence>.wdj
+    stats: records written, bytes written, segments created, errors
+    """
+
+    def __init__(self, segment_size = 4 * 1024 * 1024, max_segments = 8):
+        """ ... """
+        self.path = None
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self._file = None
+        self._size = 0
+        self._sequence = 0
+        self._lock = Lock()
+        self.stats = {"records": 0, "bytes": 0, "segments": 0, "errors": 0}
+
+    def open(self, path, segment_size = None, max_segments = None):
+        """ start a new segment in path, segments of previous runs are kept (up to max_segments) """
+        with self._lock:
+            self._close()
+            if segment_size != None: self.segment_size = segment_size
+            if max_segments != None: self.max_segments = max_segments
+            try:
+                os.makedirs(path, exist_ok = True)
+                segments = get_segments(path)
+                self._sequence = int(os.path.basename(segments[-1])[8:-4]) if len(segments) > 0 else 0
+                self.path = path
+                self._rotate()
+            except (OSError, ValueError) as error:
+                self.path = None
+                self.stats["errors"] += 1
+                print(f"\n>> INFO : journal could not be opened in {path} ({error})")
+
+    def close(self):
+        """ ... """
+        with self._lock: self._close()
+
+    def write(self, kind, body):
+        """ append a record (any thread), body is a dict, see to_json() for values json does not know """
+        if self._file == None: return
+        data = ENCODER.encode(body).encode()
+        record = RECORD_HEADER.pack(time.time(), len(data), KINDS[kind]) + data
+        with self._lock:
+            if self._file == None: return
+            try:
+                if self._size + len(record) > self.segment_size and self._size > SEGMENT_HEADER.size: self._rotate()
+                self._file.write(record)
+            except OSError as error:
+                self.stats["errors"] += 1
+                print(f"\n>> INFO : journal is closed, a record could not be written ({error})")
+                self._close()
+                return
+            self._size += len(record)
+            self.stats["records"] += 1
+            self.stats["bytes"] += len(record)
+
+    def get_stats(self):
+        """ ... """
+        return dict(self.stats) | {"path": self.path, "sequence": self._sequence}
+
+    def _rotate(self):
+        """ close the current segment, start the next one and delete the oldest ones """
+        if self._file != None: self._file.close()
+        self._sequence += 1
+        self._file = open(os.path.join(self.path, f"journal_{self._sequence:08d}.wdj"), "wb", buffering = 0)
+        self._file.write(SEGMENT_HEADER.pack(MAGIC, VERSION, 0, self._sequence))
+        self._size = SEGMENT_HEADER.size
+        self.stats["segments"] += 1
+        for isegment in get_segments(self.path)[:-self.max_segments]:
+            try: os.remove(isegment)
+            except OSError: pass
+
+    def _close(self):
+        """ ... """
+        if self._file != None: self._file.close()
+        self._file = None
+
+
+#----------------------------------------------------------------------------------------------
+class JournalReader():
+    """
+    JournalReader maps the segments of a journal (a directory or a single segment) in memory. get_raw() does not copy
+    anything: bodies are memoryviews of the mapped files, valid until close(). Iterating decodes the bodies
+
+    paths: segment files, oldest first
+    _maps: mapped segments, kept open until close()
+    """
+
+    def __init__(self, path):
+        """ ... """
+        self.paths = get_segments(path) if os.path.isdir(path) else [path]
+        self._maps = []
+
+    def __enter__(self):
+        """ ... """
+        return self
+
+    def __exit__(self, *arg):
+        """ ... """
+        self.close()
+
+    def get_raw(self, kinds = None):
+        """ iterator of (time, kind, body memoryview), only kinds (list of names) if given. A truncated last record is ignored """
+        codes = None if kinds == None else {KINDS[ikind] for ikind in kinds}
+        for ipath in self.paths:
+            data = self._map(ipath)
+            if data == None: continue
+            offset = SEGMENT_HEADER.size
+            end = len(data)
+            while offset + RECORD_HEADER.size <= end:
+                time_record, length, code = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+                if offset + length > end: break
+                if codes == None or code in codes: yield time_record, KIND_NAMES.get(code), data[offset:offset + length]
+                offset += length
+
+    def __iter__(self):
+        """ iterator of (time, kind, body dict) """
+        for itime, ikind, ibody in self.get_raw(): yield itime, ikind, json.loads(bytes(ibody))
+
+    def read(self, kinds = None):
+        """ list of (time, kind, body dict) of kinds (list of names), every kind if None """
+        return [(itime, ikind, json.loads(bytes(ibody))) for itime, ikind, ibody in self.get_raw(kinds)]
+
+    def close(self):
+        """ unmap segments, memoryviews still referenced keep their segment mapped """
+        for iview, imap in self._maps:
+            iview.release()
+            try: imap.close()
+            except BufferError: pass
+        self._maps = []
+
+    def _map(self, path):
+        """ memoryview of a mapped segment, None if it is empty or not a journal segment """
+        with open(path, "rb") as segment_file:
+            if os.fstat(segment_file.fileno()).st_size <= SEGMENT_HEADER.size: return None
+            segment_map = mmap.mmap(segment_file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version, reserved, sequence = SEGMENT_HEADER.unpack_from(segment_map, 0)
+        if magic != MAGIC or version != VERSION:
+            segment_map.close()
+            print(f"\n>> INFO : {path} is not a journal segment, it is ignored")
+            return None
+        view = memoryview(segment_map)
+        self._maps.append((view, segment_map))
+        return view
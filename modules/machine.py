@@ -16,7 +16,7 @@ class Fsm():
 
     wd: reference to WD object
     rqt_in: contains the last valid Request to be executed
-    fsm_timeout_rqt: represents a signal to indicate to FSM that a state transition has been requested by WD
+    fsm_timeout_rqt: represents a signal to indicate to FSM that the time of the current State is finish (set by FSM itself or by WD)
     fsm_transition_rqt: represents a signal to indicate to FSM that a state transition has to be done, the time of the current State is finish
     list_state: contains all State instances
     """
@@ -48,9 +48,30 @@ class Fsm():
         self.c_state.do(rqt_temp)
 
     def calculate(self):
-        """ calculate next state """               
+        """ calculate next state """
+        timeout = self.get_timeout()
+        if timeout != None and timeout <= 0: self.fsm_timeout_rqt = True # the current State has reached its timeout
         self.c_state.calculate()
 
+    def wait(self):
+        """ block until a new request is available or the current State reaches its timeout """
+        timeout = self.get_timeout()
+        if timeout != None and timeout <= 0: return
+        self.wd.wait_rqt(timeout)
+
+    async def wait_async(self):
+        """ coroutine version of wait(), used by the asyncio runtime """
+        timeout = self.get_timeout()
+        if timeout != None and timeout <= 0: return
+        await self.wd.wait_rqt_async(timeout)
+
+    def get_timeout(self):
+        """ remaining seconds before the timeout of current State, None if the State has no timeout """
+        timeout_state = self.wd.settings["timeout_state"].get(self.c_state.wid)
+        last_time_update_fsm = self.wd.status.get("last_time_update_fsm")
+        if timeout_state == None or last_time_update_fsm == None: return None
+        return timeout_state - (datetime.now() - last_time_update_fsm).total_seconds()
+
     def make_transition(self):
         """ perform actions needed to make a state transition """
         time_now = datetime.now()
@@ -58,6 +79,7 @@ class Fsm():
         self.fsm_timeout_rqt = False
         if self.c_state != self.n_state:
             print(f"\n>> INFO : Transition to state {self.n_state.wid}")
+            self.wd.journal.write("transition", {"from": self.c_state.wid, "to": self.n_state.wid})
             self.c_state = self.n_state
             if self.c_state == "lock": self.wd.update_status({"detection_counter": 0})
             self.wd.update_status({"state": self.c_state.wid, "last_time_update_fsm": time_now})
@@ -89,14 +111,48 @@ class States():
 
 #---------------------------------------->> START
 class StateStart(States):
+    """
+    StateStart loads all Boxes, then Boxes are settled and started in dependency order (BOX_DEPENDENCIES):
+    a Box is settled once the Boxes its Items point to are settled, every Item is settled only once.
+    Nodes connect in their own thread/task, so they connect concurrently and time to reach run is bounded
+    by the slowest Node (and by timeout_state of check). Setup duration of every Item is kept in wd.setup_timings
+    """
+
+    BOX_DEPENDENCIES = {
+        "systems": [],
+        "timers": ["systems"],
+        "nodes": ["systems"],
+        "elements": ["nodes"],
+        "groups": ["nodes", "elements"],
+        "rules": ["timers", "nodes", "elements", "groups"]
+    }
 
     def do(self, rqt_in):
+        wd = self.context.wd
         print("> Loading Items")
-        for iname, ibox in self.context.wd.boxes.items(): ibox.load_items()
+        for iname, ibox in wd.boxes.items(): ibox.load_items()
         print("> Setting Items")
-        for iname, ibox in self.context.wd.boxes.items(): ibox.setup_items(self.context.wd) 
+        box_order = self.get_box_order(wd.boxes)
+        wd.setup_timings = {}
+        for iname in box_order:
+            timings = wd.boxes[iname].setup_items(wd)
+            for iwid, iduration in timings.items(): wd.metrics.observe("setup", iname, iduration)
+            wd.setup_timings.update(timings)
         print("> Starting Items")
-        for iname, ibox in self.context.wd.boxes.items(): ibox.start_items() 
+        for iname in box_order: wd.boxes[iname].start_items()
+        slowest = sorted(wd.setup_timings.items(), key = lambda itiming: itiming[1], reverse = True)[:3]
+        print(f"> Items settled in {sum(wd.setup_timings.values()) * 1e3:.0f} ms, slowest: " + ", ".join(f"{iwid} {iduration * 1e3:.1f} ms" for iwid, iduration in slowest))
+
+    def get_box_order(self, boxes):
+        """ Box names sorted so that every Box comes after its dependencies, Boxes without dependencies keep their order """
+        box_order = []
+        pending = list(boxes)
+        while len(pending) > 0:
+            ready = [iname for iname in pending if all(idependency in box_order or idependency not in boxes for idependency in self.BOX_DEPENDENCIES.get(iname, []))]
+            if len(ready) == 0: raise ValueError(f"circular dependency between Boxes {pending}")
+            box_order += ready
+            pending = [iname for iname in pending if iname not in ready]
+        return box_order
 
     def calculate(self):
         self.context.n_state = self.context.list_states["check"]
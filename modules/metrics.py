@@ -0,0 +1,143 @@
+from bisect import bisect_left
+import os
+
+
+"""
+metrics.py:
+This file contains the Histogram and Metrics classes, the always-on instrumentation of the request path
+(decode, handle_in, rules, queue wait, execute, send_msg) and of the startup (setup, connect)
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class Histogram():
+    """
+    Histogram counts durations in fixed buckets, observe() is O(log buckets) and never allocates
+
+    counts: number of durations per bucket, the last bucket is +Inf
+    total: sum of durations in seconds
+    count: number of durations
+    """
+
+    __slots__ = ("counts", "total", "count")
+
+    BOUNDS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds
+
+    def __init__(self):
+        """ ... """
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """ ... """
+        self.counts[bisect_left(self.BOUNDS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        """ add the durations of another Histogram """
+        for iindex, ivalue in enumerate(other.counts): self.counts[iindex] += ivalue
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, ratio):
+        """ upper bound of the bucket containing the quantile ratio (0 - 1), None if empty """
+        if self.count == 0: return None
+        rank = ratio * self.count
+        cumulative = 0
+        for iindex, ivalue in enumerate(self.counts):
+            cumulative += ivalue
+            if cumulative >= rank and ivalue > 0: return self.BOUNDS[iindex] if iindex < len(self.BOUNDS) else float("inf")
+        return float("inf")
+
+
+BOUNDS = Histogram.BOUNDS
+
+
+#----------------------------------------------------------------------------------------------
+class Metrics():
+    """
+    Metrics keeps histograms and counters by stage/name and label (Item wid or command). Nothing is locked
+    on the hot path, so under heavy contention a few increments can be lost, values are indicative
+
+    enabled: False turns observe() and count() into no-ops
+    histograms: dict stage -> dict label -> Histogram
+    counters: dict name -> dict label -> value
+    stages:
+        - decode : NodeMQTT.set_msg json decoding, by Node
+        - handle_in : Element.handle_in (rules evaluation included), by Element
+        - rules : SystemWilddog.set_rqt rules evaluation, by sender
+        - queue_wait : time in rqt_buffer, by command
+        - execute : Rqt.execute, by command
+        - send_msg : Node.send_msg, by Node
+        - setup : Item.setup in StateStart, by Box
+        - connect : Node start to first connexion, by Node
+    """
+
+    STAGES = ("decode", "handle_in", "rules", "queue_wait", "execute", "send_msg", "setup", "connect")
+
+    def __init__(self):
+        """ ... """
+        self.enabled = True
+        self.histograms = {istage: {} for istage in self.STAGES}
+        self.counters = {}
+
+    def observe(self, stage, label, value):
+        """ add a duration (seconds) to the histogram of stage and label """
+        if not self.enabled: return
+        try: histogram = self.histograms[stage][label]
+        except KeyError: histogram = self.histograms.setdefault(stage, {}).setdefault(label, Histogram())
+        histogram.counts[bisect_left(BOUNDS, value)] += 1 # Histogram.observe() inlined, this is the hot path
+        histogram.total += value
+        histogram.count += 1
+
+    def count(self, name, label, value = 1):
+        """ increment the counter name of label """
+        if not self.enabled: return
+        labels = self.counters.get(name)
+        if labels == None: labels = self.counters.setdefault(name, {})
+        labels[label] = labels.get(label, 0) + value
+
+    def get_stage(self, stage):
+        """ sendback a Histogram merging all labels of stage """
+        histogram = Histogram()
+        for ihistogram in list(self.histograms.get(stage, {}).values()): histogram.merge(ihistogram)
+        return histogram
+
+    def get_summary(self, stage = None):
+        """ sendback a dict stage (or label if stage is given) -> "count, avg, p50, p99" in microseconds """
+        summary = {}
+        if stage == None: histograms = {istage: self.get_stage(istage) for istage in self.histograms}
+        else: histograms = dict(self.histograms.get(stage, {}))
+        for iname, ihistogram in histograms.items():
+            if ihistogram.count == 0: continue
+            p50, p99 = ihistogram.quantile(0.50), ihistogram.quantile(0.99)
+            summary[iname] = f"n={ihistogram.count} avg={ihistogram.total / ihistogram.count * 1e6:.0f}us p50<={p50 * 1e6:.0f}us p99<={p99 * 1e6:.0f}us"
+        for iname, ilabels in list(self.counters.items()):
+            if stage == None: summary[iname] = sum(list(ilabels.values()))
+        return summary
+
+    def get_text(self):
+        """ sendback all metrics in text exposition format (prometheus) """
+        lines = []
+        for istage, ilabels in list(self.histograms.items()):
+            name = f"wilddog_{istage}_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for ilabel, ihistogram in list(ilabels.items()):
+                cumulative = 0
+                for ibound, ivalue in zip(Histogram.BOUNDS + ("+Inf",), ihistogram.counts):
+                    cumulative += ivalue
+                    lines.append(f'{name}_bucket{{label="{ilabel}",le="{ibound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{label="{ilabel}"}} {ihistogram.total}')
+                lines.append(f'{name}_count{{label="{ilabel}"}} {ihistogram.count}')
+        for iname, ilabels in list(self.counters.items()):
+            lines.append(f"# TYPE wilddog_{iname}_total counter")
+            for ilabel, ivalue in list(ilabels.items()): lines.append(f'wilddog_{iname}_total{{label="{ilabel}"}} {ivalue}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """ write get_text() in path, a temporary file is renamed so readers never see a partial file """
+        path_temp = f"{path}.tmp"
+        with open(path_temp, "w") as metrics_file: metrics_file.write(self.get_text())
+        os.replace(path_temp, path)
@@ -1,166 +1,34 @@
+from .catalog import CATALOG
 from .elements import ElementMqttDevice
 
 
 """
 mqtt_devices.py:
-This file cotains specific implementation classes of ElementMqttDevice
+This file cotains specific implementation classes of ElementMqttDevice. Models are declared in the device catalog
+(devices.yaml), the class of a model is built on first access (from modules.mqtt_devices import DevicePlug_a01)
+with the compiled feature maps of the model as class attributes
 """
 
 
-#----------------------------------------------------------------------------------------------
-class DeviceButton_a01(ElementMqttDevice):
-    def __init__(self):
-        """ simple button """
-        super().__init__()
-        self.features = self.features | {
-            "action": "event",
-            "battery_level": "battery",
-            "device_temperature": "temperature"
-        }
-        
-
-#----------------------------------------------------------------------------------------------
-class DevicePlug_a01(ElementMqttDevice): 
-    def __init__(self):
-        """ plug """
-        super().__init__()
-        self.features = self.features | {
-            "state": "onoff",
-            "power": "power"
-        }
-
-
-#---------------------------------------------------------------------------------------------- 
-class DeviceRelay_a01(ElementMqttDevice): 
-    def __init__(self):
-        """ relay 1 chanel with neutral """
-        super().__init__()
-        self.features = self.features | {
-            "state": "onoff"
-        }
-
-                           
-#----------------------------------------------------------------------------------------------
-class DeviceRelay_a12(ElementMqttDevice): 
-    def __init__(self):
-        """ relay 2 chanel with neutral CH1 """
-        super().__init__()
-        self.features = self.features | {
-            "state_l1": "onoff"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceRelay_a22(ElementMqttDevice): 
-    def __init__(self):
-        """ relay 2 chanel with neutral CH2 """
-        super().__init__()
-        self.features = self.features | {
-            "state_l2": "onoff"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceRelay_b12(ElementMqttDevice): 
-    def __init__(self):
-        """ relay 2 chanel without neutral CH1 """
-        super().__init__()
-        self.features = self.features | {
-            "state_right": "onoff"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceRelay_b22(ElementMqttDevice): 
-    def __init__(self):
-        """ relay 2 chanel without neutral CH2 """
-        super().__init__()
-        self.features = self.features | {
-            "state_left": "onoff"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceRelay_c01(ElementMqttDevice): 
-    def __init__(self):
-        """ relay 1 chanel """
-        super().__init__()
-        self.features = self.features | {
-            "state": "onoff"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceRelay_d01(ElementMqttDevice): 
-    def __init__(self):
-        """ power relay 1 chanel 32A """
-        super().__init__()
-        self.features = self.features | {
-            "state": "onoff"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceMovement_a01(ElementMqttDevice):
-    def __init__(self):
-        """ movement sensor """
-        super().__init__()
-        self.features = self.features | {
-            "occupancy": "detection",
-            "battery_level": "battery"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceOverture_a01(ElementMqttDevice):
-    def __init__(self):
-        """ contact sensor """
-        super().__init__()
-        self.features = self.features | {
-            "contact": "contact",
-            "battery_level": "battery",
-            "device_temperature": "temperature"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceKeypad_a06(ElementMqttDevice):
-    def __init__(self):
-        """ keypad """
-        super().__init__()
-        self.features = self.features | {
-            "action":"event",
-            "battery_level": "battery"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceAlarm_a01(ElementMqttDevice):
-    def __init__(self):
-        """ alarm fire """
-        super().__init__()
-        self.features = self.features | {
-            "smoke": "fire_detection",
-            "battery_level": "battery"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceAlarm_b01(ElementMqttDevice):
-    def __init__(self):
-        """ alarm intrusion """
-        super().__init__()
-        self.features = self.features | {
-            "battery_level": "battery"
-        }
-
-
-#----------------------------------------------------------------------------------------------
-class DeviceLeakwater_a01(ElementMqttDevice):
-    def __init__(self):
-        """ leakwater sensor """
-        super().__init__()
-        self.features = self.features | {
-            "water_leak": "water_detection",
-            "battery_level": "battery"
-        }
\ No newline at end of file
+def get_device_class(model_name):
+    """ sendback the Element class of a catalog model, None if model_name is unknown. The class is built again if the catalog has been loaded again """
+    model = CATALOG.get(model_name)
+    if model == None: return None
+    device_class = globals().get(model_name)
+    if device_class != None and device_class.features is model["features"]: return device_class
+    device_class = type(model_name, (ElementMqttDevice,), {
+        "__slots__": (),
+        "__doc__": f" {model['description']} ",
+        "__module__": __name__,
+        "features": model["features"],
+        "features_output": model["features_output"]
+    })
+    globals()[model_name] = device_class # next accesses do not go through __getattr__
+    return device_class
+
+
+def __getattr__(name):
+    """ ... """
+    device_class = get_device_class(name)
+    if device_class == None: raise AttributeError(f"module {__name__} has no attribute {name}")
+    return device_class
@@ -0,0 +1,107 @@
+import asyncio
+import discord
+
+from .egress import Egress
+from .items import ItemNode
+
+
+"""
+node_discord.py:
+This file contains the Discord Node, discord is only imported if a NodeDiscord is configured
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class NodeDiscord(ItemNode):
+    """ 
+    NodeDiscord implements the Discord Node 
+
+    _discord_client: discord object
+    _egress: outcomming messages to Discord (merged, by priority, paced by Discord rate limits)
+    _egress_task: task sending _egress messages to the channel, created once connected
+    settings:
+        - token : bot token
+        - guild : guild name on discord server
+        - egress_limit : max characters by Discord message, pending messages are merged up to it
+        - egress_capacity : max pending characters, oldest informational messages are dropped first
+    """
+    def __init__(self):
+        """ ... """
+        super().__init__()
+
+        self._intents = discord.Intents.all()
+        self._intents.message_content = True
+        self._discord_client = discord.Client(intents=self._intents)
+        self._egress = Egress()
+        self._egress_task = None
+
+        self.settings = self.settings | {
+            "token": None,
+            "guild": None,
+            "egress_limit": 2000,
+            "egress_capacity": 20000
+        }
+
+    def setup(self, wd):
+        """ ... """
+        super().setup(wd)
+        self._discord_client.on_ready = self._on_ready # set on_ready built-in method for local method
+        self._discord_client.on_message = self._on_message # set on_message built-in method for local method
+        self._egress.limit = self.settings["egress_limit"]
+        self._egress.capacity = self.settings["egress_capacity"]
+
+    def set_msg(self, msg_in):
+        """ ... """
+        msg = {}
+        sid = None
+        msg_temp = None
+
+        try: # parser message from Discord users
+            sid = "discord_bot"
+            msg_temp = msg_in.content
+            msg_temp = msg_temp.replace(" ", "")
+            msg_temp = msg_temp.split("\n")
+            for line in msg_temp:
+                parameter = line.split(":")
+                msg = msg | {parameter[0]:self._convert_type(parameter[1])}
+        except:
+            msg = {}
+            sid = None
+
+        if msg != {} and sid != None:
+            for ielement in self.sid_elements.get(sid, []):
+                self.wd.journal.write("ingress", {"node": self.wid, "element": ielement.wid, "msg": msg})
+                ielement.handle_in(msg = msg)
+
+    def send_msg(self, msg_in, priority = "normal"):
+        """ queue a message from any thread, priority "high" (alerts) is sent before "normal" (replies) """
+        dropped = self._egress.put(msg_in, priority) # older messages or msg_in
+        if dropped > 0: self.wd.metrics.count("msg_dropped", self.wid, dropped)
+
+    def _launch_thread(self):
+        """ ... """
+        self._discord_client.run(self.settings["token"], log_handler = None)
+
+    async def _launch_task(self):
+        """ asyncio runtime: discord client runs directly in WD event loop """
+        await self._discord_client.start(self.settings["token"])
+
+    def _convert_type(self, msg_in):
+        """" it converts string to numbers/booleans"""
+        if msg_in.isnumeric(): return int(msg_in)
+        if msg_in == "True" or msg_in == "true": return True
+        if msg_in == "False" or msg_in == "false": return False
+        return msg_in
+
+    async def _on_ready(self):
+        """" connection with server is ok. set some communication server parameters"""
+        self._user = self._discord_client.user
+        self._guild = discord.utils.get(self._discord_client.guilds, name = self.settings['guild'])
+        self._chanel = discord.utils.get(self._guild.channels, name="general")
+        if self._egress_task == None or self._egress_task.done(): self._egress_task = asyncio.get_running_loop().create_task(self._egress.run(self._chanel)) # on_ready is called again after a reconnexion
+        self.update_status({"started": True})
+        print(f"\n>> INFO : node discord succefully connected to {self._guild.name} server in chanel {self._chanel.name} ")
+    
+    async def _on_message(self, msg_in):
+        """ It receives new incomming messages """
+        if msg_in.author != self._user: self.set_msg(msg_in)
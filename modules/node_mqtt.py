@@ -0,0 +1,204 @@
+import paho.mqtt.client as mqtt
+import asyncio
+import json
+import time
+
+from .items import ItemNode
+
+
+"""
+node_mqtt.py:
+This file contains the MQTT Node (zigbee2mqtt devices through a mosquitto server), paho is only imported if a NodeMQTT is configured
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class NodeMQTT(ItemNode):
+    """ 
+    NodeMQTT implements the MQTT Node 
+
+    _mqtt_client: paho object
+    settings:
+        - adresse : mosquitto ip adresse
+        - port : mosquitto port 
+        - base_topic : zigbee2mqtt base topic, devices publish on base_topic/sid
+        - subscribe_all : subscribe to base_topic/# instead of the topic of every Element
+    """
+
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self._mqtt_client = None
+
+        self.settings = self.settings | {
+            "adress": None,
+            "port": None,
+            "base_topic": "zigbee2mqtt",
+            "subscribe_all": False
+        }
+
+    def setup(self, wd):
+        """ ... """
+        super().setup(wd)
+        self._mqtt_client = mqtt.Client()
+        self._mqtt_client.on_connect = self._connect_mqtt
+        self._mqtt_client.on_message = self.set_msg
+        self._mqtt_client.connect_async(self.settings["adress"],self.settings["port"],60) # connexion is done when the Node is started, setup never blocks
+
+    def set_msg(self, client, userdata, msg_in):
+        """ ... """
+        base_topic = self.settings["base_topic"]
+        if not msg_in.topic.startswith(base_topic + "/"): return
+        elements = self.sid_elements.get(msg_in.topic[len(base_topic) + 1:]) # bridge, availability, set or unknown devices are not found
+        if elements == None: 
+            self.wd.metrics.count("msg_ignored", self.wid)
+            return
+
+        time_start = time.perf_counter()
+        try:
+            msg = json.loads(msg_in.payload)
+        except:
+            msg = {}
+        time_end = time.perf_counter()
+        self.wd.metrics.observe("decode", self.wid, time_end - time_start)
+
+        if type(msg).__name__ == "dict" and msg != {}:
+            for ielement in elements: # if the message is validated by the Node the Element sender has to handle it
+                self.wd.journal.write("ingress", {"node": self.wid, "element": ielement.wid, "msg": msg})
+                ielement.handle_in(msg = msg)
+                time_start, time_end = time_end, time.perf_counter()
+                self.wd.metrics.observe("handle_in", ielement.wid, time_end - time_start)
+
+    def send_msg(self, sid, msg_type, msg):
+        """ ... """
+        time_start = time.perf_counter()
+        msg = json.dumps(msg)
+        self._mqtt_client.publish(f"{self.settings['base_topic']}/{sid}/{msg_type}", payload=msg, qos=0, retain=False)
+        self.wd.metrics.observe("send_msg", self.wid, time.perf_counter() - time_start)
+
+    def _launch_thread(self):
+        """ first connexion is done here, it is retried if the broker is not available yet """
+        self._mqtt_client.loop_forever(retry_first_connection=True)
+
+    async def _launch_task(self):
+        """
+        asyncio runtime: the paho client is driven by the event loop. connect_async() in setup does not open the socket,
+        so the first connexion is also done here, immediately, then every 5 s until it succeeds and again if connexion
+        is lost. reconnect() (DNS and TCP connect) runs in the executor, MqttAsyncAdapter registers the socket on the loop
+        """
+        loop = asyncio.get_running_loop()
+        adapter = MqttAsyncAdapter(loop, self._mqtt_client)
+        delay = 0
+        while True:
+            await adapter.closed.wait()
+            adapter.closed.clear()
+            await asyncio.sleep(delay)
+            delay = 5
+            try: await loop.run_in_executor(None, self._mqtt_client.reconnect)
+            except OSError: adapter.closed.set() # broker not available, try again later
+            except Exception as error: # the task must not end, Node would never connect
+                print(f"\n>> INFO : node {self.wid} connexion error ({error!r})")
+                self.status["error_buffer"].append("connexion_failed")
+                adapter.closed.set()
+
+    def _connect_mqtt(self, client, userdata, flags, rc):
+        """ method to indicate that connection with server was ok """
+        if rc == 0:
+            if self.settings["subscribe_all"] or len(self.sid_elements) == 0: self._mqtt_client.subscribe(f"{self.settings['base_topic']}/#")
+            else: self._mqtt_client.subscribe([(f"{self.settings['base_topic']}/{isid}", 0) for isid in self.sid_elements]) # only topics of Element members
+            self.update_status({"started": True})
+            print("\n>> INFO : node zb succefully connected to mosquitto server")
+            
+        else:
+            print("\n>> INFO : node zb failed connecting to mosquitto server")
+            self.status["error_buffer"].append("connexion_failed")
+
+
+#----------------------------------------------------------------------------------------------
+class MqttAsyncAdapter():
+    """
+    MqttAsyncAdapter drives a paho client from an asyncio loop (paho external loop API) instead of loop_forever().
+    paho calls the socket callbacks from the thread using the client: reconnect() runs in the executor and publish()
+    is called by the FSM thread, so the loop is only modified from its own thread (call_soon_threadsafe). Sockets are
+    registered by file descriptor, a socket can be closed by paho before its callback runs on the loop
+
+    loop: asyncio event loop
+    client: paho object
+    closed: asyncio event set when the client socket is closed
+    _fd: file descriptor of the socket registered in the loop, None if there is none
+    _misc_task: task calling loop_misc() (keepalive, retries) while socket is open
+    """
+
+    def __init__(self, loop, client):
+        """ ... """
+        self.loop = loop
+        self.client = client
+        self.closed = asyncio.Event()
+        self._fd = None
+        self._misc_task = None
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        if client.socket() != None: self._on_socket_open(client, None, client.socket()) # socket already opened by connect()
+        else: self.closed.set()
+
+    def _on_socket_open(self, client, userdata, sock):
+        """ ... """
+        self._call(self._add_socket, sock.fileno())
+
+    def _on_socket_close(self, client, userdata, sock):
+        """ ... """
+        self._call(self._remove_socket, sock.fileno())
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        """ ... """
+        self._call(self._set_writer, sock.fileno(), True)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        """ ... """
+        self._call(self._set_writer, sock.fileno(), False)
+
+    def _call(self, callback, *arg):
+        """ run callback now if the caller is the loop thread, otherwise on the loop thread """
+        try: running_loop = asyncio.get_running_loop()
+        except RuntimeError: running_loop = None
+        if running_loop is self.loop: callback(*arg)
+        else:
+            try: self.loop.call_soon_threadsafe(callback, *arg)
+            except RuntimeError: pass # loop is closed
+
+    def _add_socket(self, fd):
+        """ loop thread only """
+        self._unregister()
+        self._fd = fd
+        self.loop.add_reader(fd, self.client.loop_read)
+        self._misc_task = self.loop.create_task(self._misc_loop())
+        if self.client.want_write(): self.loop.add_writer(fd, self.client.loop_write)
+
+    def _remove_socket(self, fd):
+        """ loop thread only """
+        if fd != self._fd: return # already removed
+        self._unregister()
+        self.closed.set()
+
+    def _unregister(self):
+        """ loop thread only, the loop stops watching the current socket """
+        if self._fd == None: return
+        self.loop.remove_reader(self._fd)
+        self.loop.remove_writer(self._fd)
+        self._fd = None
+        if self._misc_task != None: self._misc_task.cancel()
+        self._misc_task = None
+
+    def _set_writer(self, fd, enable):
+        """ loop thread only """
+        if fd != self._fd: return # socket closed meanwhile
+        if enable: self.loop.add_writer(fd, self.client.loop_write)
+        else: self.loop.remove_writer(fd)
+
+    async def _misc_loop(self):
+        """ ... """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
@@ -0,0 +1,86 @@
+from threading import Condition, Lock, Thread
+import atexit
+import time
+
+
+"""
+persistence.py:
+This file contains the Persistence class, Boxes are saved by a background worker so the FSM never waits
+for a configuration file to be written
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class Persistence():
+    """
+    Persistence saves Boxes in its own thread. save() only marks a Box, Boxes marked during the debounce window
+    (counted from the first mark) are written together, a Box marked several times is written once. Box.save_items()
+    writes the file atomically and skips Boxes whose settings did not change since they were loaded/saved
+
+    debounce: seconds to wait after the first mark before writing
+    _pending: dict file -> Box waiting to be written, in mark order
+    _deadline: time.monotonic() when pending Boxes have to be written, None if nothing is pending
+    _write_lock: a Box is written by a single thread at once (worker or flush())
+    stats: requested (marks), coalesced (marks of a Box already pending), written and skipped (not changed) Boxes, errors
+    """
+
+    def __init__(self, debounce = 1.0):
+        """ ... """
+        self.debounce = debounce
+        self._pending = {}
+        self._deadline = None
+        self._condition = Condition(Lock())
+        self._write_lock = Lock()
+        self._thread = None
+        self.stats = {"requested": 0, "coalesced": 0, "written": 0, "skipped": 0, "errors": 0}
+
+    def start(self):
+        """ start the worker thread, pending Boxes are also written when the process exits """
+        if self._thread != None: return
+        self._thread = Thread(target = self._run, daemon = True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def save(self, box):
+        """ mark a Box to be written, it returns immediately. Box is written now if the worker is not started """
+        with self._condition:
+            self.stats["requested"] += 1
+            if box.item_file in self._pending: self.stats["coalesced"] += 1
+            self._pending[box.item_file] = box
+            if self._deadline == None: self._deadline = time.monotonic() + self.debounce
+            self._condition.notify()
+        if self._thread == None: self.flush()
+
+    def flush(self):
+        """ write pending Boxes now, in the calling thread """
+        with self._condition:
+            boxes = list(self._pending.values())
+            self._pending = {}
+            self._deadline = None
+        self._write(boxes)
+
+    def get_stats(self):
+        """ ... """
+        with self._condition: return dict(self.stats) | {"pending": len(self._pending)}
+
+    def _run(self):
+        """ worker thread: wait for the deadline of pending Boxes then write them """
+        while True:
+            with self._condition:
+                while self._deadline == None or time.monotonic() < self._deadline:
+                    self._condition.wait(None if self._deadline == None else self._deadline - time.monotonic())
+                boxes = list(self._pending.values())
+                self._pending = {}
+                self._deadline = None
+            self._write(boxes)
+
+    def _write(self, boxes):
+        """ ... """
+        for ibox in boxes:
+            with self._write_lock:
+                try: written = ibox.save_items()
+                except Exception as error: # the worker must survive (disk full, read-only data path...)
+                    print(f"\n>> INFO : {ibox.item_file} could not be saved ({error})")
+                    with self._condition: self.stats["errors"] += 1
+                    continue
+            with self._condition: self.stats["written" if written else "skipped"] += 1
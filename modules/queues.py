@@ -0,0 +1,240 @@
+from collections import deque
+from collections.abc import Mapping
+from threading import Condition, Lock, get_ident
+import asyncio
+import time
+
+
+"""
+queues.py:
+This file contains the RqtQueue class, the request queue shared between the threads that submit
+Requests (Nodes, Timers) and the FSM who executes them
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class RqtQueue():
+    """
+    RqtQueue is a thread-safe bounded queue for Requests. Requests are stored in one FIFO per priority
+    class, so enqueue/dequeue are O(1) and higher priority classes are always served first. Commands with
+    a coalescing key are last-writer-wins: the pending Request with the same key is cancelled (never executed)
+    and the new one is queued at the tail, so it is still executed after every Request queued before it
+
+    capacity: max number of Requests waiting in queue
+    policy: what to do when queue is full
+        - drop_oldest : the oldest Request in queue (any priority) is dropped
+        - drop_lowest : the oldest Request of the lowest priority class is dropped (the new one if it is the lowest)
+        - block : producer waits until there is space or block_timeout expires, then the new Request is dropped
+    priorities: dict command -> priority class, commands not listed are "normal"
+    block_timeout: max time (seconds) a producer can be blocked with policy block
+    coalesce: dict command -> coalescing key, commands not listed are never coalesced
+        - target : same target and command
+        - target_payload : same target, command and payload features (ex. set_status onoff and set_status brightness are kept)
+        - sender : same sender, command and msg features (ex. a sensor re-reporting occupancy)
+    _queues: one deque per priority class, from highest to lowest, entries are [seq, Request, time queued, coalescing key].
+        The Request of a cancelled entry is None, cancelled entries are removed when they reach the head of their deque
+    _live: number of Requests (not cancelled) in every deque
+    _cancelled: number of cancelled entries still in deques, deques are compacted when it exceeds capacity
+    _pending: dict coalescing key -> queue entry of the pending Request with this key
+    _consumer: thread ident of the last thread who took a Request (FSM), it never blocks on put()
+    _loop: asyncio loop of the consumer in asyncio runtime, None with threads
+    _event: asyncio event set when a Request is queued (asyncio runtime)
+    metrics: Metrics receiving the time spent in queue by every Request (queue_wait), None if not used
+    """
+
+    PRIORITY_CLASSES = ("high", "normal", "low")
+    POLICIES = ("drop_oldest", "drop_lowest", "block")
+    COALESCE_KEYS = ("target", "target_payload", "sender")
+
+    def __init__(self, capacity = 1000, policy = "drop_oldest", priorities = {}, block_timeout = 1, coalesce = {}):
+        """ ... """
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self._queues = [deque() for iclass in self.PRIORITY_CLASSES]
+        self._live = [0 for iclass in self.PRIORITY_CLASSES]
+        self._cancelled = 0
+        self._pending = {}
+        self._size = 0
+        self._seq = 0
+        self._consumer = None
+        self._loop = None
+        self._loop_thread = None
+        self._event = None
+        self.metrics = None
+
+        self.capacity = None
+        self.policy = None
+        self.priorities = {}
+        self.block_timeout = None
+        self.coalesce = {}
+        self.counters = {"enqueued": 0, "dequeued": 0, "dropped": 0, "coalesced": 0}
+        self.dropped = {iclass: 0 for iclass in self.PRIORITY_CLASSES}
+        self.configure(capacity = capacity, policy = policy, priorities = priorities, block_timeout = block_timeout, coalesce = coalesce)
+
+    def configure(self, capacity = None, policy = None, priorities = None, block_timeout = None, coalesce = None):
+        """ update queue parameters, None keeps the current value """
+        with self._lock:
+            if capacity != None: self.capacity = max(1, int(capacity))
+            if policy != None:
+                if policy not in self.POLICIES: print(f"\n>> INFO : unknown queue policy {policy}, drop_oldest is used")
+                self.policy = policy if policy in self.POLICIES else "drop_oldest"
+            if priorities != None:
+                self.priorities = {}
+                for icommand, iclass in priorities.items():
+                    if iclass in self.PRIORITY_CLASSES: self.priorities[icommand] = self.PRIORITY_CLASSES.index(iclass)
+            if block_timeout != None: self.block_timeout = block_timeout
+            if coalesce != None:
+                self.coalesce = {}
+                for icommand, ikey in coalesce.items():
+                    if ikey in self.COALESCE_KEYS: self.coalesce[icommand] = ikey
+                    else: print(f"\n>> INFO : unknown coalescing key {ikey} for {icommand}, it is not coalesced")
+
+    def put(self, rqt_in):
+        """ add a Request to queue, return False if the Request (or another one) has been dropped. A pending Request with the same coalescing key is cancelled """
+        level = self.priorities.get(rqt_in.command, 1)
+        key = self._get_key(rqt_in) if rqt_in.command in self.coalesce else None
+        with self._lock:
+            coalesced = key != None and key in self._pending
+            if coalesced: # last writer wins, the older Request gives its place in queue to the new one at the tail
+                self._pending.pop(key)[1] = None # same command, same priority level
+                self._live[level] -= 1
+                self._size -= 1
+                self._cancelled += 1
+                self.counters["coalesced"] += 1
+                if self.metrics != None: self.metrics.count("coalesced", rqt_in.command)
+                if self._cancelled > self.capacity: self._compact()
+            accepted = True
+            if self._size >= self.capacity:
+                if self.policy == "block" and get_ident() != self._consumer: # FSM can not wait for itself
+                    deadline = time.monotonic() + self.block_timeout
+                    while self._size >= self.capacity:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._not_full.wait(remaining): break
+                    if self._size >= self.capacity:
+                        self._count_drop(level)
+                        return False
+                elif self.policy == "drop_lowest":
+                    lowest = max(ilevel for ilevel, ilive in enumerate(self._live) if ilive > 0)
+                    if lowest < level:
+                        self._count_drop(level)
+                        return False
+                    self._drop(lowest)
+                    accepted = False
+                else:
+                    self._drop(self._get_oldest())
+                    accepted = False
+            self._seq += 1
+            entry = [self._seq, rqt_in, time.perf_counter(), key]
+            self._queues[level].append(entry)
+            if key != None: self._pending[key] = entry
+            self._live[level] += 1
+            self._size += 1
+            if not coalesced: self.counters["enqueued"] += 1
+            self._not_empty.notify()
+            self._notify_loop()
+            return accepted
+
+    def get(self):
+        """ take the next Request, highest priority class first. None is returned if queue is empty """
+        with self._lock:
+            self._consumer = get_ident()
+            for ilevel, iqueue in enumerate(self._queues):
+                if self._live[ilevel] > 0:
+                    self._purge(ilevel)
+                    seq, rqt_temp, time_put, key = iqueue.popleft()
+                    if key != None: del self._pending[key]
+                    self._live[ilevel] -= 1
+                    self._size -= 1
+                    self.counters["dequeued"] += 1
+                    self._not_full.notify()
+                    break
+            else: return None
+        if self.metrics != None: self.metrics.observe("queue_wait", rqt_temp.command, time.perf_counter() - time_put)
+        return rqt_temp
+
+    def wait(self, timeout = None):
+        """ block until a Request is queued, timeout (seconds) expires or wake() is called """
+        with self._lock:
+            if self._size == 0: self._not_empty.wait(timeout)
+
+    def wake(self):
+        """ wake up the consumer without Request """
+        with self._lock:
+            self._not_empty.notify_all()
+            self._notify_loop()
+
+    def bind_loop(self, loop):
+        """ asyncio runtime: the consumer is a coroutine running in loop, it must be called from the loop thread """
+        self._loop = loop
+        self._loop_thread = get_ident()
+        self._event = asyncio.Event()
+
+    async def wait_async(self, timeout = None):
+        """ coroutine version of wait(), queue must be bound to the running loop """
+        self._event.clear()
+        if self._size > 0: return
+        try: await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError: pass
+
+    def get_stats(self):
+        """ sendback the queue depth and counters """
+        with self._lock:
+            stats = {"depth": self._size, "capacity": self.capacity, "policy": self.policy}
+            for iclass, ilive in zip(self.PRIORITY_CLASSES, self._live): stats[f"depth_{iclass}"] = ilive
+            stats = stats | self.counters
+            for iclass, ivalue in self.dropped.items(): stats[f"dropped_{iclass}"] = ivalue
+        return stats
+
+    def __len__(self):
+        """ ... """
+        return self._size
+
+    def _notify_loop(self):
+        """ set the asyncio event from any thread, lock must be held """
+        if self._loop == None: return
+        if get_ident() == self._loop_thread: self._event.set()
+        else: self._loop.call_soon_threadsafe(self._event.set)
+
+    def _get_oldest(self):
+        """ priority level containing the oldest Request in queue """
+        oldest = None
+        for ilevel, iqueue in enumerate(self._queues):
+            if self._live[ilevel] == 0: continue
+            self._purge(ilevel)
+            if oldest == None or iqueue[0][0] < self._queues[oldest][0][0]: oldest = ilevel
+        return oldest
+
+    def _purge(self, level):
+        """ remove cancelled entries at the head of a priority level, lock must be held """
+        queue = self._queues[level]
+        while len(queue) > 0 and queue[0][1] == None:
+            queue.popleft()
+            self._cancelled -= 1
+
+    def _compact(self):
+        """ remove every cancelled entry, lock must be held """
+        for ilevel, iqueue in enumerate(self._queues): self._queues[ilevel] = deque(ientry for ientry in iqueue if ientry[1] != None)
+        self._cancelled = 0
+
+    def _get_key(self, rqt_in):
+        """ coalescing key of a Request whose command is in coalesce, None if it can not be built """
+        key = self.coalesce[rqt_in.command]
+        if key == "target": return (rqt_in.target.wid, rqt_in.command)
+        features = rqt_in.payload if key == "target_payload" else rqt_in.msg
+        if not isinstance(features, Mapping): return None
+        return (rqt_in.target.wid if key == "target_payload" else rqt_in.sender.wid, rqt_in.command, frozenset(features))
+
+    def _drop(self, level):
+        """ drop the oldest Request of a priority level, lock must be held """
+        self._purge(level)
+        seq, rqt_temp, time_put, key = self._queues[level].popleft()
+        if key != None: del self._pending[key]
+        self._live[level] -= 1
+        self._size -= 1
+        self._count_drop(level)
+
+    def _count_drop(self, level):
+        """ ... """
+        self.counters["dropped"] += 1
+        self.dropped[self.PRIORITY_CLASSES[level]] += 1
@@ -10,4 +10,4 @@ This file cotains all the implementation classes of Rules
 #----------------------------------------------------------------------------------------------
 class RuleStandard(ItemRule):
     """ RuleStandard implements the standard rule used to validate Requests"""
-    pass
\ No newline at end of file
+    __slots__ = ()
\ No newline at end of file
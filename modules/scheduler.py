@@ -0,0 +1,186 @@
+from threading import Condition, Lock, Thread, get_ident
+import asyncio
+import heapq
+import random
+import time
+import traceback
+
+
+"""
+scheduler.py:
+This file contains the Scheduler class, a single deadline heap used by every Item that needs to run
+something later or periodically (Timers, timeouts...)
+"""
+
+
+#----------------------------------------------------------------------------------------------
+class SchedulerHandle():
+    """
+    SchedulerHandle is sent back by Scheduler for every callback registered, it allows to cancel it
+
+    callback: function to call, without arguments
+    deadline: next nominal execution time (time.monotonic)
+    period: period in seconds for periodic callbacks, None for one-shot
+    jitter: max random delay in seconds added to every execution
+    cancelled: True once cancel() has been called
+    """
+
+    def __init__(self, scheduler, callback, deadline, period = None, jitter = 0):
+        """ ... """
+        self.scheduler = scheduler
+        self.callback = callback
+        self.deadline = deadline
+        self.period = period
+        self.jitter = jitter
+        self.cancelled = False
+        self.scheduled = False
+
+    def cancel(self):
+        """ the callback will not be called anymore """
+        if not self.cancelled:
+            self.cancelled = True
+            self.scheduler._cancel(self)
+
+
+#----------------------------------------------------------------------------------------------
+class Scheduler():
+    """
+    Scheduler keeps all deadlines in a heap and executes callbacks when they are due, from a single thread
+    (threads runtime) or a single task (asyncio runtime). Periodic callbacks are scheduled at fixed rate
+    (deadline + period) so they do not drift, missed periods are skipped if Scheduler falls behind
+
+    _heap: list of (execution time, sequence, handle)
+    _heap_cancelled: number of cancelled handles still in heap, heap is cleaned when they are the majority
+    stats: executed/cancelled/skipped counters and lateness (seconds between execution time and real execution)
+    """
+
+    def __init__(self):
+        """ ... """
+        self._heap = []
+        self._heap_cancelled = 0
+        self._seq = 0
+        self._lock = Lock()
+        self._condition = Condition(self._lock)
+        self._thread = None
+        self._task = None
+        self._loop = None
+        self._loop_thread = None
+        self._event = None
+        self.stats = {"executed": 0, "cancelled": 0, "skipped": 0, "late_last": 0.0, "late_max": 0.0, "late_total": 0.0}
+
+    def call_later(self, delay, callback, period = None, jitter = 0):
+        """ register callback to be called once in delay seconds, then every period seconds if period is defined """
+        handle = SchedulerHandle(self, callback, time.monotonic() + delay, period, jitter)
+        self._push(handle)
+        return handle
+
+    def call_every(self, period, callback, jitter = 0, delay = None):
+        """ register callback to be called every period seconds, the first time after delay (default period) """
+        return self.call_later(period if delay == None else delay, callback, period = period, jitter = jitter)
+
+    def start(self, loop = None):
+        """ start the Scheduler in its own thread, or as a task of loop in asyncio runtime """
+        if loop != None:
+            self._loop = loop
+            self._loop_thread = get_ident()
+            self._event = asyncio.Event()
+            self._task = loop.create_task(self._launch_task())
+        elif self._thread == None:
+            self._thread = Thread(target = self._launch_thread, daemon = True)
+            self._thread.start()
+
+    def get_stats(self):
+        """ sendback counters and lateness of Scheduler """
+        with self._lock:
+            stats = self.stats | {"pending": len(self._heap)}
+        stats["late_avg"] = stats["late_total"] / stats["executed"] if stats["executed"] > 0 else 0.0
+        return stats
+
+    def _push(self, handle):
+        """ add handle in heap at its next execution time and wake up the Scheduler if it is the first one """
+        execution_time = handle.deadline + (random.uniform(0, handle.jitter) if handle.jitter else 0)
+        with self._lock:
+            self._seq += 1
+            handle.scheduled = True
+            heapq.heappush(self._heap, (execution_time, self._seq, handle))
+            if self._heap[0][2] is handle:
+                self._condition.notify()
+                if self._loop != None:
+                    if get_ident() == self._loop_thread: self._event.set()
+                    else: self._loop.call_soon_threadsafe(self._event.set)
+
+    def _pop_due(self):
+        """ sendback (due handles with their execution time, seconds before next execution or None) """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while len(self._heap) > 0 and self._heap[0][0] <= now:
+                execution_time, seq, handle = heapq.heappop(self._heap)
+                handle.scheduled = False
+                if not handle.cancelled: due.append((execution_time, handle))
+                else: self._heap_cancelled -= 1
+            timeout = self._heap[0][0] - now if len(self._heap) > 0 else None
+        return due, timeout
+
+    def _execute(self, due):
+        """ call due callbacks and schedule again periodic ones """
+        for execution_time, handle in due:
+            late = time.monotonic() - execution_time
+            with self._lock:
+                self.stats["executed"] += 1
+                self.stats["late_last"] = late
+                self.stats["late_total"] += late
+                if late > self.stats["late_max"]: self.stats["late_max"] = late
+            try:
+                handle.callback()
+            except Exception:
+                print(f"\n>> INFO : scheduler callback {handle.callback} failed")
+                traceback.print_exc()
+            if handle.period != None and not handle.cancelled:
+                handle.deadline = handle.deadline + handle.period
+                now = time.monotonic()
+                if handle.deadline <= now: # Scheduler is behind, missed periods are skipped
+                    missed = int((now - handle.deadline) // handle.period) + 1
+                    handle.deadline = handle.deadline + missed * handle.period
+                    self._count("skipped", missed)
+                self._push(handle)
+
+    def _cancel(self, handle):
+        """ count a cancelled handle, heap is rebuilt without cancelled handles if they are too many """
+        with self._lock:
+            self.stats["cancelled"] += 1
+            if not handle.scheduled: return
+            self._heap_cancelled += 1
+            if self._heap_cancelled > 64 and self._heap_cancelled > len(self._heap) // 2:
+                for ientry in self._heap:
+                    if ientry[2].cancelled: ientry[2].scheduled = False
+                self._heap = [ientry for ientry in self._heap if not ientry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._heap_cancelled = 0
+
+    def _count(self, counter, value = 1):
+        """ ... """
+        with self._lock:
+            self.stats[counter] += value
+
+    def _launch_thread(self):
+        """ Scheduler routine in threads runtime """
+        while True:
+            due, timeout = self._pop_due()
+            if len(due) > 0: self._execute(due)
+            else:
+                with self._lock: # heap may have changed since _pop_due(), timeout is computed again
+                    if len(self._heap) == 0: self._condition.wait()
+                    else:
+                        timeout = self._heap[0][0] - time.monotonic()
+                        if timeout > 0: self._condition.wait(timeout)
+
+    async def _launch_task(self):
+        """ Scheduler routine in asyncio runtime """
+        while True:
+            self._event.clear()
+            due, timeout = self._pop_due()
+            if len(due) > 0: self._execute(due)
+            else:
+                try: await asyncio.wait_for(self._event.wait(), timeout)
+                except asyncio.TimeoutError: pass
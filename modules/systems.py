@@ -1,10 +1,19 @@
 from datetime import datetime
+from heapq import merge
+from time import perf_counter
 
 from .collections import timer_classes, element_classes, rule_classes, node_classes, group_classes
 from .items import ItemSystem
 from .machine import Fsm
-from .containers import Box
-from .tools import Rqt
+from .containers import Box, NULL_ITEM
+from .config import Config
+from .queues import RqtQueue
+from .aggregates import GroupAggregate
+from .scheduler import Scheduler
+from .metrics import Metrics
+from .persistence import Persistence
+from .journal import Journal
+from .tools import NULL_RQT, Rqt
 
 
 """
@@ -21,8 +30,18 @@ class SystemWilddog(ItemSystem):
     others Items and for the FSM
 
     fsm: FSM instance
-    rqt_buffer: request queue
+    rqt_buffer: request queue (RqtQueue), bounded and shared by all threads submitting requests
+    scheduler: deadline Scheduler shared by all Items (Timers, timeouts)
+    metrics: latency histograms and counters of the request path (see Metrics.STAGES)
+    setup_timings: dict wid -> setup duration in seconds of every Item, filled by StateStart
+    persistence: background writer of Boxes, used by the update_settings command
+    journal: append-only record of incoming messages, derived requests and FSM transitions (see journal.py)
+    _rule_index: dict sender name -> list of (position, Rule), position is the Rule order in rules.yaml. None means it has to be rebuilt
     boxes: dict of Item Boxes
+    config: Config shared by all Boxes, compiled configuration files (data path: WILDDOG_DATA or data/ of the project)
+    registry: dict wid -> list of Items, global index shared by all Boxes
+    aggregates: dict name -> GroupAggregate, every aggregate updates the WD status parameter with the same name
+    AGGREGATE_COMMANDS: aggregates whose changes are submitted as update_<name> requests (Rules can react to them)
     settings:
         - group_onoff: Group name for the Elements that can be turned on/off
         - group_door: Group name for the Elements that has to be considered like a door
@@ -35,6 +54,23 @@ class SystemWilddog(ItemSystem):
         - detection_threshold: How many detections has to be done to declare an intrusion (detection counter threshold)
         - timeout_detection: Defines the maximun time between detection before reset the detection counter
         - timeout_state: contains a dictionry describing the timeout for every State in FSM 
+        - queue_capacity: max number of requests waiting in rqt_buffer
+        - queue_policy: overflow policy of rqt_buffer (drop_oldest, drop_lowest, block)
+        - queue_priority: priority class (high, normal, low) for every command, not listed commands are normal
+        - queue_block_timeout: max time in seconds a producer can wait when queue_policy is block
+        - queue_coalesce: coalescing key (target, target_payload, sender) for every last-writer-wins command, see RqtQueue
+        - aggregates: dict name -> {group, feature, function}, values computed over a Group and stored in status[name].
+          If not defined, door/window/temperature are computed from group_xxx and feature_group_xxx.
+          door/window/temperature changes are submitted as update_<name> requests, other aggregates update status directly
+        - aggregate_sender: Item sending update_<name> requests of aggregates (TimerElement by default), a Rule must accept it
+        - metrics_enable: record latency histograms and counters
+        - metrics_file: path of the text exposition file (prometheus format) written every metrics_period seconds, null to disable
+        - metrics_period: period in seconds to write metrics_file
+        - save_debounce: seconds to wait before writing Boxes to save, Boxes saved several times in this window are written once
+        - journal_enable: record incoming messages, derived requests and FSM transitions in the journal
+        - journal_path: journal directory, null for journal/ in the configuration directory
+        - journal_segment_size: max bytes by journal segment file
+        - journal_segments: number of segment files kept, the oldest ones are deleted
     status:
         - state: current State name
         - time: local time
@@ -48,6 +84,7 @@ class SystemWilddog(ItemSystem):
         - last_time_detection: Defines the last time when a detection was occured
     """
 
+    AGGREGATE_COMMANDS = ("door", "window", "temperature")
     __instance = None
     __initialized = False
 
@@ -63,15 +100,24 @@ class SystemWilddog(ItemSystem):
         super().__init__()
 
         self.fsm = Fsm(self)
-        self.rqt_buffer = []
+        self.rqt_buffer = RqtQueue()
+        self.scheduler = Scheduler()
+        self.metrics = Metrics()
+        self.setup_timings = {}
+        self.persistence = Persistence()
+        self.journal = Journal()
+        self._rule_index = None
+        self.registry = {}
+        self.aggregates = {}
+        self.config = Config()
         
         self.boxes = {
-            "systems": Box("systems.yaml", [self.__class__]),
-            "timers": Box("timers.yaml", timer_classes),
-            "elements": Box("elements.yaml", element_classes),
-            "rules": Box("rules.yaml", rule_classes),
-            "nodes": Box("nodes.yaml", node_classes),
-            "groups": Box("groups.yaml", group_classes)
+            "systems": Box("systems.yaml", [self.__class__], self.registry, self.config),
+            "timers": Box("timers.yaml", timer_classes, self.registry, self.config),
+            "elements": Box("elements.yaml", element_classes, self.registry, self.config),
+            "rules": Box("rules.yaml", rule_classes, self.registry, self.config),
+            "nodes": Box("nodes.yaml", node_classes, self.registry, self.config),
+            "groups": Box("groups.yaml", group_classes, self.registry, self.config)
         }
 
         self.settings = self.settings | {
@@ -85,12 +131,38 @@ class SystemWilddog(ItemSystem):
             "feature_group_temperature" : None,
             "detection_threshold": None,
             "timeout_detection": None,
-            "timeout_state": {}            
+            "timeout_state": {},
+            "queue_capacity": 1000,
+            "queue_policy": "drop_oldest",
+            "queue_priority": {"detection_event": "high", "update_fsm": "high", "send_alert": "high", "timeout_fsm": "high"},
+            "queue_block_timeout": 1,
+            "queue_coalesce": {"update_time": "target", "update_timelight": "target", "update_temperature": "target", "update_door": "target", "update_window": "target", "set_status": "target_payload"},
+            "aggregates": None,
+            "aggregate_sender": "timer_device",
+            "metrics_enable": True,
+            "metrics_file": None,
+            "metrics_period": 60,
+            "save_debounce": 1.0,
+            "journal_enable": False,
+            "journal_path": None,
+            "journal_segment_size": 4 * 1024 * 1024,
+            "journal_segments": 8
         }
 
     def setup(self, wd):
         """ ... """
         super().setup(wd)
+        self.rqt_buffer.configure(
+            capacity = self.settings["queue_capacity"],
+            policy = self.settings["queue_policy"],
+            priorities = self.settings["queue_priority"],
+            block_timeout = self.settings["queue_block_timeout"],
+            coalesce = self.settings["queue_coalesce"]
+        )
+        self.metrics.enabled = self.settings["metrics_enable"]
+        self.persistence.debounce = self.settings["save_debounce"]
+        self.rqt_buffer.metrics = self.metrics
+        if self.settings["journal_enable"]: self.journal.open(self.settings["journal_path"] or self.config.get_path("journal"), self.settings["journal_segment_size"], self.settings["journal_segments"])
         self.update_status({
             "state": self.fsm.c_state.wid,
             "time": None,
@@ -104,34 +176,110 @@ class SystemWilddog(ItemSystem):
             "last_time_detection": None
         }) 
 
+    def start(self):
+        """ all Items are settled, aggregates can watch their menbers """
+        super().start()
+        aggregates = self.settings["aggregates"]
+        if aggregates == None: # legacy configuration
+            aggregates = {
+                "door": {"group": self.settings["group_door"], "feature": self.settings["feature_group_door"], "function": "all"},
+                "window": {"group": self.settings["group_window"], "feature": self.settings["feature_group_window"], "function": "all"},
+                "temperature": {"group": self.settings["group_temperature"], "feature": self.settings["feature_group_temperature"], "function": "avg"}
+            }
+        self.aggregates = {}
+        for iname, iaggregate in aggregates.items():
+            elements = [ielement for ielement in self.boxes["elements"].items if iaggregate["group"] in ielement.settings["group"]]
+            self.aggregates[iname] = GroupAggregate(iname, iaggregate["feature"], iaggregate["function"], self._update_aggregate)
+            self.aggregates[iname].attach(elements)
+        if self.settings["metrics_file"] != None: self.scheduler.call_every(self.settings["metrics_period"], self._write_metrics)
+        self.persistence.start()
+
+    def _write_metrics(self):
+        """ called by Scheduler every metrics_period """
+        try: self.metrics.write(self.settings["metrics_file"])
+        except OSError as error: print(f"\n>> INFO : metrics file could not be written ({error})")
+
+    def _update_aggregate(self, name, value):
+        """ called by aggregates when their result changes (any thread), built-in aggregates go through Rules and the request queue """
+        sender = self.get_item(wid = self.settings["aggregate_sender"])
+        if name in self.AGGREGATE_COMMANDS and sender.wid != None:
+            self.set_rqt(Rqt(sender = sender, target = self, command = f"update_{name}", msg = {"value": value}))
+        else: self.update_status({name: value})
+
     def set_rqt(self, rqt_in):
         """ it allows to submit a new request """
-        for irule in self.boxes["rules"].items:
+        time_start = perf_counter()
+        for irule in self.get_rules(rqt_in): # only Rules that can accept this sender are evaluated
             rqt_temp = irule.check(rqt_in)
-            if rqt_temp.validate(): self.rqt_buffer.append(rqt_temp)
+            if rqt_temp.validate():
+                self.journal.write("rqt", {"rule": irule.wid, "sender": rqt_temp.sender.wid, "target": rqt_temp.target.wid, "command": rqt_temp.command, "payload": rqt_temp.payload})
+                self.rqt_buffer.put(rqt_temp) # FSM is woken up if it is waiting for a request
+        self.metrics.observe("rules", rqt_in.sender.wid, perf_counter() - time_start)
+
+    def get_rules(self, rqt_in):
+        """ sendback the Rules whose sender is the request sender or one of its groups, keeping the order of rules.yaml """
+        rule_index = self._rule_index
+        if rule_index == None: rule_index = self.build_rule_index()
+        candidates = []
+        if rqt_in.sender.wid in rule_index: candidates.append(rule_index[rqt_in.sender.wid])
+        for igroup in rqt_in.sender.settings["group"]:
+            if igroup in rule_index: candidates.append(rule_index[igroup])
+        if len(candidates) == 0: return []
+        if len(candidates) == 1: return [irule for iposition, irule in candidates[0]]
+        return list(dict(merge(*candidates)).values()) # merge sorted lists by position, a Rule found twice is kept once
+
+    def build_rule_index(self):
+        """ it creates the dispatch index of Rules by sender name """
+        rule_index = {}
+        for iposition, irule in enumerate(self.boxes["rules"].items):
+            if irule.sender != None and irule.sender.wid != None:
+                rule_index.setdefault(irule.sender.wid, []).append((iposition, irule))
+        self._rule_index = rule_index
+        return rule_index
+
+    def reset_rule_index(self):
+        """ it forces to rebuild the Rules dispatch index, must be called when Rules or Groups change """
+        self._rule_index = None
 
     def get_rqt(self):
-        """ it allows FSM to get the last valid request in queeu """
-        rqt_temp = Rqt()
-        if len(self.rqt_buffer) > 0:
-            rqt_temp = self.rqt_buffer[0]
-            self.rqt_buffer.pop(0)
+        """ it allows FSM to get the next valid request in queue, highest priority first """
+        rqt_temp = self.rqt_buffer.get()
+        if rqt_temp == None: rqt_temp = NULL_RQT
         return rqt_temp
 
+    def wait_rqt(self, timeout = None):
+        """ it blocks the caller until a request is queued, timeout (seconds) expires or wake_rqt() is called """
+        self.rqt_buffer.wait(timeout)
+
+    async def wait_rqt_async(self, timeout = None):
+        """ coroutine version of wait_rqt(), used by the asyncio runtime """
+        await self.rqt_buffer.wait_async(timeout)
+
+    def wake_rqt(self):
+        """ it wakes up the FSM without request, used when something the FSM watches has changed (ex. node started) """
+        self.rqt_buffer.wake()
+
+    def subscribe(self, wid, feature, callback):
+        """ callback(item, feature, old_value, new_value) will be called every time feature of Item wid changes """
+        item = self.get_item(wid = wid)
+        item.watch(feature, callback)
+        return item
+
+    def unsubscribe(self, wid, feature, callback):
+        """ ... """
+        self.get_item(wid = wid).unwatch(feature, callback)
+
     def get_item(self, wid = None, box = None):
-        """ it allows to get a pointer to a specific Item """
-        item_temp = None
+        """ it allows to get a pointer to a specific Item, NULL_ITEM is sent back if it is not found """
         if wid == "wilddog": return self
-        if box in self.boxes: item_temp = self.boxes[box].get_item(wid)
-        else:
-            for iname, ibox in self.boxes.items():
-                item_temp = ibox.get_item(wid)
-                if item_temp.wid != None: break       
-        return item_temp
+        if box in self.boxes: return self.boxes[box].get_item(wid)
+        items = self.registry.get(wid)
+        if items: return items[0] # if several Boxes contain the same wid, the first Box loaded wins
+        return NULL_ITEM
 
     def execute_rqt(self, rqt_in):
         """ ... """
-        if not "value" in rqt_in.payload : rqt_in.payload["value"] = None
+        value = rqt_in.payload.get("value") # payload is read-only, "value" is None if not defined
         
         if super().execute_rqt(rqt_in): return
 
@@ -139,52 +287,67 @@ class SystemWilddog(ItemSystem):
             self.fsm.fsm_timeout_rqt = True
 
         elif rqt_in.command == "timeout_detection": # request reset detection counter if timeout last detection
-            self.update_status({"detection_counter": rqt_in.payload["value"]})
+            self.update_status({"detection_counter": value})
         
         elif rqt_in.command == "update_fsm": # request FSM transition
             self.fsm.fsm_transition_rqt = rqt_in.payload["state"]
 
         elif rqt_in.command == "update_time": 
-            self.update_status({"time": rqt_in.payload["value"].strftime("%H:%M:%S"), "date": rqt_in.payload["value"].strftime("%d/%m/%y")})
+            self.update_status({"time": value.strftime("%H:%M:%S"), "date": value.strftime("%d/%m/%y")})
 
         elif rqt_in.command == "update_timelight": 
-            self.update_status({"timelight":rqt_in.payload["value"]})
+            self.update_status({"timelight":value})
         
         elif rqt_in.command == "update_door": 
-            self.update_status({"door":rqt_in.payload["value"]})
+            self.update_status({"door":value})
 
         elif rqt_in.command == "update_window":
-            self.update_status({"window":rqt_in.payload["value"]})
+            self.update_status({"window":value})
 
         elif rqt_in.command == "update_temperature":
-            self.update_status({"temperature":rqt_in.payload["value"]})
+            self.update_status({"temperature":value})
 
-        elif rqt_in.command == "update_settings": # request to save configuration Items, for a single Box or all
-            if rqt_in.payload["value"] in self.boxes:
-                self.boxes[rqt_in.payload["value"]].save_items()
+        elif rqt_in.command == "update_settings": # request to save configuration Items, for a single Box or all. Files are written in background, only if settings changed
+            if value in self.boxes:
+                self.persistence.save(self.boxes[value])
             else:
-                for iname, ibox in self.boxes.items(): ibox.save_items()
+                for iname, ibox in self.boxes.items(): self.persistence.save(ibox)
 
         elif rqt_in.command == "detection_event" and rqt_in.sender.settings["detection_enable"]: # declare a detection, only Element wich a detection_enable True will be considered
-            detection_counter = self.status["detection_counter"] + rqt_in.payload["value"]
+            detection_counter = self.status["detection_counter"] + value
             if detection_counter >= self.settings["detection_threshold"]:
                 self.fsm.fsm_transition_rqt = "detection"
                 self.update_status({"detection_counter": 0, "last_time_detection": datetime.now()})
             else: self.update_status({"detection_counter": detection_counter, "last_time_detection": datetime.now()})
 
         elif rqt_in.command == "get_list": # get back a list of all Item names
-            if rqt_in.payload["value"] in self.boxes:
-                msg_temp = [ item.wid for item in self.wd.boxes[rqt_in.payload["value"]].items] 
+            if value in self.boxes:
+                msg_temp = [ item.wid for item in self.wd.boxes[value].items] 
                 rqt_in.sender.handle_out(msg_temp)
             else: return
 
+        elif rqt_in.command == "get_queue": # get back depth and counters of request queue
+            rqt_in.sender.handle_out(self.rqt_buffer.get_stats())
+
+        elif rqt_in.command == "get_scheduler": # get back counters and lateness of scheduler
+            rqt_in.sender.handle_out(self.scheduler.get_stats())
+
+        elif rqt_in.command == "get_metrics": # get back latency by stage, or by label of the stage given in value
+            rqt_in.sender.handle_out(self.metrics.get_summary(value))
+
+        elif rqt_in.command == "get_persistence": # get back counters of the background writer of Boxes
+            rqt_in.sender.handle_out(self.persistence.get_stats())
+
+        elif rqt_in.command == "get_journal": # get back counters and directory of the journal
+            rqt_in.sender.handle_out(self.journal.get_stats())
+
         # -- DEBUG --
         elif rqt_in.command == "command_test":
             print("\n>> COMMAND TEST WILDDOG :) ")
-            if rqt_in.payload["value"] == 1:
+            if value == 1:
                 print(f"STATUS WILDDOG: {self.status}")
                 print(f"SETTINGS WILDDOG: {self.settings}")
-            elif rqt_in.payload["value"] == 2:
+            elif value == 2:
                 print("Value 2 has been sent")
-            elif rqt_in.payload["value"] == 3:
+            elif value == 3:
                 print("Value 3 has been sent")
\ No newline at end of file
@@ -1,4 +1,6 @@
 from datetime import datetime
+from functools import partial
+from threading import Lock
 
 from .items import ItemTimer
 from .tools import Rqt
@@ -13,73 +15,88 @@ This file cotains all the implementation classes of Timers
 #----------------------------------------------------------------------------------------------
 class TimerElement(ItemTimer):
     """
-    TimerElemet implements a Timer allowing to watch some Elements and get status information for WD.
+    TimerElemet implements a Timer allowing to turn off Elements of group_onoff after a timeout. Every Element
+    has its own deadline in WD Scheduler, armed again each time Element is turned on or used, so the OFF request
+    is sent when the deadline expires without scanning all Elements periodically (period is not used).
+    Door, window and temperature status of WD are aggregates updated by WD itself (see SystemWilddog.aggregates)
     
     feature_onoff: defines the parameter to control group_onoff - turn off Elements with timeout
-    feature_door: defines the parameter to watch group_door - Determinate if doors are opened
-    feature_window: defines the parameter to watch group_windows - Determinate if all windows are closed
-    feature_temperature: defines the parameter to watch group_temperature - Determinate average temperature
-    rqt_out : contains all request to submit to WD
+    elements: Elements of group_onoff watched by Timer
+    _deadlines: dict Element wid -> Scheduler handle of its timeout
     """
-    def check(self):
-        """ Timer routine """
-        now = datetime.now()
-        rqt_out = []
+    def __init__(self):
+        """ ... """
+        super().__init__()
+        self.feature_onoff = None
+        self.elements = []
+        self._deadlines = {}
+        self._lock = Lock()
+
+    def start(self):
+        """ watch Elements of group_onoff and arm the deadlines of those already ON """
+        self.feature_onoff = self.wd.settings["feature_group_onoff"]
+        self.elements = [ielement for ielement in self.wd.boxes["elements"].items if self.wd.settings["group_onoff"] in ielement.settings["group"]]
+        for ielement in self.elements:
+            for ifeature in (self.feature_onoff, "last_time_on", "last_time_interaction"): ielement.watch(ifeature, self._on_change)
+            self.arm(ielement)
+
+    def stop(self):
+        """ stop watching Elements and cancel all deadlines """
+        for ielement in self.elements:
+            for ifeature in (self.feature_onoff, "last_time_on", "last_time_interaction"): ielement.unwatch(ifeature, self._on_change)
+        with self._lock:
+            for ihandle in self._deadlines.values(): ihandle.cancel()
+            self._deadlines = {}
+        self.elements = []
 
-        feature_onoff = self.wd.settings["feature_group_onoff"]
-        feature_door = self.wd.settings["feature_group_door"]
-        feature_window = self.wd.settings["feature_group_window"]
-        feature_temperature = self.wd.settings["feature_group_temperature"]
-
-        result_door = True
-        result_window = True
-        result_temperature = []
-
-        for ielement in self.wd.boxes["elements"].items:
-            # TIMEOUT 
-            if self.wd.settings["group_onoff"] in ielement.settings["group"] and feature_onoff in ielement.status : 
-                if ielement.status["onoff"] == "ON" and ielement.settings["timeout_enable"]:
-                    try:
-                        delta_time_1 = (now - ielement.status["last_time_on"]).total_seconds() # time Element being ON
-                        delta_time_2 = (now - ielement.status["last_time_interaction"]).total_seconds() # time Element being unused
-                    except:
-                        delta_time_1 = 0
-                        delta_time_2 = 0
-                    if delta_time_1 > ielement.settings["timeout_value"] and delta_time_2 > ielement.settings["timeout_value"]:
-                        rqt_out.append(Rqt(sender = self, target = ielement, command = "set_status", msg = {"onoff": "OFF"}))
-                elif ielement.status["onoff"] == "OFF" and ielement.settings["timeout_enable"] != True and ielement.settings["timeout_value"] != None:
-                    rqt_out.append(Rqt(sender = self, target = ielement, command = "set_settings", msg = {"timeout_enable": True}))
-
-            # DOOR
-            if self.wd.settings["group_door"] in ielement.settings["group"] and feature_door in ielement.status:
-                if ielement.status[feature_door] != None: result_door = result_door and ielement.status[feature_door]
-                else: result_door = False
-
-            # WINDOW
-            if self.wd.settings["group_window"] in ielement.settings["group"] and feature_window in ielement.status:
-                if ielement.status[feature_window] != None: result_window = result_window and ielement.status[feature_window]
-                else: result_window = False
-
-            # TEMPERATURE
-            if self.wd.settings["group_temperature"] in ielement.settings["group"] and feature_temperature in ielement.status:
-                if ielement.status[feature_temperature] != None: result_temperature.append(float(ielement.status[feature_temperature]))
-                else: pass
-
-        if len(result_temperature) > 0 : result_temperature = sum(result_temperature) / len(result_temperature)
-        else: result_temperature = 0
-
-        if self.wd.status["door"] != result_door: rqt_out.append(Rqt(sender = self, target = self.wd, command = "update_door", msg = {"value": result_door}))
-        if self.wd.status["window"] != result_window: rqt_out.append(Rqt(sender = self, target = self.wd, command = "update_window", msg = {"value": result_window}))
-        if self.wd.status["temperature"] != result_temperature: rqt_out.append(Rqt(sender = self, target = self.wd, command = "update_temperature", msg = {"value": result_temperature}))
-
-        for irqt in rqt_out: self.wd.set_rqt(irqt)
+    def check(self):
+        """ arm again the deadlines of all Elements (deadlines are normally armed by Elements changes) """
+        for ielement in self.elements: self.arm(ielement)
+
+    def arm(self, element, delay = None):
+        """ (re)arm the deadline of Element, in delay seconds or at the end of its timeout. Element OFF is disarmed """
+        with self._lock: self._arm(element, delay)
+
+    def _arm(self, element, delay = None):
+        """ ..., lock must be held """
+        handle = self._deadlines.pop(element.wid, None)
+        if handle != None: handle.cancel()
+        if not self.settings["enable"] or element.status.get(self.feature_onoff) != "ON" or element.settings["timeout_value"] == None: return
+        if delay == None: delay = self._get_remaining(element, datetime.now())
+        self._deadlines[element.wid] = self.wd.scheduler.call_later(max(0, delay), partial(self._on_deadline, element))
+
+    def _on_change(self, element, feature, old_value, new_value):
+        """ called by Element when it is turned on/off or used """
+        self.arm(element)
+        if feature == self.feature_onoff and new_value == "OFF" and element.settings["timeout_enable"] != True and element.settings["timeout_value"] != None:
+            self.wd.set_rqt(Rqt(sender = self, target = element, command = "set_settings", msg = {"timeout_enable": True}))
+
+    def _on_deadline(self, element):
+        """ called by Scheduler when the timeout of Element expires """
+        with self._lock:
+            self._deadlines.pop(element.wid, None)
+            if not self.settings["enable"] or element.status.get(self.feature_onoff) != "ON": return
+            remaining = self._get_remaining(element, datetime.now())
+            if not element.settings["timeout_enable"]: return self._arm(element, element.settings["timeout_value"]) # disabled for now, checked again later
+            if remaining > 0: return self._arm(element, remaining)
+        self.wd.set_rqt(Rqt(sender = self, target = element, command = "set_status", msg = {"onoff": "OFF"}))
+
+    def _get_remaining(self, element, now):
+        """ seconds before timeout, Element must be ON and unused (last_time_on and last_time_interaction) """
+        try:
+            delta_time_1 = (now - element.status["last_time_on"]).total_seconds() # time Element being ON
+            delta_time_2 = (now - element.status["last_time_interaction"]).total_seconds() # time Element being unused
+        except:
+            delta_time_1 = 0
+            delta_time_2 = 0
+        return element.settings["timeout_value"] - min(delta_time_1, delta_time_2)
 
 
 #----------------------------------------------------------------------------------------------
 class TimerSystem(ItemTimer):      
     """
-    TimerSystem implements the Timer responsible to control and update internal clock in WD, FSM
-    timeout transitions, reset detection counter
+    TimerSystem implements the Timer responsible to control and update internal clock in WD and reset
+    detection counter. FSM timeout transitions are handled by the FSM itself (see Fsm.get_timeout)
 
     c_state: current State name
     rqt_out: contains all request to submit to WD
@@ -107,11 +124,4 @@ class TimerSystem(ItemTimer):
             except: delta_time = 0
             if delta_time > timeout_detection: rqt_out.append(Rqt(sender = self, command = "timeout_detection", msg = {"value": 0}))
 
-        # TIMEOUT FSM
-        timeout_state = self.wd.settings["timeout_state"][c_state]
-        if timeout_state != None:
-            try: delta_time = (now - self.wd.status["last_time_update_fsm"]).total_seconds()
-            except: delta_time = 0
-            if delta_time > timeout_state: rqt_out.append(Rqt(sender = self, target = self.wd, command = "timeout_fsm", msg = {"value": delta_time}))
-
         for irqt in rqt_out: self.wd.set_rqt(irqt)
\ No newline at end of file
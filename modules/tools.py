@@ -1,4 +1,7 @@
-from .containers import Item
+from time import perf_counter
+from types import MappingProxyType
+
+from .containers import NULL_ITEM
 
 
 """
@@ -10,23 +13,44 @@ This file contains the Rqt class and others functions
 #----------------------------------------------------------------------------------------------
 class Rqt():
     """ 
-    Rqt class contains all the information needed to execute a request. 
+    Rqt class contains all the information needed to execute a request. Rqt is immutable, dicts are stored
+    as read-only mappings, so the same Rqt (and its msg) can be shared by every Rule and Item. derive() creates
+    a new Rqt changing some attributes (target, command, payload...) without copying the others
     
     sender : defines the creator Item
     target : defines the executor target Item
     command : defines the task to be executed
     payload : contains additional information to perform the command
     msg : contains the original message comming from the sender
+    delta : dict feature -> (old value, new value), sender status parameters changed by msg
     
     """
 
-    def __init__(self, sender = Item(), target = Item(), command = None, payload = {}, msg = {}):
+    __slots__ = ("sender", "target", "command", "payload", "msg", "delta")
+
+    def __init__(self, sender = NULL_ITEM, target = NULL_ITEM, command = None, payload = {}, msg = {}, delta = {}):
         """ ... """
-        self.sender = sender
-        self.target = target
-        self.command = command
-        self.payload = payload
-        self.msg = msg
+        object.__setattr__(self, "sender", sender)
+        object.__setattr__(self, "target", target)
+        object.__setattr__(self, "command", command)
+        object.__setattr__(self, "payload", read_only(payload))
+        object.__setattr__(self, "msg", read_only(msg))
+        object.__setattr__(self, "delta", read_only(delta))
+
+    def __setattr__(self, name, value):
+        """ ... """
+        raise AttributeError(f"Rqt is immutable, use derive() to change {name}")
+
+    def derive(self, **changes):
+        """ sendback a new Rqt with the attributes in changes, the others are shared with this Rqt """
+        return Rqt(
+            sender = changes.get("sender", self.sender),
+            target = changes.get("target", self.target),
+            command = changes.get("command", self.command),
+            payload = changes.get("payload", self.payload),
+            msg = changes.get("msg", self.msg),
+            delta = changes.get("delta", self.delta)
+        )
 
     def show(self):
         """ show up the content of request """
@@ -34,14 +58,16 @@ class Rqt():
         \nSENDER : {self.sender.wid} \
         \nTARGET : {self.target.wid} \
         \nCOMMAND : {self.command} \
-        \nPAYLOAD : {self.payload} \
-        \nMSG : {self.msg}")
+        \nPAYLOAD : {dict(self.payload) if type(self.payload) is MappingProxyType else self.payload} \
+        \nMSG : {dict(self.msg) if type(self.msg) is MappingProxyType else self.msg}")
 
     def execute(self):
         """ launch the request execution """
         if self.validate():
             if self.sender.wid != "timer_system": self.show()
+            time_start = perf_counter()
             self.target.execute_rqt(self)
+            if self.target.wd != None: self.target.wd.metrics.observe("execute", self.command, perf_counter() - time_start)
         
     def validate(self):
         """ verify that content in request is valid """
@@ -51,4 +77,14 @@ class Rqt():
             elif self.command == None: return False
             else: return True
         except:
-            return False
\ No newline at end of file
+            return False
+
+
+#----------------------------------------------------------------------------------------------
+def read_only(value):
+    """ dicts are sent back as read-only mappings (views of dict), other values are sent back as they are """
+    if type(value) is dict: return MappingProxyType(value)
+    return value
+
+
+NULL_RQT = Rqt() # invalid Rqt, sent back when there is nothing to do (ex. Rule not validated)